@@ -21,7 +21,11 @@ from PyQt5.QtWidgets import QRadioButton, QButtonGroup, QSpinBox
 import re
 import csv
 import docx2txt
-from nltk.tokenize import sent_tokenize, word_tokenize
+from nltk.tokenize import sent_tokenize
+from model_registry import segment_token_budget
+from segmentation import iter_segments
+from token_counting import get_token_counter
+from run_store import DONE as RUN_DONE, FAILED as RUN_FAILED, RunStore, content_id, default_run_store_path
 
 class QualiGPTApp(QMainWindow):
 
@@ -36,6 +40,7 @@ class QualiGPTApp(QMainWindow):
         self.dataset_segments = []
         self.saved_segments = []
         self.all_responses = [] # Used to store all responses
+        self.run_store = RunStore(default_run_store_path()) # Checkpoints of segment responses
 
         # Initialize prompts dictionary
         self.prompts = {
@@ -339,6 +344,10 @@ class QualiGPTApp(QMainWindow):
         # Combine the dataset and the prompt into a single message
         #combined_message = self.data_content + "\n\n" + prompt
         if len(self.dataset_segments) > 1:
+            # Re-running the same dataset and prompt resumes this run: segments whose
+            # response was checkpointed are not sent to the API again
+            run_id = content_id(prompt, *self.saved_segments)
+            self.run_store.create_run({"source": "desktop", "segments": len(self.saved_segments)}, run_id)
             
             for segment in self.saved_segments:
             # Construct the full prompt for this segment
@@ -347,11 +356,15 @@ class QualiGPTApp(QMainWindow):
                 self.display_prompt(combined_message)
                 # Send the segment to the API
                 try:
-                    response = openai.ChatCompletion.create(model="gpt-3.5-turbo", messages=[
-                        {"role": "system", "content": "You are a helpful assistant."},
-                        {"role": "user", "content": combined_message}
-                    ])
-                    response_content = response['choices'][0]['message']['content']
+                    checkpoint = content_id(combined_message)
+                    response_content = self.run_store.get_output(run_id, checkpoint)
+                    if response_content is None:
+                        response = openai.ChatCompletion.create(model="gpt-3.5-turbo", messages=[
+                            {"role": "system", "content": "You are a helpful assistant."},
+                            {"role": "user", "content": combined_message}
+                        ])
+                        response_content = response['choices'][0]['message']['content']
+                        self.run_store.save_output(run_id, checkpoint, response_content)
                     self.all_responses.append(response_content) # save the response
                     
                     # Check if the response is close to the token limit
@@ -367,6 +380,8 @@ class QualiGPTApp(QMainWindow):
                     print(f"Other Error: {str(e)}")
                     QMessageBox.critical(self, "Error", f"Failed to call ChatGPT API. Other Error: {str(e)}")
             # After processing all segments, merge the responses and analyze again
+            completed = self.run_store.get_run(run_id)["completed_calls"]
+            self.run_store.finish_run(run_id, RUN_DONE if completed >= len(self.saved_segments) else RUN_FAILED)
             merged_responses = "\n".join(self.all_responses)
             self.analyze_merged_responses(merged_responses)
         else:
@@ -444,14 +459,15 @@ class QualiGPTApp(QMainWindow):
         print("Data Content:", self.data_content[:500])  # Print the first 500 characters of the dataset for debugging
         print("Number of Segments:", len(self.dataset_segments))
 
-         # 如果数据内容超过4096 tokens
-        if len(self.data_content) > 4096:
-            self.dataset_segments = self.split_into_segments(self.data_content, 4096 - 1500)  # Reserve some tokens for additional prompts
+        budget = self.segment_budget()
+         # 如果数据内容超过模型的上下文预算
+        if get_token_counter("openai", "gpt-3.5-turbo").count(self.data_content) > budget:
+            self.dataset_segments = self.split_into_segments(self.data_content, budget)
             # 不要在这里提交分段，只是保存它们
             self.saved_segments = self.dataset_segments
             QMessageBox.information(self, "Success", "Dataset has been segmented and is ready for analysis.")
         else:
-            # 如果数据内容不超过4096 tokens
+            # 如果数据内容不超过模型的上下文预算
             self.saved_segments = [self.data_content]
 
             QMessageBox.information(self, "Success", "Dataset has been segmented and is ready for analysis.")
@@ -565,7 +581,7 @@ class QualiGPTApp(QMainWindow):
     
     def send_segments_to_chatgpt(self, data_content, prompt):
         # Split the data_content into segments
-        segments = self.split_into_segments(data_content, 4096 - 1500)  # Reserve some tokens for additional prompts
+        segments = self.split_into_segments(data_content, self.segment_budget(prompt))
     
         # Initialize a list to store responses
         responses = []
@@ -602,26 +618,16 @@ class QualiGPTApp(QMainWindow):
         combined_response = "\n".join(responses)
         return combined_response
 
-    def split_into_segments(self, text, max_tokens = 3800):
-        sentences = sent_tokenize(text)
-        segments = []
-        segment = ""
-        segment_tokens = 0
-
-        for sentence in sentences:
-            num_tokens = len(word_tokenize(sentence))
-            if segment_tokens + num_tokens > max_tokens:
-                segments.append(segment.strip())
-                segment = sentence
-                segment_tokens = num_tokens
-            else:
-                segment += " " + sentence
-                segment_tokens += num_tokens
+    def segment_budget(self, prompt=None):
+        # Tokens of data per gpt-3.5-turbo call after the system message, the prompt and the reply
+        if prompt is None:
+            prompt = self.custom_prompt_entry.text().strip() or self.preset_prompts.currentText()
+        return segment_token_budget("openai", "gpt-3.5-turbo", "You are a helpful assistant.", prompt, 4096)
 
-        if segment:
-            segments.append(segment.strip())
-
-        return segments
+    def split_into_segments(self, text, max_tokens = 3800):
+        # The desktop app always talks to gpt-3.5-turbo, so count with its tokenizer
+        token_counter = get_token_counter("openai", "gpt-3.5-turbo")
+        return list(iter_segments(text, max_tokens, token_counter))
 
 def main():
     app = QApplication(sys.argv)
@@ -0,0 +1,75 @@
+"""async_engine.py
+
+A background asyncio event loop on which the web app makes its provider calls with
+the providers' async clients (`llm_providers.AsyncBaseProvider`).
+
+Job-queue threads hand their segment and merge calls to the loop and wait for the
+results, so the number of calls in flight is bounded by budgets (per-job provider
+concurrency, `QUALIGPT_MAX_ASYNC_INFLIGHT_CALLS`) rather than by threads: one
+process multiplexes hundreds of concurrent calls over a single loop thread and the
+providers' pooled connections.
+
+* `AsyncEngine.run(coro)` – run ``coro`` on the loop from another thread and return
+  its result.  The caller's context variables (e.g. the instrumentation stage) are
+  carried over to the coroutine.
+* `AsyncEngine.semaphore(name, limit)` – a semaphore bound to the loop, shared by
+  every coroutine that asks for ``name``.
+* `get_engine()` – the process-wide engine, started on first use.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+from typing import Any, Awaitable, Dict, Optional
+
+
+class AsyncEngine:
+    """An event loop running forever on a daemon thread."""
+
+    def __init__(self, name: str = "qualigpt-async"):
+        self.loop = asyncio.new_event_loop()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run ``coro`` on the engine loop and block until it finishes."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("AsyncEngine.run() would block its own event loop; await the coroutine instead")
+        context = contextvars.copy_context()
+
+        async def _with_caller_context():
+            for var, value in context.items():
+                var.set(value)
+            return await coro
+
+        return asyncio.run_coroutine_threadsafe(_with_caller_context(), self.loop).result(timeout)
+
+    def semaphore(self, name: str, limit: int) -> asyncio.Semaphore:
+        """Return the loop's semaphore ``name`` (only call from coroutines running on the loop)."""
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = self._semaphores[name] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+_engine: Optional[AsyncEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine()
+        return _engine
@@ -0,0 +1,416 @@
+"""batch_stub_server.py
+
+Local stand-in for the OpenAI and Anthropic APIs, so batch mode can be exercised
+end to end with the real SDKs and without network access or cost.  Answers are the
+deterministic theme tables of the offline ``fake`` provider.
+
+Endpoints (all in memory):
+
+* OpenAI    – ``POST /v1/files``, ``GET /v1/files/{id}/content``, ``POST /v1/batches``,
+  ``GET /v1/batches/{id}``, ``POST /v1/batches/{id}/cancel`` and
+  ``POST /v1/chat/completions`` (plain and streamed)
+* Anthropic – ``POST /v1/messages/batches``, ``GET /v1/messages/batches/{id}``,
+  ``GET /v1/messages/batches/{id}/results``, ``POST /v1/messages/batches/{id}/cancel``
+  and ``POST /v1/messages`` (plain and streamed)
+
+A batch is ``in_progress`` for ``--delay`` seconds after it was created; each of its
+requests then fails with probability ``--failure-rate``.
+
+Prompt caching is simulated: a prefix of at least 1,024 tokens (the system message
+for OpenAI, the text up to the last ``cache_control`` block for Anthropic) is
+reported as cached input from its second use on.
+
+Usage (from the repository root):
+
+    python benchmarks/batch_stub_server.py --port 8765 --delay 5
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ANTHROPIC_BASE_URL=http://127.0.0.1:8765 \\
+        QUALIGPT_BATCH_POLL_SECONDS=1 python qualigpt-webapp.py
+
+and send /analyze requests with ``"batch_mode": true`` and any API key.
+"""
+from __future__ import annotations
+
+import argparse
+import email.parser
+import email.policy
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llm_providers import FakeProvider  # noqa: E402
+
+_tables = FakeProvider("stub")
+
+
+def _answer(system_message: str, user_message: str) -> str:
+    return "".join(line + "\n" for line in _tables.table_lines(system_message, user_message))
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+MIN_CACHED_PREFIX_TOKENS = 1024
+_cached_prefixes = set()
+_cached_prefixes_lock = threading.Lock()
+
+
+def _prefix_cached(prefix: str) -> bool:
+    """Whether ``prefix`` is served from the prompt cache (and cache it for next time)."""
+    if _tokens(prefix) < MIN_CACHED_PREFIX_TOKENS:
+        return False
+    with _cached_prefixes_lock:
+        if prefix in _cached_prefixes:
+            return True
+        _cached_prefixes.add(prefix)
+        return False
+
+
+def _completion(body: dict) -> dict:
+    """An OpenAI chat completion object for a /v1/chat/completions request body."""
+    messages = body.get("messages", [])
+    system = "".join(m["content"] for m in messages if m["role"] == "system")
+    user = "".join(m["content"] for m in messages if m["role"] == "user")
+    text = _answer(system, user)
+    # OpenAI caches the longest previously seen prefix in 128-token steps
+    cached = _tokens(system) // 128 * 128 if _prefix_cached(system) else 0
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": _tokens(system + user),
+            "completion_tokens": _tokens(text),
+            "total_tokens": _tokens(system + user) + _tokens(text),
+            "prompt_tokens_details": {"cached_tokens": cached},
+        },
+    }
+
+
+def _message(params: dict) -> dict:
+    """An Anthropic message object for a /v1/messages request body."""
+    system = params.get("system") or ""
+    blocks = [{"type": "text", "text": system}] if isinstance(system, str) else list(system)
+    system = "".join(block.get("text", "") for block in blocks)
+    for m in params.get("messages", []):
+        blocks += [{"type": "text", "text": m["content"]}] if isinstance(m["content"], str) else m["content"]
+    user = "".join(block.get("text", "") for block in blocks)[len(system):]
+    text = _answer(system, user)
+
+    # Cache reads and writes cover the blocks up to the last cache_control breakpoint
+    marked = [i for i, block in enumerate(blocks) if block.get("cache_control")]
+    prefix = "".join(block.get("text", "") for block in blocks[:marked[-1] + 1]) if marked else ""
+    cache_read = cache_write = 0
+    if prefix and _tokens(prefix) >= MIN_CACHED_PREFIX_TOKENS:
+        if _prefix_cached(prefix):
+            cache_read = _tokens(prefix)
+        else:
+            cache_write = _tokens(prefix)
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "claude-3-5-sonnet-20241022"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": _tokens(system + user) - cache_read - cache_write,
+            "output_tokens": _tokens(text),
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+        },
+    }
+
+
+class StubState:
+    def __init__(self, delay: float, failure_rate: float, seed: int):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.files = {}  # id -> (filename, purpose, bytes)
+        self.openai_batches = {}
+        self.anthropic_batches = {}
+        self.lock = threading.Lock()
+
+    def failed(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.failure_rate
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.files[file_id] = (filename, purpose, content)
+        return {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed",
+        }
+
+    # --- OpenAI batches ---------------------------------------------------
+
+    def openai_batch(self, batch_id: str) -> dict:
+        with self.lock:
+            batch = self.openai_batches[batch_id]
+        if batch["status"] == "in_progress" and time.time() >= batch["created_at"] + self.delay:
+            self._complete_openai_batch(batch)
+        return batch
+
+    def _complete_openai_batch(self, batch: dict) -> None:
+        _, _, content = self.files[batch["input_file_id"]]
+        outputs, errors = [], []
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            entry = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": request["custom_id"]}
+            if self.failed():
+                entry["response"] = {"status_code": 500, "request_id": uuid.uuid4().hex, "body": {"error": {"message": "Injected failure"}}}
+                entry["error"] = None
+                errors.append(json.dumps(entry))
+            else:
+                entry["response"] = {"status_code": 200, "request_id": uuid.uuid4().hex, "body": _completion(request["body"])}
+                entry["error"] = None
+                outputs.append(json.dumps(entry))
+        batch["output_file_id"] = self.add_file("output.jsonl", "batch_output", "\n".join(outputs).encode("utf-8"))["id"]
+        if errors:
+            batch["error_file_id"] = self.add_file("errors.jsonl", "batch_output", "\n".join(errors).encode("utf-8"))["id"]
+        batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    # --- Anthropic batches ------------------------------------------------
+
+    def anthropic_batch(self, batch_id: str) -> dict:
+        with self.lock:
+            batch = self.anthropic_batches[batch_id]
+        if batch["processing_status"] == "in_progress" and time.time() >= batch["_created"] + self.delay:
+            self._complete_anthropic_batch(batch)
+        return batch
+
+    def _complete_anthropic_batch(self, batch: dict) -> None:
+        results = []
+        counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        for request in batch["_requests"]:
+            if batch.get("cancel_initiated_at"):
+                result = {"type": "canceled"}
+            elif self.failed():
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "Injected failure"}}}
+            else:
+                result = {"type": "succeeded", "message": _message(request["params"])}
+            counts[result["type"]] += 1
+            results.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+        batch["_results"] = "\n".join(results).encode("utf-8")
+        batch["request_counts"] = counts
+        batch["processing_status"] = "ended"
+        batch["ended_at"] = _iso(time.time())
+
+
+def _iso(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState
+
+    def log_message(self, format, *args):  # noqa: A002 - quiet by default
+        pass
+
+    # --- Plumbing ---------------------------------------------------------
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send(self, payload, status: int = 200, content_type: str = "application/json") -> None:
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self) -> None:
+        self._send({"error": {"type": "not_found_error", "message": f"No route for {self.path}"}}, 404)
+
+    def _stream(self, events) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        for event, data in events:
+            chunk = (f"event: {event}\n" if event else "") + f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+            self.wfile.write(chunk.encode("utf-8"))
+            self.wfile.flush()
+        self.close_connection = True
+
+    def _base_url(self) -> str:
+        return f"http://{self.headers.get('Host', '%s:%d' % self.server.server_address[:2])}"
+
+    # --- Routes -----------------------------------------------------------
+
+    def do_GET(self):  # noqa: N802
+        path = self.path.split("?")[0]
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", path)
+        if match and match.group(1) in self.state.files:
+            return self._send(self.state.files[match.group(1)][2], content_type="application/octet-stream")
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", path)
+        if match and match.group(1) in self.state.openai_batches:
+            return self._send(self.state.openai_batch(match.group(1)))
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+        if match and match.group(1) in self.state.anthropic_batches:
+            batch = self.state.anthropic_batch(match.group(1))
+            if match.group(2):
+                if batch["processing_status"] != "ended":
+                    return self._send({"type": "error", "error": {"type": "invalid_request_error", "message": "Batch has not ended"}}, 400)
+                return self._send(batch["_results"], content_type="application/x-jsonl")
+            return self._send(self._public_anthropic_batch(batch))
+        self._not_found()
+
+    def do_POST(self):  # noqa: N802
+        path = self.path.split("?")[0]
+        if path == "/v1/files":
+            return self._upload_file()
+        if path == "/v1/batches":
+            return self._create_openai_batch(json.loads(self._body()))
+        match = re.fullmatch(r"/v1/batches/([\w-]+)/cancel", path)
+        if match and match.group(1) in self.state.openai_batches:
+            self._body()
+            batch = self.state.openai_batch(match.group(1))
+            if batch["status"] == "in_progress":
+                batch["status"] = "cancelled"
+            return self._send(batch)
+        if path == "/v1/messages/batches":
+            return self._create_anthropic_batch(json.loads(self._body()))
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)/cancel", path)
+        if match and match.group(1) in self.state.anthropic_batches:
+            self._body()
+            batch = self.state.anthropic_batches[match.group(1)]
+            batch["cancel_initiated_at"] = _iso(time.time())
+            return self._send(self._public_anthropic_batch(self.state.anthropic_batch(match.group(1))))
+        if path == "/v1/chat/completions":
+            return self._chat_completion(json.loads(self._body()))
+        if path == "/v1/messages":
+            return self._anthropic_message(json.loads(self._body()))
+        self._body()
+        self._not_found()
+
+    def _upload_file(self) -> None:
+        # multipart/form-data with a ``purpose`` field and a ``file`` part
+        head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+        form = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(head + self._body())
+        purpose, filename, content = "batch", "upload.jsonl", b""
+        for part in form.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "purpose":
+                purpose = part.get_content().strip() if part.get_content_maintype() == "text" else part.get_payload(decode=True).decode()
+            elif name == "file":
+                filename = part.get_filename() or filename
+                content = part.get_payload(decode=True)
+        self._send(self.state.add_file(filename, purpose, content))
+
+    def _create_openai_batch(self, body: dict) -> None:
+        if body.get("input_file_id") not in self.state.files:
+            return self._send({"error": {"message": "Unknown input file"}}, 400)
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"), "errors": None,
+            "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress", "output_file_id": None, "error_file_id": None,
+            "created_at": int(time.time()), "completed_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}, "metadata": body.get("metadata"),
+        }
+        with self.state.lock:
+            self.state.openai_batches[batch_id] = batch
+        self._send(batch)
+
+    def _create_anthropic_batch(self, body: dict) -> None:
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        now = time.time()
+        batch = {
+            "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+            "request_counts": {"processing": len(body["requests"]), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": _iso(now), "expires_at": _iso(now + 24 * 3600), "ended_at": None,
+            "cancel_initiated_at": None, "archived_at": None,
+            "results_url": f"{self._base_url()}/v1/messages/batches/{batch_id}/results",
+            "_created": now, "_requests": body["requests"],
+        }
+        with self.state.lock:
+            self.state.anthropic_batches[batch_id] = batch
+        self._send(self._public_anthropic_batch(batch))
+
+    @staticmethod
+    def _public_anthropic_batch(batch: dict) -> dict:
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    def _chat_completion(self, body: dict) -> None:
+        completion = _completion(body)
+        if not body.get("stream"):
+            return self._send(completion)
+        text = completion["choices"][0]["message"]["content"]
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+        events = [
+            (None, {**base, "choices": [{"index": 0, "delta": {"content": line}, "finish_reason": None}]})
+            for line in text.splitlines(keepends=True)
+        ]
+        events.append((None, {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            events.append((None, {**base, "choices": [], "usage": completion["usage"]}))
+        events.append((None, "[DONE]"))
+        self._stream(events)
+
+    def _anthropic_message(self, params: dict) -> None:
+        message = _message(params)
+        if not params.get("stream"):
+            return self._send(message)
+        text = message["content"][0]["text"]
+        start = {**message, "content": [], "stop_reason": None, "usage": {"input_tokens": message["usage"]["input_tokens"], "output_tokens": 0}}
+        events = [("message_start", {"type": "message_start", "message": start}),
+                  ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})]
+        events += [
+            ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": line}})
+            for line in text.splitlines(keepends=True)
+        ]
+        events += [("content_block_stop", {"type": "content_block_stop", "index": 0}),
+                   ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": message["usage"]["output_tokens"]}}),
+                   ("message_stop", {"type": "message_stop"})]
+        self._stream(events)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, delay: float = 5.0, failure_rate: float = 0.0, seed: int = 0) -> ThreadingHTTPServer:
+    """Return a started server (in a daemon thread); ``server.shutdown()`` stops it."""
+    handler = type("Handler", (StubHandler,), {"state": StubState(delay, failure_rate, seed)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=5.0, help="seconds until a batch has ended")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability that a batch request fails")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.delay, args.failure_rate, args.seed)
+    print(f"Batch stub listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""bench_async.py
+
+How many provider calls one process keeps in flight: the same batch of calls to the
+offline ``fake`` provider (fixed latency) through the web app's wrapper stack
+(instrumentation, rate limiting), made
+
+* threads – one ``chat`` per thread of a ``ThreadPoolExecutor`` of ``--threads``
+  workers (the web app's previous model; its in-flight budget defaulted to 16)
+* async   – ``achat`` tasks on the ``async_engine`` loop, all in flight at once
+
+Usage (from the repository root):
+
+    python benchmarks/bench_async.py                     # 500 calls of 1 s
+    python benchmarks/bench_async.py --calls 2000 --latency 0.5 --threads 64
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from async_engine import get_engine  # noqa: E402
+from instrumentation import InstrumentedProvider  # noqa: E402
+from llm_providers import get_provider  # noqa: E402
+from rate_limiting import RateLimitedProvider  # noqa: E402
+
+MESSAGE = "[P1] I mostly work from home now.\n[P2] The commute was the worst part.\n\nPlease identify the top 5 key themes"
+
+
+def _measure(label, fn, calls):
+    tracemalloc.start()
+    peak_threads = threading.active_count()
+    done = threading.Event()
+
+    def _watch():
+        nonlocal peak_threads
+        while not done.wait(0.05):
+            peak_threads = max(peak_threads, threading.active_count())
+
+    watcher = threading.Thread(target=_watch)
+    watcher.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    done.set()
+    watcher.join()
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    print(f"{label:<8} {elapsed:8.2f} s  {calls / elapsed:8.1f} calls/s  peak threads {peak_threads - 1:5d}  peak {peak:7.1f} MB")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per fake provider call")
+    parser.add_argument("--threads", type=int, default=16, help="thread pool size for the threaded run")
+    args = parser.parse_args()
+
+    os.environ["QUALIGPT_FAKE_LATENCY"] = str(args.latency)
+    os.environ.setdefault("QUALIGPT_RPM", "1000000")
+    provider = RateLimitedProvider(
+        InstrumentedProvider(get_provider("fake", "benchmark", reuse=False), None, "fake", None), "fake"
+    )
+    messages = [f"{MESSAGE} ({i})" for i in range(args.calls)]
+    print(f"{args.calls} calls, {args.latency}s each")
+
+    def _threads():
+        with ThreadPoolExecutor(args.threads) as pool:
+            list(pool.map(lambda message: provider.chat("system", message), messages))
+
+    async def _gather():
+        await asyncio.gather(*(provider.achat("system", message) for message in messages))
+
+    threaded = _measure("threads", _threads, args.calls)
+    get_engine()  # started outside the measurement, as in the web app
+    asynchronous = _measure("async", lambda: get_engine().run(_gather()), args.calls)
+    print(f"speed-up: {threaded / asynchronous:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""bench_docx.py
+
+Compare DOCX text extraction for a batch of synthetic interview transcripts:
+
+* legacy       – python-docx object model, as `upload_file` did before
+  docx_extraction.py (paragraphs, then every `table.rows[].cells[]`)
+* streaming    – ``docx_extraction.iter_docx_lines`` in one process
+* process pool – ``ingestion.ingest_path`` for every file in a spawn-based
+  ``ProcessPoolExecutor`` (what `/upload_file` does for multi-file uploads)
+
+Usage (from the repository root):
+
+    python benchmarks/bench_docx.py                    # 50 transcripts
+    python benchmarks/bench_docx.py --files 20 --paragraphs 4000 --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from docx import Document  # noqa: E402
+
+from docx_extraction import iter_docx_lines  # noqa: E402
+from ingestion import ingest_path  # noqa: E402
+
+WORDS = (
+    "remote work office team meeting manager schedule flexible home family commute "
+    "productivity balance stress communication colleague project deadline support "
+    "feel think really always never sometimes because although however"
+).split()
+
+
+def write_transcript(path: str, paragraphs: int, table_rows: int, seed: int) -> None:
+    """Write a transcript with ``paragraphs`` answers and a merged-cell summary table."""
+    rng = random.Random(seed)
+    doc = Document()
+    for i in range(paragraphs):
+        speaker = "Interviewer" if i % 2 == 0 else f"P{seed:02d}"
+        doc.add_paragraph(f"{speaker}: " + " ".join(rng.choices(WORDS, k=rng.randint(10, 60))))
+    table = doc.add_table(rows=table_rows, cols=4)
+    for r in range(0, table_rows - 1, 2):
+        table.cell(r, 0).merge(table.cell(r + 1, 0)).text = f"Topic {r // 2}"
+        table.cell(r, 1).merge(table.cell(r, 3)).text = " ".join(rng.choices(WORDS, k=20))
+        for c in (1, 2, 3):
+            table.cell(r + 1, c).text = " ".join(rng.choices(WORDS, k=8))
+    doc.save(path)
+
+
+def legacy_extract(path: str):
+    doc = Document(path)
+    lines = []
+    for para in doc.paragraphs:
+        text = para.text.strip()
+        if text:
+            lines.append(text)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                cell_text = cell.text.strip()
+                if cell_text:
+                    for piece in cell_text.split("\n"):
+                        piece = piece.strip()
+                        if piece:
+                            lines.append(piece)
+    return lines
+
+
+def _time(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<14} {elapsed:8.2f} s")
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50, help="number of transcripts")
+    parser.add_argument("--paragraphs", type=int, default=1500, help="paragraphs per transcript")
+    parser.add_argument("--table-rows", type=int, default=200, help="rows of the summary table")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes for the pool run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"P{i:02d}.docx")
+            write_transcript(path, args.paragraphs, args.table_rows, i)
+            paths.append(path)
+        size = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+        print(f"{args.files} transcripts, {size:.1f} MB, {args.workers} workers")
+
+        legacy, legacy_lines = _time("legacy", lambda: [legacy_extract(p) for p in paths])
+        streaming, lines = _time("streaming", lambda: [list(iter_docx_lines(p)) for p in paths])
+        print(f"lines: legacy {sum(map(len, legacy_lines))}, streaming {sum(map(len, lines))} (merged cells read once)")
+
+        store = os.path.join(tmp, "store")
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pool.submit(int).result()  # start-up cost is paid once per server, not per upload
+            pooled, _ = _time("process pool", lambda: list(pool.map(
+                ingest_path, paths, [os.path.basename(p) for p in paths], [store] * len(paths)
+            )))
+        print(f"speed-up vs legacy: streaming {legacy / streaming:.2f}x, pool {legacy / pooled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""bench_ingestion.py
+
+Compare the previous `/upload_file` CSV path (whole-file ``read_csv`` plus a per-row
+``apply`` join, text kept in memory) with ``ingestion.ingest_upload`` (chunked read,
+vectorised join, text written to the dataset store) on a synthetic social-media export.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_ingestion.py                 # 100 MB CSV
+    python benchmarks/bench_ingestion.py --mb 500 --skip-legacy
+
+Peak memory is measured with ``tracemalloc`` (Python and NumPy allocations).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd  # noqa: E402
+
+from dataset_store import DatasetStore  # noqa: E402
+from ingestion import ingest_upload  # noqa: E402
+
+WORDS = (
+    "remote work office team meeting manager schedule flexible home family commute "
+    "productivity balance stress communication colleague project deadline support "
+    "love hate great awful update release price service delivery app phone"
+).split()
+
+
+def write_synthetic_csv(path: str, size_bytes: int, seed: int = 0) -> int:
+    """Write roughly ``size_bytes`` of posts (id, user, date, likes, text); return the row count."""
+    rng = random.Random(seed)
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["post_id", "user", "date", "likes", "text"])
+        while f.tell() < size_bytes:
+            for _ in range(1000):
+                text = " ".join(rng.choices(WORDS, k=rng.randint(8, 60)))
+                writer.writerow([rows, f"user{rng.randint(1, 50000)}", "2024-05-01", rng.randint(0, 900), text])
+                rows += 1
+    return rows
+
+
+def legacy_ingest(path: str) -> str:
+    """The CSV path of `/upload_file` before ingestion.py."""
+    data = pd.read_csv(path)
+    return "\n".join(data.apply(lambda row: " ".join(row.astype(str)), axis=1))
+
+
+def _measure(label, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<16} {elapsed:8.2f} s  peak {peak / 1024 / 1024:8.1f} MB")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=100, help="CSV size in megabytes")
+    parser.add_argument("--skip-legacy", action="store_true", help="only run the streaming path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.csv")
+        rows = write_synthetic_csv(path, int(args.mb * 1024 * 1024))
+        print(f"csv: {os.path.getsize(path) / 1024 / 1024:.1f} MB, {rows} rows")
+
+        if not args.skip_legacy:
+            legacy = _measure("legacy (apply)", lambda: legacy_ingest(path))
+
+        def _stream():
+            with open(path, "rb") as f:
+                ingest_upload(f, "export.csv", DatasetStore(os.path.join(tmp, "uploads")))
+
+        current = _measure("ingest_upload", _stream)
+        if not args.skip_legacy:
+            print(f"speed-up: {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
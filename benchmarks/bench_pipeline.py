@@ -0,0 +1,276 @@
+"""bench_pipeline.py
+
+End-to-end benchmark of the web app with the offline ``fake`` provider
+(``llm_providers.FakeProvider``): synthetic corpora of increasing size are uploaded
+through ``/upload_file`` and analysed through ``/analyze``, so only QualiGPT's own
+overhead (ingestion, segmentation, job queue, merging) and the simulated provider
+latency are measured.
+
+Corpora are generated from the bundled samples: at scale ``s`` there are ``s``
+files per seed (``qualigpt-test-data.csv``, ``sample-interview.docx``,
+``sample-social-media.xlsx``), each made of ``--rows-factor`` times the seed's
+rows/paragraphs drawn at random, so the corpus grows linearly with the scale.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_pipeline.py                       # scales 1 4 16
+    python benchmarks/bench_pipeline.py --scales 1 2 --repeats 5 --latency 0.5 --jitter 0.2
+    python benchmarks/bench_pipeline.py --failure-rate 0.05 --json results.json
+
+Reported per scale:
+
+* upload        – wall time of the ``/upload_file`` request (all files at once)
+* analysis      – p50 / p95 wall time from ``/analyze`` to the final result
+* throughput    – corpus MB analysed per second over all repeats
+* call          – p50 / p95 duration of the segment (map) calls
+* map / merge / finalize – per-stage time of the median analysis, from the
+  analysis' Server-Sent Events: submission to the last segment output, to the
+  last merge output, to the result being available
+* peak memory   – ``tracemalloc`` peak of the server process during the scale
+  (``--no-trace-memory`` to skip it; tracing slows Python code down)
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+from docx import Document  # noqa: E402
+
+from docx_extraction import iter_docx_lines  # noqa: E402
+
+SEEDS = ("qualigpt-test-data.csv", "sample-interview.docx", "sample-social-media.xlsx")
+
+
+def load_webapp(workdir: str):
+    """Import qualigpt-webapp.py with its stores in ``workdir``."""
+    os.environ.setdefault("QUALIGPT_UPLOAD_DIR", os.path.join(workdir, "uploads"))
+    os.environ.setdefault("QUALIGPT_RUN_STORE_PATH", os.path.join(workdir, "runs.sqlite3"))
+    os.environ.setdefault("QUALIGPT_PROJECT_STORE_PATH", os.path.join(workdir, "projects.sqlite3"))
+    spec = importlib.util.spec_from_file_location("qualigpt_webapp", os.path.join(ROOT, "qualigpt-webapp.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# --- Corpus ------------------------------------------------------------------
+
+def write_corpus(directory: str, scale: int, rows_factor: int, seed: int):
+    """Write ``scale`` synthetic files per seed; return their paths."""
+    rng = random.Random(seed)
+    csv_seed = pd.read_csv(os.path.join(ROOT, SEEDS[0]))
+    xlsx_seed = pd.read_excel(os.path.join(ROOT, SEEDS[2]))
+    paragraphs = list(iter_docx_lines(os.path.join(ROOT, SEEDS[1])))
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(scale):
+        path = os.path.join(directory, f"S{i:03d}.csv")
+        csv_seed.sample(len(csv_seed) * rows_factor, replace=True, random_state=rng.randrange(2**32)).to_csv(path, index=False)
+        paths.append(path)
+
+        path = os.path.join(directory, f"M{i:03d}.xlsx")
+        xlsx_seed.sample(len(xlsx_seed) * rows_factor, replace=True, random_state=rng.randrange(2**32)).to_excel(path, index=False)
+        paths.append(path)
+
+        path = os.path.join(directory, f"I{i:03d}.docx")
+        doc = Document()
+        for paragraph in rng.choices(paragraphs, k=len(paragraphs) * rows_factor):
+            doc.add_paragraph(paragraph)
+        doc.save(path)
+        paths.append(path)
+    return paths
+
+
+# --- Measurement -------------------------------------------------------------
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def upload(client, paths):
+    files = []
+    for path in paths:
+        with open(path, "rb") as f:
+            files.append((io.BytesIO(f.read()), os.path.basename(path)))
+    started = time.perf_counter()
+    response = client.post("/upload_file", data={"files": files}, content_type="multipart/form-data").get_json()
+    elapsed = time.perf_counter() - started
+    if not response.get("success"):
+        raise RuntimeError(f"Upload failed: {response.get('error')}")
+    return elapsed, response["files"]
+
+
+def analyse(client, payload):
+    """Run one analysis; return its wall time, stage times and result."""
+    started = time.perf_counter()
+    job = client.post("/analyze", json=payload).get_json()
+    if not job.get("success"):
+        raise RuntimeError(f"Analysis was not queued: {job.get('error')}")
+    last_segment = last_merge = None
+    stream = client.get(job["stream_url"], buffered=False)
+    for chunk in stream.response:
+        now = time.perf_counter() - started
+        for line in chunk.decode("utf-8").splitlines():
+            if line.startswith("data: ") and '"stage"' in line:
+                stage = json.loads(line[len("data: "):])["stage"]
+                if stage == "segment":
+                    last_segment = now
+                elif stage == "merge":
+                    last_merge = now
+    stream.close()
+    result = client.get(job["result_url"]).get_json()
+    elapsed = time.perf_counter() - started
+    map_done = last_segment or 0.0
+    merge_done = last_merge or map_done
+    stages = {"map": map_done, "merge": merge_done - map_done, "finalize": elapsed - merge_done}
+    return elapsed, stages, result
+
+
+def run_scale(client, args, scale, workdir):
+    paths = write_corpus(os.path.join(workdir, f"corpus-{scale}"), scale, args.rows_factor, args.seed + scale)
+    corpus_mb = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+
+    if args.trace_memory:
+        tracemalloc.start()
+    upload_seconds, files = upload(client, paths)
+    payload = {
+        "api_key": "benchmark",
+        "provider": "fake",
+        "model": "auto",
+        "data_type": "Interview",
+        "num_themes": args.num_themes,
+        "analysis_mode": args.mode,
+        "use_cache": False,
+        "files_data": [
+            {"filename": f["filename"], "participant_id": f["participant_id"], "dataset_id": f["dataset_id"]}
+            for f in files
+        ],
+    }
+    text_mb = sum(f["num_chars"] for f in files) / 1024 / 1024
+
+    runs = []
+    runs_lock = threading.Lock()
+
+    def _worker(count):
+        for _ in range(count):
+            outcome = analyse(client, payload)
+            with runs_lock:
+                runs.append(outcome)
+
+    started = time.perf_counter()
+    shares = [args.repeats // args.concurrency + (i < args.repeats % args.concurrency) for i in range(args.concurrency)]
+    threads = [threading.Thread(target=_worker, args=(share,)) for share in shares if share]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    peak_mb = None
+    if args.trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    failed = [result.get("error") for _, _, result in runs if not result.get("success")]
+    latencies = [elapsed for elapsed, _, _ in runs]
+    call_seconds = [
+        timing["seconds"]
+        for _, _, result in runs if result.get("success")
+        for timing in _segment_timings(result)
+    ]
+    median_run = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+    segments = [result.get("segments_processed", 0) for _, _, result in runs if result.get("report_type") == "combined"]
+    return {
+        "scale": scale,
+        "files": len(paths),
+        "corpus_mb": round(corpus_mb, 2),
+        "text_mb": round(text_mb, 2),
+        "segments": max(segments) if segments else len(call_seconds) // max(1, len(runs)),
+        "upload_s": round(upload_seconds, 3),
+        "analysis_p50_s": round(percentile(latencies, 50), 3),
+        "analysis_p95_s": round(percentile(latencies, 95), 3),
+        "throughput_mb_s": round(text_mb * len(runs) / wall, 3),
+        "call_p50_s": round(percentile(call_seconds, 50), 3),
+        "call_p95_s": round(percentile(call_seconds, 95), 3),
+        "stages_s": {stage: round(seconds, 3) for stage, seconds in median_run[1].items()},
+        "peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+        "failed": len(failed),
+        "errors": sorted(set(failed)),
+    }
+
+
+def _segment_timings(result):
+    if result.get("report_type") == "separate":
+        return [timing for report in result["response"] for timing in report.get("segment_timings", [])]
+    return result.get("segment_timings", [])
+
+
+def print_table(rows):
+    header = (f"{'scale':>5} {'files':>5} {'text MB':>8} {'segs':>5} {'upload s':>9} {'p50 s':>7} {'p95 s':>7} "
+              f"{'MB/s':>7} {'call p50':>8} {'call p95':>8} {'map s':>7} {'merge s':>7} {'final s':>7} {'peak MB':>8} {'failed':>6}")
+    print(header)
+    for row in rows:
+        stages = row["stages_s"]
+        peak = f"{row['peak_mb']:8.1f}" if row["peak_mb"] is not None else f"{'-':>8}"
+        print(f"{row['scale']:>5} {row['files']:>5} {row['text_mb']:>8.2f} {row['segments']:>5} {row['upload_s']:>9.2f} "
+              f"{row['analysis_p50_s']:>7.2f} {row['analysis_p95_s']:>7.2f} {row['throughput_mb_s']:>7.2f} "
+              f"{row['call_p50_s']:>8.2f} {row['call_p95_s']:>8.2f} {stages['map']:>7.2f} {stages['merge']:>7.2f} "
+              f"{stages['finalize']:>7.2f} {peak} {row['failed']:>6}")
+    for row in rows:
+        for error in row["errors"]:
+            print(f"scale {row['scale']}: {error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4, 16], help="files per seed for each corpus")
+    parser.add_argument("--rows-factor", type=int, default=50, help="rows/paragraphs per file, as a multiple of the seed's")
+    parser.add_argument("--repeats", type=int, default=3, help="analyses per corpus")
+    parser.add_argument("--concurrency", type=int, default=1, help="analyses running at the same time")
+    parser.add_argument("--mode", choices=("combined", "separate"), default="combined")
+    parser.add_argument("--num-themes", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per fake provider call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="extra random seconds per call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability of a failed (retried) call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    args.concurrency = max(1, min(args.concurrency, args.repeats))
+
+    os.environ["QUALIGPT_FAKE_LATENCY"] = str(args.latency)
+    os.environ["QUALIGPT_FAKE_JITTER"] = str(args.jitter)
+    os.environ["QUALIGPT_FAKE_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["QUALIGPT_FAKE_SEED"] = str(args.seed)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        webapp = load_webapp(workdir)
+        client = webapp.app.test_client()
+        print(f"fake provider: {args.latency}s + up to {args.jitter}s per call, failure rate {args.failure_rate}; "
+              f"{args.repeats} {args.mode} analyses per scale, {args.concurrency} at a time")
+        rows = [run_scale(client, args, scale, workdir) for scale in args.scales]
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""bench_segmentation.py
+
+Compare the previous ``split_into_segments`` loop (``segment += " " + sentence``)
+with ``segmentation.iter_segments`` on a synthetic participant-coded transcript.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_segmentation.py            # 50 MB transcript
+    python benchmarks/bench_segmentation.py --mb 5 --max-tokens 120000
+
+Both implementations use the same token counter, so the difference is purely the
+segment-building strategy (plus sentence detection by offsets vs. strings).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import nltk.data  # noqa: E402
+
+nltk.data.path.append(os.path.join(os.path.dirname(__file__), "..", "nltk_data"))
+
+from nltk.tokenize import sent_tokenize  # noqa: E402
+
+from segmentation import iter_segments  # noqa: E402
+from token_counting import get_token_counter  # noqa: E402
+
+WORDS = (
+    "remote work office team meeting manager schedule flexible home family commute "
+    "productivity balance stress communication colleague project deadline support "
+    "feel think really always never sometimes because although however"
+).split()
+
+
+def synthetic_transcript(size_bytes: int, seed: int = 0) -> str:
+    """Return roughly ``size_bytes`` of ``[Pxxx] sentence`` lines."""
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    while total < size_bytes:
+        sentences = []
+        for _ in range(rng.randint(1, 4)):
+            words = rng.choices(WORDS, k=rng.randint(6, 24))
+            sentences.append(" ".join(words).capitalize() + rng.choice([".", ".", "?", "!"]))
+        line = f"[P{rng.randint(1, 400):03d}] " + " ".join(sentences)
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def legacy_split_into_segments(text, max_tokens, token_counter):
+    """The segmenter as it was before segmentation.py (string concatenation)."""
+    sentences = sent_tokenize(text)
+    segments = []
+    segment = ""
+    segment_tokens = 0
+    for sentence in sentences:
+        num_tokens = token_counter.count(sentence)
+        if segment_tokens + num_tokens > max_tokens:
+            segments.append(segment.strip())
+            segment = sentence
+            segment_tokens = num_tokens
+        else:
+            segment += " " + sentence
+            segment_tokens += num_tokens
+    if segment:
+        segments.append(segment.strip())
+    return segments
+
+
+def _time(label, fn):
+    started = time.perf_counter()
+    segments = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} {elapsed:8.2f} s  {len(segments):5d} segments")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=50, help="transcript size in megabytes")
+    parser.add_argument("--max-tokens", type=int, default=120000, help="segment budget")
+    parser.add_argument("--provider", default="anthropic", help="token counter to use for both runs")
+    args = parser.parse_args()
+
+    text = synthetic_transcript(int(args.mb * 1024 * 1024))
+    counter = get_token_counter(args.provider)
+    print(f"transcript: {len(text) / 1024 / 1024:.1f} MB, budget {args.max_tokens} tokens, counter {type(counter).__name__}")
+
+    legacy = _time("legacy (concat)", lambda: legacy_split_into_segments(text, args.max_tokens, counter))
+    current = _time("iter_segments", lambda: list(iter_segments(text, args.max_tokens, counter)))
+    print(f"speed-up: {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""bench_system_prompt.py
+
+Client-side overhead per Gemini call of a run (every segment shares one system
+message), without network access:
+
+* before – a new ``GenerativeModel`` per call, system message concatenated in front
+  of the segment, request built from the combined text
+* after  – `GeminiProvider._request()`: the ``GenerateContentRequest`` built directly,
+  system message as its system instruction, segment alone as the contents
+
+The "before" request is built with google-generativeai's own ``_prepare_request``,
+i.e. everything ``generate_content`` does before it sends the request.  Needs
+google-generativeai.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_system_prompt.py                    # 2000 calls
+    python benchmarks/bench_system_prompt.py --calls 500 --segment-kb 400
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llm_providers import GeminiProvider  # noqa: E402
+
+SYSTEM = (
+    "You are an excellent qualitative data analyst and qualitative research expert. "
+    "Follow the output format instructions exactly with no additional commentary.\n\n"
+)
+MODEL = "gemini-2.5-flash"
+GENERATION_CONFIG = {"temperature": 0.7, "max_output_tokens": 4000}
+
+
+def _prepare(gen_model, contents):
+    return gen_model._prepare_request(
+        contents=contents, generation_config=GENERATION_CONFIG, safety_settings=None, tools=None, tool_config=None
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--segment-kb", type=float, default=40, help="size of each segment")
+    parser.add_argument("--prompt-kb", type=float, default=2, help="size of the instructions in the system message")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    try:
+        provider = GeminiProvider("benchmark")
+    except ModuleNotFoundError:
+        sys.exit("google-generativeai is not installed")
+    import google.generativeai as genai  # type: ignore
+
+    system_message = SYSTEM + "Identify the key themes. " * int(args.prompt_kb * 1024 / 24)
+    segments = [f"[P{i}] " + "I mostly work from home now. " * int(args.segment_kb * 1024 / 29) for i in range(8)]
+    print(f"{args.calls} calls, system message {len(system_message) / 1024:.1f} KB, segments {args.segment_kb:.0f} KB")
+
+    def _before(i):
+        gen_model = genai.GenerativeModel(MODEL)
+        return _prepare(gen_model, f"{system_message}\n\n{segments[i % len(segments)]}")
+
+    def _after(i):
+        return provider._request(
+            MODEL,
+            system_message,
+            segments[i % len(segments)],
+            GENERATION_CONFIG["max_output_tokens"],
+            GENERATION_CONFIG["temperature"],
+        )
+
+    results = {}
+    for label, call in (("before", _before), ("after", _after)):
+        call(0)  # warm-up (imports, first model)
+        started = time.perf_counter()
+        for i in range(args.calls):
+            call(i)
+        results[label] = (time.perf_counter() - started) / args.calls
+        print(f"{label:<7} {results[label] * 1e6:9.1f} us/call")
+    print(f"speed-up: {results['before'] / results['after']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
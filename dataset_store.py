@@ -0,0 +1,126 @@
+"""dataset_store.py
+
+Server-side, content-addressed storage for ingested datasets.
+
+The browser no longer round-trips dataset text: `/upload_file` stores the text here
+and returns its dataset ID, and `/analyze` receives only IDs.
+
+* A dataset ID is the SHA-256 of the dataset text, so uploading the same file
+  twice (or the same sheet under another name) stores it once.
+* `DatasetStore.writer()` – file-like writer that hashes while writing to a
+  temporary file and moves it into place under its hash on `commit()`.
+* `DatasetStore.read(dataset_id)` / `info(dataset_id)` – text and size of a stored
+  dataset (`KeyError` once it has been evicted).
+* `DatasetStore.evict_expired()` – datasets unused for `retention_seconds` are
+  deleted; every upload or read of a dataset refreshes it.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from typing import Dict, Optional
+
+_DATASET_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+DEFAULT_RETENTION_SECONDS = 24 * 3600
+
+# --- Writer ------------------------------------------------------------------
+
+class DatasetWriter:
+    """Write a dataset's text once; `commit()` returns its dataset ID."""
+
+    def __init__(self, store: "DatasetStore"):
+        self._store = store
+        self._hash = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, suffix=".part")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, text: str) -> None:
+        self._hash.update(text.encode("utf-8"))
+        self._file.write(text)
+
+    def commit(self) -> str:
+        self._file.close()
+        dataset_id = self._hash.hexdigest()
+        path = self._store._path(dataset_id)
+        if os.path.exists(path):
+            # Already stored: keep the existing copy and mark it as recently used
+            os.remove(self._tmp_path)
+            os.utime(path)
+        else:
+            os.replace(self._tmp_path, path)
+        return dataset_id
+
+    def discard(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.discard()
+
+# --- Store -------------------------------------------------------------------
+
+class DatasetStore:
+    """Directory of ``<sha256>.txt`` files, one per distinct dataset text."""
+
+    def __init__(self, root: str, retention_seconds: Optional[float] = DEFAULT_RETENTION_SECONDS):
+        self.root = root
+        self.retention_seconds = retention_seconds
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, dataset_id: str) -> str:
+        if not _DATASET_ID_RE.match(dataset_id or ""):
+            raise KeyError(dataset_id)
+        return os.path.join(self.root, f"{dataset_id}.txt")
+
+    def writer(self) -> DatasetWriter:
+        return DatasetWriter(self)
+
+    def read(self, dataset_id: str) -> str:
+        path = self._path(dataset_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            raise KeyError(dataset_id) from None
+        os.utime(path)
+        return text
+
+    def info(self, dataset_id: str) -> Dict[str, object]:
+        """Return the stored size and last-use time of a dataset."""
+        try:
+            stat = os.stat(self._path(dataset_id))
+        except FileNotFoundError:
+            raise KeyError(dataset_id) from None
+        return {"dataset_id": dataset_id, "bytes": stat.st_size, "last_used": stat.st_mtime}
+
+    def __contains__(self, dataset_id: str) -> bool:
+        try:
+            return os.path.exists(self._path(dataset_id))
+        except KeyError:
+            return False
+
+    def evict_expired(self) -> int:
+        """Delete datasets (and abandoned partial writes) unused for ``retention_seconds``."""
+        if self.retention_seconds is None:
+            return 0
+        cutoff = time.time() - self.retention_seconds
+        removed = 0
+        for entry in os.scandir(self.root):
+            if not entry.name.endswith((".txt", ".part")):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:  # removed concurrently
+                pass
+        return removed
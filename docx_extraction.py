@@ -0,0 +1,85 @@
+"""docx_extraction.py
+
+Fast text extraction from DOCX files, reading `word/document.xml` straight from
+the zip archive with a streaming `iterparse` instead of building the python-docx
+object model.
+
+* `iter_docx_lines(source)` – yields the non-empty lines of body paragraphs and
+  table cells in document order.  Elements are cleared as soon as they have been
+  read, so memory does not grow with the length of the transcript.
+* Merged cells are read once: a horizontally merged cell is a single `<w:tc>` in
+  the XML (python-docx repeats it for every grid column it spans), and
+  continuation cells of a vertical merge (`<w:vMerge/>` without `restart`) are
+  skipped (python-docx returns the top cell's text again for them).
+
+Text inside a cell is split on line breaks and each piece is stripped, as the old
+`upload_file` extraction did.
+"""
+from __future__ import annotations
+
+import zipfile
+from typing import IO, Iterator, List, Union
+from xml.etree import ElementTree
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_P = _W + "p"
+_T = _W + "t"
+_TAB = _W + "tab"
+_BR = _W + "br"
+_CR = _W + "cr"
+_TC = _W + "tc"
+_VMERGE = _W + "vMerge"
+_VAL = _W + "val"
+
+NO_TEXT_PLACEHOLDER = "(No readable text detected in DOCX)"
+
+
+def _paragraph_text(paragraph: ElementTree.Element) -> str:
+    parts = []
+    for node in paragraph.iter():
+        tag = node.tag
+        if tag == _T:
+            parts.append(node.text or "")
+        elif tag == _TAB:
+            parts.append("\t")
+        elif tag in (_BR, _CR):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _split_lines(text: str) -> Iterator[str]:
+    for piece in text.split("\n"):
+        piece = piece.strip()
+        if piece:
+            yield piece
+
+
+def iter_docx_lines(source: Union[str, IO[bytes]]) -> Iterator[str]:
+    """Yield the non-empty text lines of a DOCX file (path or binary file object)."""
+    with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as xml:
+        # One entry per open table cell (nested tables push further cells):
+        # [paragraph texts, is a vertical-merge continuation]
+        cells: List[list] = []
+        for event, elem in ElementTree.iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _TC:
+                    cells.append([[], False])
+                continue
+
+            if tag == _P:
+                text = _paragraph_text(elem)
+                elem.clear()
+                if cells:
+                    cells[-1][0].append(text)
+                else:
+                    yield from _split_lines(text)
+            elif tag == _VMERGE and cells:
+                if elem.get(_VAL, "continue") == "continue":
+                    cells[-1][1] = True
+            elif tag == _TC:
+                paragraphs, continuation = cells.pop()
+                elem.clear()
+                if not continuation:
+                    yield from _split_lines("\n".join(paragraphs))
+
@@ -0,0 +1,158 @@
+"""ingestion.py
+
+Streaming conversion of uploaded CSV / XLSX / DOCX files into the plain-text form
+the analysis works on (one line per row or paragraph).
+
+The previous path read a whole sheet into a DataFrame and joined each row with a
+per-row Python lambda, then returned the text in the JSON response.  Here:
+
+* `iter_csv_frames` reads CSV files in chunks of `CSV_CHUNK_ROWS` rows.
+* `iter_xlsx_frames` reads workbooks with openpyxl in read-only mode, batching
+  `XLSX_CHUNK_ROWS` rows at a time.
+* `iter_docx_frames` streams DOCX text through `docx_extraction`.
+* `row_lines(frame)` turns a chunk into row text with vectorised string
+  concatenation.
+* `ingest_upload(file, filename, store)` writes the text straight into a
+  `dataset_store.DatasetStore` and returns an `IngestedFile` with the dataset ID,
+  headers, size and a short preview – memory stays flat whatever the file size.
+* `ingest_path(path, filename, store_root)` – the same for a saved upload, used
+  to ingest several uploads in parallel worker processes.
+"""
+from __future__ import annotations
+
+from typing import IO, Iterator, List, NamedTuple
+
+import pandas as pd
+
+from dataset_store import DatasetStore
+from docx_extraction import NO_TEXT_PLACEHOLDER, iter_docx_lines
+
+CSV_CHUNK_ROWS = 50_000
+XLSX_CHUNK_ROWS = 10_000
+PREVIEW_CHARS = 2_000
+
+
+class IngestedFile(NamedTuple):
+    dataset_id: str
+    headers: List[str]
+    num_lines: int
+    num_chars: int
+    preview: str
+
+# --- Readers -----------------------------------------------------------------
+
+def iter_csv_frames(stream: IO, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield the CSV in DataFrame chunks of strings.
+
+    Dtypes inferred per chunk would differ between chunks (an integer column with
+    a gap in only one chunk renders as ``1.0`` there), so cells keep their text as
+    written; missing cells are still NaN.
+    """
+    yield from pd.read_csv(stream, chunksize=chunk_rows, dtype=str)
+
+
+def iter_xlsx_frames(stream: IO, chunk_rows: int = XLSX_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield the first worksheet in DataFrame chunks; the first row holds the headers.
+
+    Cells keep openpyxl's Python values (``dtype=object``) so that every chunk
+    renders a column the same way, as `iter_csv_frames` does.
+    """
+    from openpyxl import load_workbook  # type: ignore
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header_row = next(rows, None)
+        if header_row is None:
+            return
+        headers = [
+            str(value) if value is not None else f"Unnamed: {index}"
+            for index, value in enumerate(header_row)
+        ]
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(row[:len(headers)])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=headers, dtype=object)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=headers, dtype=object)
+    finally:
+        workbook.close()
+
+
+def iter_docx_frames(stream: IO, chunk_rows: int = XLSX_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield the non-empty paragraph and table-cell lines of a DOCX file in chunks."""
+    batch: List[str] = []
+    produced = False
+    for line in iter_docx_lines(stream):
+        batch.append(line)
+        if len(batch) >= chunk_rows:
+            yield pd.DataFrame(batch, columns=["Content"])
+            produced = True
+            batch = []
+    if batch or not produced:
+        yield pd.DataFrame(batch or [NO_TEXT_PLACEHOLDER], columns=["Content"])
+
+# --- Row text ----------------------------------------------------------------
+
+def row_lines(frame: pd.DataFrame) -> pd.Series:
+    """Return one line per row: the cells' string values joined by spaces.
+
+    Missing cells become ``nan`` as with ``row.astype(str)`` in the old per-row join.
+    """
+    cells = frame.fillna("nan").astype(str)
+    if cells.shape[1] == 0:
+        return pd.Series([""] * len(cells), index=cells.index)
+    first = cells.iloc[:, 0]
+    if cells.shape[1] == 1:
+        return first
+    return first.str.cat([cells.iloc[:, i] for i in range(1, cells.shape[1])], sep=" ")
+
+# --- Ingestion ---------------------------------------------------------------
+
+def iter_frames(stream: IO, file_ext: str) -> Iterator[pd.DataFrame]:
+    if file_ext == "csv":
+        return iter_csv_frames(stream)
+    if file_ext == "xlsx":
+        return iter_xlsx_frames(stream)
+    if file_ext == "docx":
+        return iter_docx_frames(stream)
+    raise ValueError(f"Unsupported file type: {file_ext}")
+
+
+def ingest_upload(stream: IO, filename: str, store: DatasetStore) -> IngestedFile:
+    """Convert an uploaded file to text in ``store``, one chunk at a time."""
+    file_ext = filename.rsplit(".", 1)[-1].lower()
+
+    headers: List[str] = []
+    num_lines = 0
+    num_chars = 0
+    preview = ""
+    with store.writer() as out:
+        for frame in iter_frames(stream, file_ext):
+            if not headers:
+                headers = [str(column) for column in frame.columns]
+            if frame.empty:
+                continue
+            text = "\n".join(row_lines(frame))
+            if num_lines:
+                text = "\n" + text
+            out.write(text)
+            if len(preview) < PREVIEW_CHARS:
+                preview += text[:PREVIEW_CHARS - len(preview)]
+            num_lines += len(frame)
+            num_chars += len(text)
+        dataset_id = out.commit()
+    return IngestedFile(dataset_id, headers, num_lines, num_chars, preview.lstrip("\n"))
+
+
+def ingest_path(path: str, filename: str, store_root: str) -> IngestedFile:
+    """Ingest an upload saved at ``path`` into the store at ``store_root``.
+
+    Module-level so it can run in a worker process (see `upload_file`).
+    """
+    with open(path, "rb") as stream:
+        return ingest_upload(stream, filename, DatasetStore(store_root, retention_seconds=None))
@@ -0,0 +1,472 @@
+"""instrumentation.py
+
+Timing and token accounting for analysis runs, returned with each result and
+exported in the Prometheus text format.
+
+* `Trace` – spans of one run.  `trace.span(stage)` times a pipeline stage
+  (load, segmentation, map, merge, parse); `InstrumentedProvider` adds one span
+  per provider call with its latency, outcome and token usage, including the
+  input tokens served from the provider's prompt cache (one
+  ``provider.batch`` span per batch-mode `run_batch`).  `summary()` is
+  returned in the `/analyze` result as ``instrumentation``.
+* `stage(name)` – labels the provider calls made in the current thread or asyncio
+  task with the pipeline stage they belong to (calls run on worker threads and
+  tasks, so the label is set where each call is made).
+* `InstrumentedProvider` – innermost `ProviderWrapper`: it only sees calls that
+  reach the provider (no cache or checkpoint hits) and every retry attempt.  Token
+  counts come from the SDK's usage fields (`llm_providers.report_usage`); when a
+  provider reports none they are estimated with the model's token counter.
+* `metrics` – process-wide `MetricsRegistry` of counters and histograms, rendered
+  by the `/metrics` endpoint.  Provider and model names outside `PROVIDER_MAP` /
+  `MODEL_REGISTRY` are labelled ``other`` (spans keep the requested names).
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from llm_providers import PROVIDER_MAP, BaseProvider, ProviderWrapper, collect_usage
+from model_registry import MODEL_REGISTRY
+from token_counting import get_token_counter
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# --- Metrics -----------------------------------------------------------------
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "qualigpt_stage_seconds", "Time spent in each pipeline stage.", ("stage",)
+)
+PROVIDER_CALL_SECONDS = metrics.histogram(
+    "qualigpt_provider_call_seconds", "Latency of provider calls.", ("provider", "model", "stage", "outcome")
+)
+PROVIDER_CALLS = metrics.counter(
+    "qualigpt_provider_calls_total", "Provider calls by outcome.", ("provider", "model", "stage", "outcome")
+)
+PROVIDER_TOKENS = metrics.counter(
+    "qualigpt_provider_tokens_total",
+    "Tokens sent to and generated by providers (cached_input: part of input served from the prompt cache).",
+    ("provider", "model", "stage", "direction"),
+)
+ANALYSES = metrics.counter(
+    "qualigpt_analyses_total", "Finished analysis runs by status.", ("mode", "status")
+)
+
+# --- Spans -------------------------------------------------------------------
+
+_stage: ContextVar[Optional[str]] = ContextVar("qualigpt_stage", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Attribute the provider calls made in this thread or task inside the block to ``name``."""
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def current_stage() -> str:
+    return _stage.get() or "other"
+
+
+class Trace:
+    """Spans of one analysis run (thread-safe; calls are recorded from worker threads)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """Time the block as a stage span; the yielded dict can take further attributes."""
+        started = time.perf_counter()
+        record = {"name": name, **attributes}
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - started
+            self.add(record, started, seconds)
+            STAGE_SECONDS.observe(seconds, stage=name)
+
+    def add(self, record: Dict[str, Any], started: float, seconds: float) -> None:
+        record["start"] = round(started - self.started, 4)
+        record["seconds"] = round(seconds, 4)
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self) -> Dict[str, Any]:
+        """Stage totals, token usage and all spans (ordered by start) for the result JSON."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        stages: Dict[str, float] = {}
+        usage = {
+            "input_tokens": 0, "output_tokens": 0, "cached_input_tokens": 0,
+            "provider_calls": 0, "failed_calls": 0, "estimated_calls": 0,
+        }
+        by_stage: Dict[str, Dict[str, int]] = {}
+        for span in spans:
+            if span["name"] == "provider.chat":
+                calls, failed = 1, int(span["outcome"] != "ok")
+            elif span["name"] == "provider.batch":
+                calls, failed = span["requests"], span["requests"] - span["answered"]
+            else:
+                # Spans of the same stage can overlap (files in parallel); their times are summed
+                stages[span["name"]] = round(stages.get(span["name"], 0) + span["seconds"], 4)
+                continue
+            usage["provider_calls"] += calls
+            usage["failed_calls"] += failed
+            usage["estimated_calls"] += calls if span.get("usage") == "estimated" else 0
+            usage["input_tokens"] += span["input_tokens"]
+            usage["output_tokens"] += span["output_tokens"]
+            usage["cached_input_tokens"] += span["cached_input_tokens"]
+            totals = by_stage.setdefault(
+                span["stage"], {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cached_input_tokens": 0}
+            )
+            totals["calls"] += calls
+            totals["input_tokens"] += span["input_tokens"]
+            totals["output_tokens"] += span["output_tokens"]
+            totals["cached_input_tokens"] += span["cached_input_tokens"]
+        stages["total"] = round(time.perf_counter() - self.started, 4)
+        return {"stages": stages, "usage": {**usage, "by_stage": by_stage}, "spans": spans}
+
+# --- Provider wrapper --------------------------------------------------------
+
+# Metric label for providers and models not in PROVIDER_MAP / MODEL_REGISTRY: both
+# come from the request, and free-form labels would create unbounded series
+OTHER_LABEL = "other"
+
+
+def metric_labels(provider_name: str, model: str) -> Dict[str, str]:
+    """Return the provider/model metric labels, with unknown names mapped to ``other``."""
+    provider_name = (provider_name or "").lower()
+    return {
+        "provider": provider_name if provider_name in PROVIDER_MAP else OTHER_LABEL,
+        "model": model if model in ("auto", "router") or model in MODEL_REGISTRY else OTHER_LABEL,
+    }
+
+
+class InstrumentedProvider(ProviderWrapper):
+    """Record a span (latency, outcome, tokens) in ``trace`` for every provider call."""
+
+    def __init__(self, inner: BaseProvider, trace: Optional[Trace], provider_name: str, model: Optional[str]):
+        super().__init__(inner)
+        self.trace = trace
+        self.provider_name = provider_name
+        self.model = model or "auto"
+        self._metric_labels = metric_labels(provider_name, self.model)
+        self._counter = get_token_counter(provider_name, model)
+
+    def chat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        started = time.perf_counter()
+        text = ""
+        error = None
+        with collect_usage() as usage:
+            try:
+                text = self.inner.chat(
+                    system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature
+                )
+                return text
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                self._record(started, usage, system_message, user_message, text, error)
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        started = time.perf_counter()
+        pieces: List[str] = []
+        error = None
+        with collect_usage() as usage:
+            try:
+                for piece in self.inner.chat_stream(
+                    system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature
+                ):
+                    pieces.append(piece)
+                    yield piece
+            except GeneratorExit:
+                # The consumer stopped reading; not a provider failure
+                raise
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                self._record(started, usage, system_message, user_message, "".join(pieces), error)
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        started = time.perf_counter()
+        text = ""
+        error = None
+        with collect_usage() as usage:
+            try:
+                text = await self.inner.achat(
+                    system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature
+                )
+                return text
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                await self._arecord(started, usage, system_message, user_message, text, error)
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        pieces: List[str] = []
+        error = None
+        with collect_usage() as usage:
+            try:
+                async for piece in self.inner.achat_stream(
+                    system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature
+                ):
+                    pieces.append(piece)
+                    yield piece
+            except GeneratorExit:
+                raise
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                await self._arecord(started, usage, system_message, user_message, "".join(pieces), error)
+
+    def run_batch(
+        self,
+        system_message: str,
+        user_messages: Sequence[str],
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        poll_seconds: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Optional[str]]:
+        started = time.perf_counter()
+        answers: List[Optional[str]] = []
+        error = None
+        with collect_usage() as usage:
+            try:
+                answers = self.inner.run_batch(
+                    system_message,
+                    user_messages,
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    poll_seconds=poll_seconds,
+                    timeout=timeout,
+                )
+                return answers
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                self._record_batch(started, usage, system_message, user_messages, answers, error)
+
+    def _record_batch(self, started, usage, system_message, user_messages, answers, error) -> None:
+        """One span for a whole batch; its requests count as calls, its wait not as call latency."""
+        seconds = time.perf_counter() - started
+        answered = sum(1 for answer in answers if answer is not None)
+        cached_input_tokens = usage.cached_input_tokens
+        if usage.reported:
+            input_tokens, output_tokens, source = usage.input_tokens, usage.output_tokens, "reported"
+        else:
+            system_tokens = self._counter.count(system_message)
+            input_tokens = sum(
+                system_tokens + self._counter.count(user_messages[index])
+                for index, answer in enumerate(answers)
+                if answer is not None
+            )
+            output_tokens = sum(self._counter.count(answer) for answer in answers if answer)
+            source = "estimated"
+        stage_name = current_stage()
+        labels = {**self._metric_labels, "stage": stage_name}
+        PROVIDER_CALLS.inc(answered, outcome="ok", **labels)
+        PROVIDER_CALLS.inc(len(user_messages) - answered, outcome="error", **labels)
+        PROVIDER_TOKENS.inc(input_tokens, direction="input", **labels)
+        PROVIDER_TOKENS.inc(output_tokens, direction="output", **labels)
+        PROVIDER_TOKENS.inc(cached_input_tokens, direction="cached_input", **labels)
+        if self.trace is not None:
+            record = {
+                "name": "provider.batch",
+                "provider": self.provider_name,
+                "model": self.model,
+                "stage": stage_name,
+                "outcome": "ok" if error is None else "error",
+                "requests": len(user_messages),
+                "answered": answered,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cached_input_tokens": cached_input_tokens,
+                "usage": source,
+            }
+            if error is not None:
+                record["error"] = type(error).__name__
+            self.trace.add(record, started, seconds)
+
+    async def _arecord(self, started, usage, system_message, user_message, output, error) -> None:
+        if usage.reported:
+            self._record(started, usage, system_message, user_message, output, error)
+        else:
+            # Estimating the tokens means counting them; keep that off the event loop
+            await asyncio.to_thread(self._record, started, usage, system_message, user_message, output, error)
+
+    def _record(self, started, usage, system_message, user_message, output, error) -> None:
+        seconds = time.perf_counter() - started
+        cached_input_tokens = usage.cached_input_tokens
+        if usage.reported:
+            input_tokens, output_tokens, source = usage.input_tokens, usage.output_tokens, "reported"
+        else:
+            input_tokens = self._counter.count(system_message) + self._counter.count(user_message)
+            output_tokens = self._counter.count(output) if output else 0
+            source = "estimated"
+        outcome = "ok" if error is None else "error"
+        stage_name = current_stage()
+        labels = {**self._metric_labels, "stage": stage_name}
+        PROVIDER_CALL_SECONDS.observe(seconds, outcome=outcome, **labels)
+        PROVIDER_CALLS.inc(outcome=outcome, **labels)
+        PROVIDER_TOKENS.inc(input_tokens, direction="input", **labels)
+        PROVIDER_TOKENS.inc(output_tokens, direction="output", **labels)
+        PROVIDER_TOKENS.inc(cached_input_tokens, direction="cached_input", **labels)
+        if self.trace is not None:
+            record = {
+                "name": "provider.chat",
+                "provider": self.provider_name,
+                "model": self.model,
+                "stage": stage_name,
+                "outcome": outcome,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cached_input_tokens": cached_input_tokens,
+                "usage": source,
+            }
+            if error is not None:
+                record["error"] = type(error).__name__
+            self.trace.add(record, started, seconds)
@@ -0,0 +1,139 @@
+"""jobs.py
+
+In-process background job queue used by the web app so that long LLM analyses do
+not tie up a request thread (and are not killed by the gunicorn worker timeout).
+
+* `JobQueue.submit(fn, *args)` – schedule `fn(job, *args)` on a worker thread and
+  return the `Job` immediately.  `fn` reports progress through `job.add()` /
+  `job.set()` and returns the final JSON payload.
+* `JobQueue.get(job_id)` – look a job up again for status polling.
+* `Job.emit(event)` / `Job.wait_for_events(cursor)` – append-only event log that
+  lets a streaming endpoint forward model output while the job is running.
+
+Jobs live in memory only, so every request for a job must reach the same process
+(the Docker image runs a single gunicorn worker with several threads for this).
+Finished jobs are dropped after `retention_seconds`.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# --- Job ---------------------------------------------------------------------
+
+class Job:
+    """State, progress counters and result of one queued analysis."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.progress: Dict[str, int] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    # ---------------------------------------------------------------------
+    # Progress reporting (called from worker threads)
+    # ---------------------------------------------------------------------
+    def add(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self.progress[counter] = self.progress.get(counter, 0) + amount
+
+    def set(self, counter: str, value: int) -> None:
+        with self._lock:
+            self.progress[counter] = value
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        """Append an event (e.g. a chunk of streamed model output) to the log."""
+        with self._changed:
+            self._events.append(event)
+            self._changed.notify_all()
+
+    def wait_for_events(self, cursor: int, timeout: float = 15.0) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return ``(events after cursor, finished)``, blocking up to ``timeout`` for news."""
+        with self._changed:
+            if len(self._events) <= cursor and not self.finished:
+                self._changed.wait(timeout)
+            return self._events[cursor:], self.finished
+
+    def _finish(self, status: str) -> None:
+        with self._changed:
+            self.status = status
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the public status view (never includes the result payload)."""
+        with self._lock:
+            progress = dict(self.progress)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+# --- Queue -------------------------------------------------------------------
+
+class JobQueue:
+    """Thread-pool backed queue holding jobs until they expire."""
+
+    def __init__(self, max_workers: int = 4, retention_seconds: float = 3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qualigpt-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.retention_seconds = retention_seconds
+
+    def submit(self, fn: Callable[..., Dict[str, Any]], *args: Any, **kwargs: Any) -> Job:
+        job = Job()
+        self._evict_expired()
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable[..., Dict[str, Any]], args, kwargs) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+        except Exception as e:  # surface every failure through the status endpoint
+            job.error = str(e)
+            job._finish(FAILED)
+        else:
+            job._finish(DONE)
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, job in self._jobs.items()
+                if job.finished and job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -9,21 +9,263 @@ Each concrete provider implements:
 * `test_connection()` – perform a lightweight call to ensure the API key is valid.
 * `chat(system_message: str, user_message: str, *, max_tokens: int, temperature: float) -> str` –
   returns the completion text.
+* `chat_stream(...)` – same arguments, yields the completion text piece by piece as
+  the SDK's streaming mode delivers it (defaults to a single piece from `chat`).
+* `achat(...)` / `achat_stream(...)` – the `AsyncBaseProvider` coroutine / async
+  generator counterparts.  OpenAI, Anthropic, Gemini and the fake provider use their
+  SDK's async client, so one event loop can keep hundreds of calls in flight; other
+  providers fall back to running `chat` in a worker thread.  Async SDK clients (and
+  their `httpx.AsyncClient` pools) are created per event loop.
+
+`FakeProvider` (name ``"fake"``) answers without any network access: it returns
+well-formed theme tables derived deterministically from the request, after a
+configurable delay and with a configurable failure rate.  It is used by
+`benchmarks/bench_pipeline.py` to measure QualiGPT's own overhead offline.
+
+`RouterProvider` (name ``"router"``) spreads calls over several configured
+providers/models by weighted round-robin or observed latency, failing over to the
+next route when one errors or exceeds a latency SLO (its API key is the JSON
+route spec).
 
 Add further providers by subclassing `BaseProvider` and updating the `PROVIDER_MAP`.
+Cross-cutting behaviour (caching, ...) is layered on top of a provider by
+subclassing `ProviderWrapper`.
+
+OpenAI, Anthropic and the fake provider also implement a batch interface
+(`submit_batch`, `batch_state`, `batch_results`, `cancel_batch`); `run_batch()`
+submits many requests through it, polls until they are answered and returns the
+texts in order (used by the web app's ``batch_mode``).
+
+The system message is sent through each SDK's native parameter (OpenAI ``system``
+role, Anthropic ``system``, Gemini ``system_instruction``).  Gemini calls go
+through the public ``google.ai.generativelanguage`` client, one per API key.
+
+Prompt caching: callers put everything that repeats across calls (instructions,
+output format) in the system message and the per-call data in the user message.
+OpenAI and Gemini cache such a prefix automatically; Anthropic requests mark the
+system message as a ``cache_control`` breakpoint.  Providers only cache prefixes
+above a minimum length (1,024 tokens for most models).
+
+Providers pass the token usage the SDK reports for each call to `report_usage()`
+(including the input tokens served from the prompt cache);
+`collect_usage()` gathers it for the calls made in the current thread or asyncio task
+(used by `instrumentation.InstrumentedProvider`).
+
+`get_provider()` keeps constructed providers in a process-wide registry keyed by
+(provider, SHA-256 of the API key), so SDK clients and their keep-alive HTTP
+connections are reused across requests.  The OpenAI and Anthropic SDK clients
+share one tuned `httpx` connection pool per provider.
 """
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import Dict, Type
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from async_engine import get_engine
+
+# Connection pool shared by all SDK clients of one provider
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_KEEPALIVE_EXPIRY = 120.0
+HTTP_TIMEOUT = 600.0
+# The SDKs retry twice by default; retries belong to rate_limiting.RateLimitedProvider,
+# which waits on the shared token bucket and honours Retry-After between attempts
+SDK_MAX_RETRIES = 0
+
+_http_clients: Dict[str, object] = {}
+_http_clients_lock = threading.Lock()
+
+
+def shared_http_client(provider: str):
+    """Return the process-wide ``httpx.Client`` for ``provider`` (``None`` without httpx)."""
+    with _http_clients_lock:
+        client = _http_clients.get(provider)
+        if client is None:
+            try:
+                import httpx  # type: ignore  # installed with the openai/anthropic SDKs
+            except ModuleNotFoundError:
+                return None
+            client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=HTTP_TIMEOUT,
+                follow_redirects=True,
+            )
+            _http_clients[provider] = client
+        return client
+
+# Async clients are bound to the event loop they were created on
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, object]]" = weakref.WeakKeyDictionary()
+
+
+def shared_async_http_client(provider: str):
+    """Return the ``httpx.AsyncClient`` for ``provider`` on the running event loop (``None`` without httpx)."""
+    loop = asyncio.get_running_loop()
+    with _http_clients_lock:
+        clients = _async_http_clients.setdefault(loop, {})
+        client = clients.get(provider)
+        if client is None:
+            try:
+                import httpx  # type: ignore
+            except ModuleNotFoundError:
+                return None
+            client = clients[provider] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=HTTP_TIMEOUT,
+            )
+        return client
+
+# --- Usage -------------------------------------------------------------------
+
+class Usage:
+    """Tokens reported for the calls made while `collect_usage()` was active."""
+
+    __slots__ = ("input_tokens", "output_tokens", "cached_input_tokens", "reported")
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # Part of input_tokens served from the provider's prompt cache
+        self.cached_input_tokens = 0
+        self.reported = False
+
+
+# A context variable rather than a thread-local, so concurrent asyncio tasks on one
+# thread each collect their own call's usage
+_usage: ContextVar[Optional[Usage]] = ContextVar("qualigpt_usage", default=None)
+
+
+def report_usage(
+    input_tokens: Optional[int], output_tokens: Optional[int], cached_input_tokens: Optional[int] = None
+) -> None:
+    """Record the token usage of a completed call in the current context, if collected.
+
+    ``input_tokens`` counts every prompt token, including the ``cached_input_tokens``
+    read from the provider's prompt cache.
+    """
+    usage = _usage.get()
+    if usage is None:
+        return
+    usage.input_tokens += input_tokens or 0
+    usage.output_tokens += output_tokens or 0
+    usage.cached_input_tokens += cached_input_tokens or 0
+    usage.reported = True
+
+
+@contextmanager
+def collect_usage() -> Iterator[Usage]:
+    """Collect the usage that providers report in this thread or task inside the block."""
+    usage = Usage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _usage.reset(token)
+        except ValueError:
+            # An abandoned async generator is finalised in another context
+            pass
+
+# --- Batch -------------------------------------------------------------------
+
+# Longest interval between two polls of a running batch, and how long to wait for it at most
+# (OpenAI and Anthropic both complete batches within 24 hours)
+BATCH_POLL_SECONDS = float(os.environ.get("QUALIGPT_BATCH_POLL_SECONDS", 30))
+BATCH_TIMEOUT_SECONDS = float(os.environ.get("QUALIGPT_BATCH_TIMEOUT_SECONDS", 25 * 3600))
+
+BATCH_RUNNING = "running"
+BATCH_ENDED = "ended"
+BATCH_FAILED = "failed"
+
+
+class BatchRequest(NamedTuple):
+    custom_id: str
+    system_message: str
+    user_message: str
+
+
+class BatchError(RuntimeError):
+    """A batch could not be submitted or did not finish in time."""
+
+
+class LazySequence(Sequence):
+    """A sequence of ``length`` items computed by ``item(index)`` when read."""
+
+    def __init__(self, length: int, item: Callable[[int], str]):
+        self.length = length
+        self.item = item
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if not -self.length <= index < self.length:
+            raise IndexError(index)
+        return self.item(index % self.length)
 
 # --- Base --------------------------------------------------------------------
 
-class BaseProvider(ABC):
+class AsyncBaseProvider(ABC):
+    """Async interface of a provider: `achat` and `achat_stream`."""
+
+    @abstractmethod
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        """Return the chat completion text."""
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        """Yield the chat completion text incrementally (defaults to one piece from `achat`)."""
+        yield await self.achat(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+
+class BaseProvider(AsyncBaseProvider):
     """Abstract base class that all concrete providers must inherit from."""
 
     def __init__(self, api_key: str):
         self.api_key = api_key
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
 
     # ---------------------------------------------------------------------
     # Public API
@@ -44,6 +286,269 @@ class BaseProvider(ABC):
     ) -> str:
         """Return the chat completion text."""
 
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        """Yield the chat completion text incrementally.
+
+        Providers without a streaming API fall back to yielding the full `chat` result.
+        """
+        yield self.chat(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        """Providers without an async client run `chat` in a worker thread."""
+        # to_thread copies the context, so usage reported by `chat` is still collected
+        return await asyncio.to_thread(
+            self.chat,
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+    def _async_client(self, factory: Callable[[], object]):
+        """Return this provider's async SDK client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = factory()
+        return client
+
+    # ---------------------------------------------------------------------
+    # Batch API
+    # ---------------------------------------------------------------------
+    # Providers with an asynchronous batch interface set `supports_batch` and
+    # implement `submit_batch`, `batch_state`, `batch_results` and `cancel_batch`;
+    # `run_batch` drives them.
+    supports_batch = False
+    BATCH_MAX_REQUESTS = 10_000
+    BATCH_MAX_BYTES = 100 * 1024 * 1024
+
+    def submit_batch(
+        self,
+        requests: Sequence["BatchRequest"],
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        """Submit ``requests`` as one batch and return its id."""
+        raise BatchError(f"{type(self).__name__} has no batch API")
+
+    def batch_state(self, batch_id: str) -> str:
+        """Return `BATCH_RUNNING`, `BATCH_ENDED` or `BATCH_FAILED`."""
+        raise BatchError(f"{type(self).__name__} has no batch API")
+
+    def batch_results(self, batch_id: str) -> Dict[str, str]:
+        """Return the completion text of each request of an ended batch that succeeded, by custom id."""
+        raise BatchError(f"{type(self).__name__} has no batch API")
+
+    def cancel_batch(self, batch_id: str) -> None:
+        raise BatchError(f"{type(self).__name__} has no batch API")
+
+    def run_batch(
+        self,
+        system_message: str,
+        user_messages: Sequence[str],
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        poll_seconds: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Optional[str]]:
+        """Answer ``user_messages`` through the batch API and return the texts in order.
+
+        The requests are split into batches of at most `BATCH_MAX_REQUESTS` requests
+        and `BATCH_MAX_BYTES` of message text; ``user_messages`` may be a lazy
+        sequence, each message is only rendered while its batch is built.  All
+        batches are submitted before polling starts.  Requests that failed (or
+        whose batch failed) are ``None``; the caller decides whether to retry them
+        in real time.  Raises `BatchError` when the batches outlive ``timeout``.
+        """
+        poll_seconds = BATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+        timeout = BATCH_TIMEOUT_SECONDS if timeout is None else timeout
+        options = dict(model=model, max_tokens=max_tokens, temperature=temperature)
+
+        batch_ids: List[str] = []
+        chunk: List[BatchRequest] = []
+        chunk_bytes = 0
+        for index in range(len(user_messages)):
+            user_message = user_messages[index]
+            size = len(system_message) + len(user_message)
+            if chunk and (len(chunk) >= self.BATCH_MAX_REQUESTS or chunk_bytes + size > self.BATCH_MAX_BYTES):
+                batch_ids.append(self.submit_batch(chunk, **options))
+                chunk, chunk_bytes = [], 0
+            chunk.append(BatchRequest(f"req-{index}", system_message, user_message))
+            chunk_bytes += size
+        if chunk:
+            batch_ids.append(self.submit_batch(chunk, **options))
+        del chunk
+
+        deadline = time.monotonic() + timeout
+        states: Dict[str, str] = {}
+        pending = list(batch_ids)
+        # Poll quickly at first (small batches end within seconds), then back off
+        delay = min(1.0, poll_seconds)
+        while pending:
+            for batch_id in list(pending):
+                state = self.batch_state(batch_id)
+                if state != BATCH_RUNNING:
+                    states[batch_id] = state
+                    pending.remove(batch_id)
+            if not pending:
+                break
+            if time.monotonic() > deadline:
+                for batch_id in pending:
+                    try:
+                        self.cancel_batch(batch_id)
+                    except Exception:
+                        pass
+                raise BatchError(f"{len(pending)} batch(es) still running after {timeout:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, poll_seconds)
+
+        answers: List[Optional[str]] = [None] * len(user_messages)
+        for batch_id in batch_ids:
+            if states[batch_id] != BATCH_ENDED:
+                continue
+            for custom_id, text in self.batch_results(batch_id).items():
+                answers[int(custom_id.rsplit("-", 1)[1])] = text
+        return answers
+
+
+class ProviderWrapper(BaseProvider):
+    """Provider that delegates to another provider; subclasses override `chat`."""
+
+    def __init__(self, inner: BaseProvider):
+        super().__init__(inner.api_key)
+        self.inner = inner
+
+    @property
+    def name(self) -> str:
+        """Name of the innermost concrete provider class (e.g. ``OpenAIProvider``)."""
+        inner = self.inner
+        while isinstance(inner, ProviderWrapper):
+            inner = inner.inner
+        return type(inner).__name__
+
+    def test_connection(self) -> None:
+        self.inner.test_connection()
+
+    @property
+    def supports_batch(self) -> bool:  # type: ignore[override]
+        return self.inner.supports_batch
+
+    def run_batch(
+        self,
+        system_message: str,
+        user_messages: Sequence[str],
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        poll_seconds: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Optional[str]]:
+        return self.inner.run_batch(
+            system_message,
+            user_messages,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            poll_seconds=poll_seconds,
+            timeout=timeout,
+        )
+
+    def chat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        return self.inner.chat(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        return self.inner.chat_stream(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        return await self.inner.achat(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+    def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        return self.inner.achat_stream(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
 # -----------------------------------------------------------------------------
 # OpenAI
 # -----------------------------------------------------------------------------
@@ -55,7 +560,9 @@ class OpenAIProvider(BaseProvider):
         super().__init__(api_key)
         from openai import OpenAI  # type: ignore  # local import to avoid hard dependency when unused
 
-        self._client = OpenAI(api_key=api_key)
+        self._client = OpenAI(
+            api_key=api_key, http_client=shared_http_client("openai"), max_retries=SDK_MAX_RETRIES
+        )
 
     def test_connection(self) -> None:
         # 1-token ping keeps cost negligible
@@ -89,8 +596,183 @@ class OpenAIProvider(BaseProvider):
             max_tokens=max_tokens,
             temperature=temperature,
         )
+        if resp.usage is not None:
+            _report_openai_usage(resp.usage)
+        return resp.choices[0].message.content
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "gpt-4o",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        model_to_use = model if model != "auto" else "gpt-4o"
+
+        stream = self._client.chat.completions.create(
+            model=model_to_use,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message},
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            # The last chunk then carries the usage of the whole call (and no choices)
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None) is not None:
+                _report_openai_usage(chunk.usage)
+
+    def _aclient(self):
+        from openai import AsyncOpenAI  # type: ignore
+
+        return self._async_client(
+            lambda: AsyncOpenAI(
+                api_key=self.api_key,
+                http_client=shared_async_http_client("openai"),
+                max_retries=SDK_MAX_RETRIES,
+            )
+        )
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "gpt-4o",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        model_to_use = model if model != "auto" else "gpt-4o"
+
+        resp = await self._aclient().chat.completions.create(
+            model=model_to_use,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message},
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        if resp.usage is not None:
+            _report_openai_usage(resp.usage)
         return resp.choices[0].message.content
 
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "gpt-4o",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        model_to_use = model if model != "auto" else "gpt-4o"
+
+        stream = await self._aclient().chat.completions.create(
+            model=model_to_use,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message},
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None) is not None:
+                _report_openai_usage(chunk.usage)
+
+    # Batch API: a JSONL file of /v1/chat/completions requests, answered within 24 hours
+    supports_batch = True
+    BATCH_MAX_REQUESTS = 50_000
+    BATCH_MAX_BYTES = 180 * 1024 * 1024  # input files are limited to 200 MB
+
+    def submit_batch(
+        self,
+        requests: Sequence[BatchRequest],
+        *,
+        model: str = "gpt-4o",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        model_to_use = model if model != "auto" else "gpt-4o"
+
+        lines = [
+            json.dumps({
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model_to_use,
+                    "messages": [
+                        {"role": "system", "content": request.system_message},
+                        {"role": "user", "content": request.user_message},
+                    ],
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+            })
+            for request in requests
+        ]
+        upload = self._client.files.create(
+            file=("qualigpt-batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = self._client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def batch_state(self, batch_id: str) -> str:
+        status = self._client.batches.retrieve(batch_id).status
+        # Expired and cancelled batches still return the requests that completed
+        if status in ("completed", "expired", "cancelled"):
+            return BATCH_ENDED
+        if status == "failed":
+            return BATCH_FAILED
+        return BATCH_RUNNING
+
+    def batch_results(self, batch_id: str) -> Dict[str, str]:
+        batch = self._client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return {}
+        texts: Dict[str, str] = {}
+        for line in self._client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            body = response["body"]
+            usage = body.get("usage") or {}
+            report_usage(
+                usage.get("prompt_tokens"),
+                usage.get("completion_tokens"),
+                (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+            )
+            texts[entry["custom_id"]] = body["choices"][0]["message"]["content"]
+        return texts
+
+    def cancel_batch(self, batch_id: str) -> None:
+        self._client.batches.cancel(batch_id)
+
+def _report_openai_usage(usage) -> None:
+    details = getattr(usage, "prompt_tokens_details", None)
+    report_usage(usage.prompt_tokens, usage.completion_tokens, getattr(details, "cached_tokens", None))
+
 # -----------------------------------------------------------------------------
 # Anthropic / Claude
 # -----------------------------------------------------------------------------
@@ -100,7 +782,9 @@ class AnthropicProvider(BaseProvider):
         super().__init__(api_key)
         import anthropic  # type: ignore
 
-        self._client = anthropic.Anthropic(api_key=api_key)
+        self._client = anthropic.Anthropic(
+            api_key=api_key, http_client=shared_http_client("anthropic"), max_retries=SDK_MAX_RETRIES
+        )
 
     def test_connection(self) -> None:
         _ = self._client.messages.create(
@@ -123,33 +807,202 @@ class AnthropicProvider(BaseProvider):
         # Use provided model or default
         model_to_use = model if model != "auto" else "claude-3-5-sonnet-20241022"
 
-        msgs = [
-            {"role": "user", "content": f"System: {system_message}\n\nUser: {user_message}"},
-        ]
         resp = self._client.messages.create(
             model=model_to_use,
-            messages=msgs,
+            **_anthropic_prompt(system_message, user_message),
             max_tokens=max_tokens,
             temperature=temperature,
         )
+        _report_anthropic_usage(resp.usage)
         # anthropic response returns resp.content (list of blocks)
         return "".join(block.text for block in resp.content if hasattr(block, "text"))
 
-# -----------------------------------------------------------------------------
-# Google / Gemini 2.5 Flash
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "claude-3-5-sonnet-20241022",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        model_to_use = model if model != "auto" else "claude-3-5-sonnet-20241022"
+
+        with self._client.messages.stream(
+            model=model_to_use,
+            **_anthropic_prompt(system_message, user_message),
+            max_tokens=max_tokens,
+            temperature=temperature,
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+            usage = stream.get_final_message().usage
+            _report_anthropic_usage(usage)
+
+    def _aclient(self):
+        import anthropic  # type: ignore
+
+        return self._async_client(
+            lambda: anthropic.AsyncAnthropic(
+                api_key=self.api_key,
+                http_client=shared_async_http_client("anthropic"),
+                max_retries=SDK_MAX_RETRIES,
+            )
+        )
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "claude-3-5-sonnet-20241022",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        model_to_use = model if model != "auto" else "claude-3-5-sonnet-20241022"
+
+        resp = await self._aclient().messages.create(
+            model=model_to_use,
+            **_anthropic_prompt(system_message, user_message),
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        _report_anthropic_usage(resp.usage)
+        return "".join(block.text for block in resp.content if hasattr(block, "text"))
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "claude-3-5-sonnet-20241022",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        model_to_use = model if model != "auto" else "claude-3-5-sonnet-20241022"
+
+        async with self._aclient().messages.stream(
+            model=model_to_use,
+            **_anthropic_prompt(system_message, user_message),
+            max_tokens=max_tokens,
+            temperature=temperature,
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            usage = (await stream.get_final_message()).usage
+            _report_anthropic_usage(usage)
+
+    # Message Batches API: up to 100,000 requests, answered within 24 hours
+    supports_batch = True
+    BATCH_MAX_REQUESTS = 100_000
+    BATCH_MAX_BYTES = 200 * 1024 * 1024  # requests are limited to 256 MB
+
+    def submit_batch(
+        self,
+        requests: Sequence[BatchRequest],
+        *,
+        model: str = "claude-3-5-sonnet-20241022",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        model_to_use = model if model != "auto" else "claude-3-5-sonnet-20241022"
+
+        batch = self._client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": request.custom_id,
+                    "params": {
+                        "model": model_to_use,
+                        **_anthropic_prompt(request.system_message, request.user_message),
+                        "max_tokens": max_tokens,
+                        "temperature": temperature,
+                    },
+                }
+                for request in requests
+            ]
+        )
+        return batch.id
+
+    def batch_state(self, batch_id: str) -> str:
+        # Cancelled and expired requests are reported per request once the batch has ended
+        if self._client.messages.batches.retrieve(batch_id).processing_status == "ended":
+            return BATCH_ENDED
+        return BATCH_RUNNING
+
+    def batch_results(self, batch_id: str) -> Dict[str, str]:
+        texts: Dict[str, str] = {}
+        for entry in self._client.messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                continue
+            message = entry.result.message
+            _report_anthropic_usage(message.usage)
+            texts[entry.custom_id] = "".join(block.text for block in message.content if hasattr(block, "text"))
+        return texts
+
+    def cancel_batch(self, batch_id: str) -> None:
+        self._client.messages.batches.cancel(batch_id)
+
+def _anthropic_prompt(system_message: str, user_message: str) -> dict:
+    """``system`` and ``messages`` of a request.
+
+    The system message goes into the native ``system`` parameter, marked as a
+    prompt-cache breakpoint: it is the prefix shared by every call of a run.
+    """
+    prompt: dict = {"messages": [{"role": "user", "content": user_message}]}
+    if system_message:
+        prompt["system"] = [{"type": "text", "text": system_message, "cache_control": {"type": "ephemeral"}}]
+    return prompt
+
+
+def _report_anthropic_usage(usage) -> None:
+    # input_tokens excludes the tokens read from or written to the prompt cache
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    report_usage(usage.input_tokens + cache_read + cache_write, usage.output_tokens, cache_read)
+
+# -----------------------------------------------------------------------------
+# Google / Gemini 2.5 Flash
 # -----------------------------------------------------------------------------
 
 class GeminiProvider(BaseProvider):
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        import google.generativeai as genai  # type: ignore
+        # The public GAPIC client that google-generativeai wraps: unlike genai.configure(),
+        # which sets one key for the whole process, each client carries its own key
+        from google.ai import generativelanguage as glm  # type: ignore
 
-        genai.configure(api_key=api_key)
-        self._genai = genai
+        self._glm = glm
+        self._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
 
-    def test_connection(self) -> None:
-        model = self._genai.GenerativeModel("gemini-2.5-flash")
-        _ = model.generate_content("ping", generation_config={"max_output_tokens": 1})
+    def _aclient(self):
+        return self._async_client(
+            lambda: self._glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+        )
+
+    def _request(
+        self,
+        model_name: str,
+        system_message: str,
+        user_message: str,
+        max_tokens: int,
+        temperature: Optional[float] = None,
+    ):
+        """Build the GenerateContentRequest, with ``system_message`` as the system instruction."""
+        glm = self._glm
+        # Built from the raw protobuf classes: nesting proto-plus wrappers costs about
+        # three times as much per call
+        content, part = glm.Content.pb(), glm.Part.pb()
+        request = glm.GenerateContentRequest.pb()(
+            model=model_name if "/" in model_name else f"models/{model_name}",
+            contents=[content(role="user", parts=[part(text=user_message)])],
+            generation_config=glm.GenerationConfig.pb()(max_output_tokens=max_tokens, temperature=temperature),
+        )
+        if system_message:
+            request.system_instruction.parts.add(text=system_message)
+        return glm.GenerateContentRequest.wrap(request)
+
+    def test_connection(self, model: str = "gemini-2.5-flash") -> None:
+        self._client.generate_content(self._request(model, "", "ping", 1), retry=None)
 
     def chat(
         self,
@@ -162,14 +1015,97 @@ class GeminiProvider(BaseProvider):
     ) -> str:
         # Use provided model or default
         model_to_use = model if model != "auto" else "gemini-2.5-flash"
-        
-        gen_model = self._genai.GenerativeModel(model_to_use)
-        prompt = f"{system_message}\n\n{user_message}"
-        resp = gen_model.generate_content(prompt, generation_config={
-            "temperature": temperature,
-            "max_output_tokens": max_tokens,
-        })
-        return resp.text
+
+        request = self._request(model_to_use, system_message, user_message, max_tokens, temperature)
+        # retry=None: the client's own retries would bypass RateLimitedProvider
+        resp = self._client.generate_content(request, retry=None)
+        _report_gemini_usage(resp)
+        return _gemini_text(resp)
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "gemini-2.5-flash",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        model_to_use = model if model != "auto" else "gemini-2.5-flash"
+
+        request = self._request(model_to_use, system_message, user_message, max_tokens, temperature)
+        last = None
+        for chunk in self._client.stream_generate_content(request, retry=None):
+            last = chunk
+            text = _gemini_text(chunk, partial=True)
+            if text:
+                yield text
+        # The final chunk carries the usage of the whole response
+        if last is not None:
+            _report_gemini_usage(last)
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "gemini-2.5-flash",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        model_to_use = model if model != "auto" else "gemini-2.5-flash"
+
+        request = self._request(model_to_use, system_message, user_message, max_tokens, temperature)
+        resp = await self._aclient().generate_content(request, retry=None)
+        _report_gemini_usage(resp)
+        return _gemini_text(resp)
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "gemini-2.5-flash",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        model_to_use = model if model != "auto" else "gemini-2.5-flash"
+
+        request = self._request(model_to_use, system_message, user_message, max_tokens, temperature)
+        last = None
+        async for chunk in await self._aclient().stream_generate_content(request, retry=None):
+            last = chunk
+            text = _gemini_text(chunk, partial=True)
+            if text:
+                yield text
+        if last is not None:
+            _report_gemini_usage(last)
+
+
+def _gemini_text(resp, *, partial: bool = False) -> str:
+    """Return the text of the first candidate (what google-generativeai's ``resp.text`` does).
+
+    A complete response without text (blocked prompt or candidate) raises
+    ``ValueError``; a stream chunk without text (``partial``) is just empty.
+    """
+    parts = resp.candidates[0].content.parts if resp.candidates else []
+    if not parts and not partial:
+        if resp.candidates:
+            reason = resp.candidates[0].finish_reason.name
+        else:
+            reason = resp.prompt_feedback.block_reason.name
+        raise ValueError(f"Gemini returned no text (finish reason: {reason})")
+    return "".join(part.text for part in parts)
+
+
+def _report_gemini_usage(resp) -> None:
+    metadata = getattr(resp, "usage_metadata", None)
+    if metadata is not None:
+        report_usage(
+            metadata.prompt_token_count,
+            metadata.candidates_token_count,
+            getattr(metadata, "cached_content_token_count", None),
+        )
 
 # -----------------------------------------------------------------------------
 # DeepSeek (placeholder implementation)
@@ -195,6 +1131,470 @@ class DeepSeekProvider(BaseProvider):
     ) -> str:
         raise NotImplementedError("DeepSeek API integration is not yet implemented.")
 
+# -----------------------------------------------------------------------------
+# Fake (offline benchmarking)
+# -----------------------------------------------------------------------------
+
+FAKE_THEMES = (
+    "Work-life balance", "Flexible schedules", "Communication barriers", "Team cohesion",
+    "Manager support", "Productivity", "Commuting", "Isolation", "Career development",
+    "Technology issues", "Family responsibilities", "Trust and autonomy", "Workload",
+    "Wellbeing", "Meeting fatigue", "Onboarding", "Recognition", "Customer service",
+    "Pricing", "Product quality", "Delivery times", "Community", "Privacy concerns",
+    "Learning and training",
+)
+
+
+class FakeProviderError(RuntimeError):
+    """Injected failure; ``status_code`` 503 makes it retryable like a real overload."""
+
+    status_code = 503
+
+
+class FakeProvider(BaseProvider):
+    """Deterministic stand-in for an LLM API.
+
+    The table for a request depends only on its system and user message: themes are
+    drawn from `FAKE_THEMES` with an RNG seeded by the messages' SHA-256, quotes are
+    taken from the ``[participant] text`` lines (or the ``"quote" [participant]`` pairs
+    and ``{Qn}`` references of partial tables) in the request, and the number of themes is read from the prompt.
+
+    Latency, jitter and failures are configured through the environment when the
+    provider is built (``QUALIGPT_FAKE_LATENCY`` seconds per call,
+    ``QUALIGPT_FAKE_JITTER`` extra uniformly random seconds,
+    ``QUALIGPT_FAKE_FAILURE_RATE`` probability of a `FakeProviderError`) and drawn
+    from an RNG seeded with ``QUALIGPT_FAKE_SEED``.
+    """
+
+    DEFAULT_NUM_THEMES = 5
+
+    _CODED_LINE = re.compile(r"^\[([^\]\n]+)\] (.+)$", re.MULTILINE)
+    _QUOTE = re.compile(r'"([^"\n]+)"\s*\[([^\]\n]+)\]')
+    _QUOTE_REF = re.compile(r"\{Q\d+\}")
+    _NUM_THEMES = re.compile(r"(?:top|the) (\d+) (?:most common )?key themes")
+
+    def __init__(self, api_key: str):
+        super().__init__(api_key)
+        self.latency = float(os.environ.get("QUALIGPT_FAKE_LATENCY", 0.0))
+        self.jitter = float(os.environ.get("QUALIGPT_FAKE_JITTER", 0.0))
+        self.failure_rate = float(os.environ.get("QUALIGPT_FAKE_FAILURE_RATE", 0.0))
+        self._rng = random.Random(int(os.environ.get("QUALIGPT_FAKE_SEED", 0)))
+        self._rng_lock = threading.Lock()
+        self._batches: Dict[str, Tuple[float, Dict[str, str]]] = {}
+
+    def test_connection(self) -> None:
+        pass
+
+    def chat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        return "".join(self.chat_stream(system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature))
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        delay, failed = self._draw()
+        time.sleep(delay)
+        if failed:
+            raise FakeProviderError("Injected failure of the fake provider")
+        for line in self.table_lines(system_message, user_message):
+            yield line + "\n"
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        pieces = []
+        async for piece in self.achat_stream(system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature):
+            pieces.append(piece)
+        return "".join(pieces)
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        delay, failed = self._draw()
+        await asyncio.sleep(delay)
+        if failed:
+            raise FakeProviderError("Injected failure of the fake provider")
+        for line in self.table_lines(system_message, user_message):
+            yield line + "\n"
+
+    # In-memory batch API: a batch ends `latency` seconds after it was submitted and
+    # each of its requests fails with probability `failure_rate`
+    supports_batch = True
+
+    def submit_batch(
+        self,
+        requests: Sequence[BatchRequest],
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        delay, _ = self._draw()
+        results: Dict[str, str] = {}
+        for request in requests:
+            if self._draw()[1]:
+                continue
+            results[request.custom_id] = "".join(
+                line + "\n" for line in self.table_lines(request.system_message, request.user_message)
+            )
+        batch_id = f"fakebatch-{hashlib.sha256(os.urandom(16)).hexdigest()[:16]}"
+        with self._rng_lock:
+            self._batches[batch_id] = (time.monotonic() + delay, results)
+        return batch_id
+
+    def batch_state(self, batch_id: str) -> str:
+        ends_at, _ = self._batches[batch_id]
+        return BATCH_ENDED if time.monotonic() >= ends_at else BATCH_RUNNING
+
+    def batch_results(self, batch_id: str) -> Dict[str, str]:
+        with self._rng_lock:
+            _, results = self._batches.pop(batch_id)
+        return results
+
+    def cancel_batch(self, batch_id: str) -> None:
+        with self._rng_lock:
+            self._batches.pop(batch_id, None)
+
+    def _draw(self) -> Tuple[float, bool]:
+        """Return the delay and whether the next call fails."""
+        with self._rng_lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            failed = self._rng.random() < self.failure_rate
+        return delay, failed
+
+    def table_lines(self, system_message: str, user_message: str) -> List[str]:
+        """Return the lines of the table answered to a request (same request, same table)."""
+        digest = hashlib.sha256((system_message + "\0" + user_message).encode("utf-8")).digest()
+        rng = random.Random(digest)
+        match = self._NUM_THEMES.search(system_message) or self._NUM_THEMES.search(user_message)
+        num_themes = min(int(match.group(1)) if match else self.DEFAULT_NUM_THEMES, len(FAKE_THEMES))
+
+        quotes = [(pid, text) for text, pid in self._QUOTE.findall(user_message)]
+        quotes += self._CODED_LINE.findall(user_message)
+        quotes = [(pid, '"%s" [%s]' % (text.strip().replace("|", "/").replace('"', "'")[:200], pid)) for pid, text in quotes]
+        # Merges with quote references must answer with the references
+        quotes += [(ref, ref) for ref in self._QUOTE_REF.findall(user_message)]
+
+        lines = ["**********", "| Theme | Description | Quotes | Participant Count |", "|---|---|---|---|"]
+        for theme in rng.sample(FAKE_THEMES, num_themes):
+            chosen = rng.sample(quotes, min(len(quotes), 2)) if quotes else [("P0", '"No quote available" [P0]')]
+            quote_text = " ".join(quote for _, quote in chosen)
+            participants = len({pid for pid, _ in chosen})
+            lines.append(f"| {theme} | Participants talk about {theme.lower()}. | {quote_text} | {participants} |")
+        lines.append("**********")
+        return lines
+
+# -----------------------------------------------------------------------------
+# Router (load balancing and failover over several providers)
+# -----------------------------------------------------------------------------
+
+# A call slower than this (seconds; time to the first piece for streams) counts as
+# a failure of its route, and routes that fail are skipped for a cool-down period
+ROUTER_LATENCY_SLO = float(os.environ.get("QUALIGPT_ROUTER_LATENCY_SLO", 180))
+ROUTER_COOLDOWN_SECONDS = float(os.environ.get("QUALIGPT_ROUTER_COOLDOWN", 30))
+ROUTER_MAX_COOLDOWN_SECONDS = 600.0
+# Weight of the newest call in a route's moving-average latency
+ROUTER_LATENCY_ALPHA = 0.3
+
+
+class RouteSloExceeded(RuntimeError):
+    """A routed call did not answer within the router's latency SLO."""
+
+    status_code = 504
+
+
+class Route:
+    """One provider/model/API key of a `RouterProvider` and its observed health."""
+
+    def __init__(self, provider_name: str, model: Optional[str], api_key: str, weight: float):
+        from rate_limiting import RateLimitedProvider  # local import: rate_limiting imports this module
+
+        if provider_name not in PROVIDER_MAP or provider_name == "router":
+            raise ValueError(f"Unknown router provider: {provider_name!r}")
+        self.provider_name = provider_name
+        self.model = model or None
+        self.weight = weight
+        # Each route keeps its provider's rate limits; instead of retrying, the router fails over
+        self.provider = RateLimitedProvider(get_provider(provider_name, api_key), provider_name, max_retries=0)
+        self.latency: Optional[float] = None
+        self.inflight = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.current_weight = 0.0
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "provider": self.provider_name,
+            "model": self.model or "auto",
+            "weight": self.weight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "inflight": self.inflight,
+            "cooling_down": self.cooldown_until > time.monotonic(),
+        }
+
+
+class RouterProvider(BaseProvider):
+    """Spread calls over several providers, models and API keys, failing over between them.
+
+    Its API key is a JSON route spec::
+
+        {"strategy": "weighted",          # or "latency"
+         "latency_slo": 180,              # seconds, optional
+         "routes": [{"provider": "openai", "model": "gpt-4o-mini", "api_key": "sk-...", "weight": 2},
+                    {"provider": "anthropic", "api_key": "sk-ant-..."}]}
+
+    ``weighted`` picks routes by smooth weighted round-robin; ``latency`` picks the
+    route with the lowest moving-average latency times its calls in flight (routes
+    without measurements first).  A call that fails, or exceeds the latency SLO
+    (time to first piece for streams), is abandoned and retried on the next route;
+    the failed route then cools down for ``QUALIGPT_ROUTER_COOLDOWN`` seconds,
+    doubling on consecutive failures.  Streams fail over only until their first
+    piece.  The ``model`` argument of the calls is
+    ignored: each route uses its own model (or its provider's default).
+    """
+
+    STRATEGIES = ("weighted", "latency")
+
+    def __init__(self, api_key: str):
+        super().__init__(api_key)
+        try:
+            spec = json.loads(api_key)
+        except ValueError:
+            raise ValueError("The router's API key must be a JSON route spec") from None
+        self.strategy = spec.get("strategy", "weighted")
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {self.strategy!r}")
+        self.latency_slo = float(spec.get("latency_slo") or ROUTER_LATENCY_SLO)
+        self.routes = [
+            Route(route["provider"].lower(), route.get("model"), route["api_key"], float(route.get("weight", 1)))
+            for route in spec.get("routes", [])
+        ]
+        if not self.routes:
+            raise ValueError("The router needs at least one route")
+        self._lock = threading.Lock()
+
+    def test_connection(self) -> None:
+        for route in self.routes:
+            route.provider.test_connection()
+
+    def route_stats(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [route.stats() for route in self.routes]
+
+    # --- Routing ---------------------------------------------------------
+
+    def _plan(self) -> List[Route]:
+        """Routes in the order to try them: the chosen one, the other healthy ones, the cooling ones."""
+        with self._lock:
+            now = time.monotonic()
+            healthy = [route for route in self.routes if route.cooldown_until <= now]
+            cooling = sorted((route for route in self.routes if route.cooldown_until > now), key=lambda r: r.cooldown_until)
+            if not healthy:
+                return cooling
+            if self.strategy == "latency":
+                chosen = min(
+                    healthy,
+                    key=lambda r: (r.latency is not None, (r.latency or 0.0) * (r.inflight + 1), r.inflight),
+                )
+            else:
+                total = sum(route.weight for route in healthy)
+                for route in healthy:
+                    route.current_weight += route.weight
+                chosen = max(healthy, key=lambda r: r.current_weight)
+                chosen.current_weight -= total
+            return [chosen] + [route for route in healthy if route is not chosen] + cooling
+
+    def _start(self, route: Route) -> float:
+        with self._lock:
+            route.inflight += 1
+        return time.perf_counter()
+
+    def _finish(
+        self,
+        route: Route,
+        started: float,
+        error: Optional[BaseException] = None,
+        *,
+        latency: Optional[float] = None,
+        abandoned: bool = False,
+    ) -> None:
+        """Account for a finished attempt on ``route``.
+
+        ``latency`` is the time to the first piece for streams (default: the whole
+        call).  An ``abandoned`` attempt (closed stream, cancelled task) only releases
+        its in-flight slot: it says nothing about the route's health.
+        """
+        if latency is None:
+            latency = time.perf_counter() - started
+        with self._lock:
+            route.inflight -= 1
+            if abandoned:
+                return
+            route.calls += 1
+            if error is None and latency > self.latency_slo:
+                error = RouteSloExceeded(f"{route.provider_name} took {latency:.1f}s")
+            if error is None:
+                route.consecutive_failures = 0
+            else:
+                route.failures += 1
+                route.consecutive_failures += 1
+                cooldown = ROUTER_COOLDOWN_SECONDS * 2 ** (route.consecutive_failures - 1)
+                route.cooldown_until = time.monotonic() + min(cooldown, ROUTER_MAX_COOLDOWN_SECONDS)
+            if error is None or isinstance(error, RouteSloExceeded):
+                sample = min(latency, self.latency_slo)
+                route.latency = sample if route.latency is None else (
+                    ROUTER_LATENCY_ALPHA * sample + (1 - ROUTER_LATENCY_ALPHA) * route.latency
+                )
+
+    def _slo_error(self, route: Route) -> RouteSloExceeded:
+        return RouteSloExceeded(f"{route.provider_name} did not answer within {self.latency_slo:.0f}s")
+
+    # --- Calls -----------------------------------------------------------
+    # Every attempt ends in `_finish` (try/finally), also when the caller closes the
+    # stream or cancels the task, so a route's in-flight count never leaks.  The sync
+    # calls run the async ones on the shared event loop: only there can a route that
+    # exceeds the SLO be abandoned (its request cancelled) and the next one tried.
+
+    def chat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        return get_engine().run(
+            self.achat(system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature)
+        )
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        engine = get_engine()
+        pieces = self.achat_stream(
+            system_message, user_message, model=model, max_tokens=max_tokens, temperature=temperature
+        )
+        try:
+            while True:
+                try:
+                    yield engine.run(pieces.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            engine.run(pieces.aclose())
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        last_error: Optional[BaseException] = None
+        for route in self._plan():
+            started = self._start(route)
+            error: Optional[BaseException] = None
+            done = False
+            try:
+                text = await asyncio.wait_for(
+                    route.provider.achat(
+                        system_message, user_message, model=route.model or "auto", max_tokens=max_tokens, temperature=temperature
+                    ),
+                    self.latency_slo,
+                )
+                done = True
+            except asyncio.TimeoutError:
+                error = last_error = self._slo_error(route)
+            except Exception as exc:
+                error = last_error = exc
+            finally:
+                self._finish(route, started, error, abandoned=not done and error is None)
+            if done:
+                return text
+        raise last_error  # type: ignore[misc]
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        last_error: Optional[BaseException] = None
+        for route in self._plan():
+            started = self._start(route)
+            pieces = route.provider.achat_stream(
+                system_message, user_message, model=route.model or "auto", max_tokens=max_tokens, temperature=temperature
+            )
+            error: Optional[BaseException] = None
+            latency: Optional[float] = None
+            done = False
+            try:
+                try:
+                    first = await asyncio.wait_for(pieces.__anext__(), self.latency_slo)
+                except StopAsyncIteration:
+                    first = None
+                except asyncio.TimeoutError:
+                    error = last_error = self._slo_error(route)
+                    continue
+                except Exception as exc:
+                    error = last_error = exc
+                    continue
+                latency = time.perf_counter() - started
+                if first is not None:
+                    yield first
+                    async for piece in pieces:
+                        yield piece
+                done = True
+                return
+            except Exception as exc:
+                error = exc
+                raise
+            finally:
+                await pieces.aclose()
+                self._finish(route, started, error, latency=latency, abandoned=not done and error is None)
+        raise last_error  # type: ignore[misc]
+
 # -----------------------------------------------------------------------------
 # Factory
 # -----------------------------------------------------------------------------
@@ -204,10 +1604,64 @@ PROVIDER_MAP: Dict[str, Type[BaseProvider]] = {
     "anthropic": AnthropicProvider,
     "gemini": GeminiProvider,
     "deepseek": DeepSeekProvider,
+    "fake": FakeProvider,
+    "router": RouterProvider,
 }
 
 
-def get_provider(name: str, api_key: str) -> BaseProvider:
-    """Return an instantiated provider.  Defaults to OpenAI on unknown name."""
+class ProviderRegistry:
+    """Bounded LRU of provider instances that drops entries idle for too long."""
+
+    def __init__(self, max_entries: int = 64, idle_seconds: float = 900):
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[BaseProvider, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name: str, api_key: str) -> Tuple[str, str]:
+        # Never keep raw API keys as dictionary keys
+        return name, hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def get(self, name: str, api_key: str, provider_cls: Type[BaseProvider]) -> BaseProvider:
+        key = self.key(name, api_key)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None and type(entry[0]) is provider_cls:
+                self._entries[key] = (entry[0], now)
+                self._entries.move_to_end(key)
+                return entry[0]
+        # Construct outside the lock: SDK clients can be slow to build
+        provider = provider_cls(api_key)
+        with self._lock:
+            self._entries[key] = (provider, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return provider
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_idle(self, now: float) -> None:
+        idle = [key for key, (_, last_used) in self._entries.items() if now - last_used > self.idle_seconds]
+        for key in idle:
+            del self._entries[key]
+
+
+provider_registry = ProviderRegistry()
+
+
+def get_provider(name: str, api_key: str, *, reuse: bool = True) -> BaseProvider:
+    """Return an instantiated provider.  Defaults to OpenAI on unknown name.
+
+    With ``reuse`` (the default) a provider already built for the same name and
+    API key is returned, keeping its SDK client and HTTP connections warm.
+    """
     provider_cls = PROVIDER_MAP.get(name.lower(), OpenAIProvider)
-    return provider_cls(api_key) 
\ No newline at end of file
+    if not reuse:
+        return provider_cls(api_key)
+    return provider_registry.get(name.lower(), api_key, provider_cls)
@@ -0,0 +1,105 @@
+"""model_registry.py
+
+Context-window and output limits of the models QualiGPT offers, and the budgeting
+helper that turns them into a per-segment data budget.
+
+`segment_token_budget(provider, model, system_message, prompt, max_tokens)` returns
+how many tokens of dataset text fit into one call:
+
+    context window − system message − instruction prompt − reserved output − margin
+
+so segments are as large as the selected model allows (fewer paid calls and merge
+work) without overflowing its context.  Unknown models fall back to the provider's
+default model, then to a conservative generic entry.
+"""
+from __future__ import annotations
+
+from typing import Dict, NamedTuple, Optional
+
+from token_counting import TokenCounter, get_token_counter
+
+
+class ModelSpec(NamedTuple):
+    context_window: int
+    max_output_tokens: int
+
+
+MODEL_REGISTRY: Dict[str, ModelSpec] = {
+    # OpenAI
+    "gpt-4o": ModelSpec(128_000, 16_384),
+    "gpt-4o-mini": ModelSpec(128_000, 16_384),
+    "gpt-4-turbo": ModelSpec(128_000, 4_096),
+    "gpt-3.5-turbo": ModelSpec(16_385, 4_096),
+    # Anthropic
+    "claude-3-5-sonnet-20241022": ModelSpec(200_000, 8_192),
+    "claude-3-haiku-20240307": ModelSpec(200_000, 4_096),
+    "claude-3-opus-20240229": ModelSpec(200_000, 4_096),
+    # Google
+    "gemini-2.5-flash": ModelSpec(1_048_576, 65_536),
+    "gemini-2.5-pro": ModelSpec(1_048_576, 65_536),
+    "gemini-1.5-flash": ModelSpec(1_048_576, 8_192),
+    "gemini-1.5-pro": ModelSpec(2_097_152, 8_192),
+    # DeepSeek
+    "deepseek-chat": ModelSpec(64_000, 8_192),
+    "deepseek-coder": ModelSpec(64_000, 8_192),
+    # Offline stand-in (llm_providers.FakeProvider), sized like gpt-4o
+    "fake-llm": ModelSpec(128_000, 16_384),
+}
+
+# Model used by each provider when the client sends "auto" or nothing.
+DEFAULT_MODELS: Dict[str, str] = {
+    "openai": "gpt-4o",
+    "anthropic": "claude-3-5-sonnet-20241022",
+    "gemini": "gemini-2.5-flash",
+    "deepseek": "deepseek-chat",
+    "fake": "fake-llm",
+}
+
+FALLBACK_SPEC = ModelSpec(16_000, 4_096)
+
+# Fraction of the context window kept free for chat-format overhead, participant
+# codes and token-count estimation error.
+SAFETY_MARGIN = 0.05
+
+# --- Lookup ------------------------------------------------------------------
+
+def resolve_model(provider: Optional[str], model: Optional[str]) -> str:
+    """Return the concrete model name a provider will use for ``model``."""
+    if model and model != "auto":
+        return model
+    return DEFAULT_MODELS.get((provider or "").lower(), "")
+
+
+def get_model_spec(provider: Optional[str], model: Optional[str]) -> ModelSpec:
+    spec = MODEL_REGISTRY.get(resolve_model(provider, model))
+    if spec is None:
+        spec = MODEL_REGISTRY.get(DEFAULT_MODELS.get((provider or "").lower(), ""), FALLBACK_SPEC)
+    return spec
+
+# --- Budgeting ---------------------------------------------------------------
+
+def output_token_limit(provider: Optional[str], model: Optional[str], max_tokens: int) -> int:
+    """Clamp a requested ``max_tokens`` to what the model can actually generate."""
+    return min(int(max_tokens), get_model_spec(provider, model).max_output_tokens)
+
+
+def segment_token_budget(
+    provider: Optional[str],
+    model: Optional[str],
+    system_message: str,
+    prompt: str,
+    max_tokens: int,
+    token_counter: Optional[TokenCounter] = None,
+) -> int:
+    """Return the number of dataset tokens that fit into one call to ``model``."""
+    spec = get_model_spec(provider, model)
+    if token_counter is None:
+        token_counter = get_token_counter(provider, model)
+    reserved = (
+        token_counter.count(system_message)
+        + token_counter.count(prompt)
+        + output_token_limit(provider, model, max_tokens)
+        + int(spec.context_window * SAFETY_MARGIN)
+    )
+    # Never return a useless budget, even for a prompt that nearly fills the window
+    return max(spec.context_window - reserved, 1_000)
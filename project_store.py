@@ -0,0 +1,189 @@
+"""project_store.py
+
+Projects: named sets of files whose per-file partial theme tables are kept between
+combined analyses, so adding or removing transcripts only costs the map calls of
+the files that changed.
+
+* `ProjectStore` – SQLite file with one row per project and one row per
+  (project, file, participant) holding the file's partial tables (one per segment)
+  and the `map_settings_key` they were produced with.
+* `map_settings_key(**settings)` – fingerprint of everything that influences a
+  partial table (provider, model, prompts, temperature, token limits, segmenting);
+  stored partials are only reused when it matches.
+* `file_key(file_data)` – identifies a file's content: its content-addressed
+  `dataset_id`, or the SHA-256 of inline `data_content`.
+
+A re-analysis reuses matching partials, maps only new or changed files, forgets
+files that are no longer part of the request and re-merges everything.
+Projects are deleted `retention_seconds` after their last analysis.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_RETENTION_SECONDS = 30 * 24 * 3600
+
+
+def default_project_store_path() -> str:
+    """Return ``QUALIGPT_PROJECT_STORE_PATH`` or a file in the system temp directory."""
+    return os.environ.get(
+        "QUALIGPT_PROJECT_STORE_PATH", os.path.join(tempfile.gettempdir(), "qualigpt-projects.sqlite3")
+    )
+
+
+def map_settings_key(**settings: Any) -> str:
+    payload = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_key(file_data: Dict[str, Any]) -> str:
+    if file_data.get("dataset_id"):
+        return file_data["dataset_id"]
+    return hashlib.sha256(file_data.get("data_content", "").encode("utf-8")).hexdigest()
+
+# --- Store -------------------------------------------------------------------
+
+class ProjectStore:
+    """Projects and the partial theme tables of their files, stored in one SQLite file."""
+
+    def __init__(self, path: str, retention_seconds: Optional[float] = DEFAULT_RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS projects ("
+                " project_id TEXT PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS project_files ("
+                " project_id TEXT NOT NULL,"
+                " file_key TEXT NOT NULL,"
+                " participant_id TEXT NOT NULL,"
+                " filename TEXT NOT NULL,"
+                " settings_key TEXT NOT NULL,"
+                " partials TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (project_id, file_key, participant_id))"
+            )
+
+    def create_project(self, name: str = "") -> str:
+        project_id = uuid.uuid4().hex
+        now = time.time()
+        self._evict_expired(now)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO projects (project_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (project_id, name, now, now),
+            )
+        return project_id
+
+    def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Return the project with its files (without the stored tables)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, created_at, updated_at FROM projects WHERE project_id = ?", (project_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            files = self._conn.execute(
+                "SELECT file_key, participant_id, filename, partials, updated_at FROM project_files"
+                " WHERE project_id = ? ORDER BY updated_at",
+                (project_id,),
+            ).fetchall()
+        name, created_at, updated_at = row
+        return {
+            "project_id": project_id,
+            "name": name,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "files": [
+                {
+                    "file_key": key,
+                    "participant_id": participant_id,
+                    "filename": filename,
+                    "partial_tables": len(json.loads(partials)),
+                    "updated_at": file_updated_at,
+                }
+                for key, participant_id, filename, partials, file_updated_at in files
+            ],
+        }
+
+    def __contains__(self, project_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM projects WHERE project_id = ?", (project_id,)
+            ).fetchone() is not None
+
+    def get_partials(self, project_id: str, key: str, participant_id: str, settings_key: str) -> Optional[List[str]]:
+        """Return a file's stored partial tables if they were made with ``settings_key``."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT partials FROM project_files"
+                " WHERE project_id = ? AND file_key = ? AND participant_id = ? AND settings_key = ?",
+                (project_id, key, participant_id, settings_key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_partials(
+        self,
+        project_id: str,
+        key: str,
+        participant_id: str,
+        filename: str,
+        settings_key: str,
+        partials: List[str],
+    ) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO project_files"
+                " (project_id, file_key, participant_id, filename, settings_key, partials, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (project_id, key, participant_id, filename, settings_key, json.dumps(partials, ensure_ascii=False), now),
+            )
+            self._conn.execute("UPDATE projects SET updated_at = ? WHERE project_id = ?", (now, project_id))
+
+    def retain_files(self, project_id: str, keep: Iterable[Tuple[str, str]]) -> int:
+        """Forget every file of the project not in ``keep`` ((file_key, participant_id) pairs)."""
+        keep = set(keep)
+        with self._lock, self._conn:
+            stored = self._conn.execute(
+                "SELECT file_key, participant_id FROM project_files WHERE project_id = ?", (project_id,)
+            ).fetchall()
+            removed = [entry for entry in stored if entry not in keep]
+            self._conn.executemany(
+                "DELETE FROM project_files WHERE project_id = ? AND file_key = ? AND participant_id = ?",
+                [(project_id, key, participant_id) for key, participant_id in removed],
+            )
+            # Every analysis of the project ends here, also when all files were reused
+            self._conn.execute("UPDATE projects SET updated_at = ? WHERE project_id = ?", (time.time(), project_id))
+        return len(removed)
+
+    def delete_project(self, project_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM project_files WHERE project_id = ?", (project_id,))
+            self._conn.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
+
+    def _evict_expired(self, now: float) -> None:
+        if self.retention_seconds is None:
+            return
+        cutoff = now - self.retention_seconds
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM project_files WHERE project_id IN (SELECT project_id FROM projects WHERE updated_at < ?)",
+                (cutoff,),
+            )
+            self._conn.execute("DELETE FROM projects WHERE updated_at < ?", (cutoff,))
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context, url_for
 import pandas as pd
 # Keep optional OpenAI import for legacy compatibility; primary flow now uses llm_providers
 # but importing it conditionally avoids breaking environments without the package.
@@ -8,15 +8,33 @@ except ModuleNotFoundError:
     OpenAI = None  # type: ignore
 import os
 import io
+import asyncio
 import json
 from werkzeug.utils import secure_filename
-from docx import Document
 import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
 import re
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
 from datetime import datetime
 import tempfile
-from llm_providers import get_provider
+from llm_providers import PROVIDER_MAP, LazySequence, RouterProvider, get_provider
+from jobs import JobQueue, DONE, FAILED
+from response_cache import CachingProvider, MemoryBackend, ResponseCache, SQLiteBackend
+from model_registry import output_token_limit, segment_token_budget
+from rate_limiting import MAX_RETRIES, RateLimitedProvider
+from async_engine import get_engine
+from instrumentation import ANALYSES, STAGE_SECONDS, InstrumentedProvider, Trace, metrics, stage as call_stage
+from run_store import (CheckpointingProvider, RunStore, DEFAULT_RETENTION_SECONDS, DONE as RUN_DONE,
+                       FAILED as RUN_FAILED, default_run_store_path)
+from dataset_store import DatasetStore
+from project_store import (ProjectStore, DEFAULT_RETENTION_SECONDS as PROJECT_RETENTION_SECONDS,
+                           default_project_store_path, file_key, map_settings_key)
+from ingestion import ingest_path, ingest_upload
+from segmentation import CodedCorpus
+from theme_tables import QuoteIndex, dedupe_theme_rows, parse_response_to_csv, parse_theme_rows, serialize_theme_row, theme_key
+from token_counting import get_token_counter
 
 # Download NLTK data if not already present
 import nltk.data
@@ -32,11 +50,81 @@ except LookupError:
     nltk.download('punkt_tab', download_dir=local_nltk_path)
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Uploads are spooled to disk and ingested in chunks, so large exports are fine
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('QUALIGPT_MAX_UPLOAD_MB', 512)) * 1024 * 1024
+
+# Worker processes used to ingest multi-file uploads (created on first use).
+INGEST_PROCESSES = int(os.environ.get('QUALIGPT_INGEST_PROCESSES', os.cpu_count() or 1))
+_ingest_pool = None
+_ingest_pool_lock = threading.Lock()
+
+# Uploaded datasets, stored by content hash until unused for QUALIGPT_UPLOAD_RETENTION seconds.
+dataset_store = DatasetStore(
+    os.environ.get('QUALIGPT_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'qualigpt-uploads')),
+    float(os.environ.get('QUALIGPT_UPLOAD_RETENTION', 24 * 3600)),
+)
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'docx'}
 
+# Maximum number of segment calls kept in flight at once, per provider.
+# QUALIGPT_MAX_CONCURRENCY overrides the table for every provider.
+PROVIDER_CONCURRENCY = {
+    'openai': 8,
+    'anthropic': 4,
+    'gemini': 4,
+    'deepseek': 2,
+    'fake': 8,
+}
+DEFAULT_CONCURRENCY = 4
+
+# Process-wide budget shared by every request: files analysed in parallel and
+# the segment calls inside them never exceed this many in-flight provider calls.
+MAX_INFLIGHT_CALLS = int(os.environ.get('QUALIGPT_MAX_INFLIGHT_CALLS', 16))
+MAX_FILE_CONCURRENCY = int(os.environ.get('QUALIGPT_MAX_FILE_CONCURRENCY', 4))
+_inflight_calls = threading.BoundedSemaphore(MAX_INFLIGHT_CALLS)
+
+# Provider calls are made with the providers' async clients on one background event
+# loop (async_engine.py), so waiting calls do not hold threads and the in-flight
+# budget can be far larger.  QUALIGPT_ASYNC_PROVIDERS=0 restores the thread pools.
+ASYNC_PROVIDER_CALLS = os.environ.get('QUALIGPT_ASYNC_PROVIDERS', '1') != '0'
+MAX_ASYNC_INFLIGHT_CALLS = int(os.environ.get('QUALIGPT_MAX_ASYNC_INFLIGHT_CALLS', 256))
+
+# Files of one batch-mode analysis waiting for their batches at the same time.
+BATCH_FILE_CONCURRENCY = int(os.environ.get('QUALIGPT_BATCH_FILE_CONCURRENCY', 64))
+
+# Maximum number of partial tables combined by one merge call (tree-reduce fan-in).
+MERGE_FAN_IN = int(os.environ.get('QUALIGPT_MERGE_FAN_IN', 8))
+
+# Background workers that run queued /analyze jobs.
+job_queue = JobQueue(max_workers=int(os.environ.get('QUALIGPT_JOB_WORKERS', 4)))
+
+# Completion cache shared by every request.  Set QUALIGPT_CACHE_PATH to add an
+# on-disk SQLite tier that survives restarts.
+CACHE_TTL_SECONDS = float(os.environ.get('QUALIGPT_CACHE_TTL', 7 * 24 * 3600))
+_cache_tiers = [
+    MemoryBackend(int(os.environ.get('QUALIGPT_CACHE_MEMORY_ENTRIES', 1024)), CACHE_TTL_SECONDS)
+]
+if os.environ.get('QUALIGPT_CACHE_PATH'):
+    _cache_tiers.append(SQLiteBackend(
+        os.environ['QUALIGPT_CACHE_PATH'],
+        int(os.environ.get('QUALIGPT_CACHE_DISK_ENTRIES', 100000)),
+        CACHE_TTL_SECONDS,
+    ))
+response_cache = ResponseCache(_cache_tiers)
+
+# Checkpoints of every /analyze run, so failed or interrupted runs can be resumed.
+run_store = RunStore(
+    default_run_store_path(),
+    float(os.environ.get('QUALIGPT_RUN_RETENTION', DEFAULT_RETENTION_SECONDS)),
+)
+
+# Projects keep each file's partial theme tables, so re-analyses only map changed files.
+project_store = ProjectStore(
+    default_project_store_path(),
+    float(os.environ.get('QUALIGPT_PROJECT_RETENTION', PROJECT_RETENTION_SECONDS)),
+)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -48,11 +136,216 @@ def extract_participant_id(filename):
     participant_id = re.sub(r'[^\w\-_]', '', participant_id)
     return participant_id if participant_id else 'Unknown'
 
-def add_participant_codes_to_content(content, participant_id):
-    """Prefix every line of content with the participant code in square brackets so the LLM can attribute quotes accurately."""
-    lines = content.split('\n')
-    coded_lines = [f"[{participant_id}] {ln.strip()}" for ln in lines if ln.strip()]
-    return '\n'.join(coded_lines)
+def get_concurrency_limit(provider_name, requested=None):
+    """Return how many segment calls may run in parallel for a provider.
+
+    A client-supplied ``requested`` value can only lower the configured limit.
+    """
+    limit = PROVIDER_CONCURRENCY.get((provider_name or '').lower(), DEFAULT_CONCURRENCY)
+    env_limit = os.environ.get('QUALIGPT_MAX_CONCURRENCY')
+    if env_limit:
+        limit = int(env_limit)
+    if requested:
+        limit = min(limit, int(requested))
+    return max(1, limit)
+
+def call_targets(provider, provider_name, model_name):
+    """Return the (provider name, model) pairs a call may go to: a router's routes, or the provider itself."""
+    if isinstance(provider, RouterProvider):
+        return [(route.provider_name, route.model) for route in provider.routes]
+    return [(provider_name, model_name)]
+
+def smallest_segment_budget(targets, system_message, prompt, max_tokens):
+    """Return ``(budget, token counter)`` of the call target with the smallest segment budget.
+
+    Segments must fit every model a router may send them to.
+    """
+    return min(
+        ((segment_token_budget(p, m, system_message, prompt, max_tokens, get_token_counter(p, m)), get_token_counter(p, m))
+         for p, m in targets),
+        key=lambda pair: pair[0],
+    )
+
+def call_provider(provider, system_message, message, model_name, temperature, max_tokens, on_token=None):
+    """Make one chat call while holding a slot of the global in-flight budget.
+
+    When ``on_token`` is given the provider's streaming mode is used and every
+    chunk is passed to it as it arrives; the full text is still returned.
+    """
+    if ASYNC_PROVIDER_CALLS:
+        return get_engine().run(acall_provider(
+            provider, system_message, message, model_name, temperature, max_tokens, on_token=on_token
+        ))
+    with _inflight_calls:
+        if on_token is None:
+            return provider.chat(
+                system_message,
+                message,
+                model=model_name or "auto",
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        pieces = []
+        for piece in provider.chat_stream(
+            system_message,
+            message,
+            model=model_name or "auto",
+            temperature=temperature,
+            max_tokens=max_tokens,
+        ):
+            pieces.append(piece)
+            on_token(piece)
+        return "".join(pieces)
+
+async def acall_provider(provider, system_message, message, model_name, temperature, max_tokens, on_token=None):
+    """`call_provider` on the async engine's loop, holding a slot of the async in-flight budget."""
+    async with get_engine().semaphore('inflight', MAX_ASYNC_INFLIGHT_CALLS):
+        if on_token is None:
+            return await provider.achat(
+                system_message,
+                message,
+                model=model_name or "auto",
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        pieces = []
+        async for piece in provider.achat_stream(
+            system_message,
+            message,
+            model=model_name or "auto",
+            temperature=temperature,
+            max_tokens=max_tokens,
+        ):
+            pieces.append(piece)
+            on_token(piece)
+        return "".join(pieces)
+
+def map_segments(provider, system_message, messages, model_name, temperature, max_tokens, max_workers=1, on_segment_done=None, on_token=None, stage='map', batch=False):
+    """Send each message to the provider, at most ``max_workers`` at a time.
+
+    Returns ``(responses, timings)`` in the same order as ``messages`` so the
+    merged output is independent of which call finishes first.  ``on_segment_done``
+    is called after every completed call (used for job progress) and
+    ``on_token(segment_number, chunk)`` receives streamed output.  ``messages`` may
+    be a lazy sequence; each message is only built when its call starts.  The calls
+    are attributed to ``stage`` in the instrumentation.
+
+    With async provider calls the fan-out runs as tasks on the async engine's loop
+    instead of a thread pool.  With ``batch`` all messages are submitted through the
+    provider's batch API (`run_batch`, no streaming) and only the requests the batch
+    did not answer are sent in real time.
+    """
+    def _segment_on_token(index):
+        segment_on_token = None
+        if on_token is not None:
+            segment_on_token = lambda piece: on_token(index + 1, piece)
+        return segment_on_token
+
+    def _finish(index, started, input_chars):
+        # Report progress and return the segment's timing
+        if on_segment_done is not None:
+            on_segment_done()
+        return {
+            'segment': index + 1,
+            'seconds': round(time.perf_counter() - started, 3),
+            'input_chars': input_chars,
+        }
+
+    async def _amap(indices):
+        # Created on the engine loop; bounds this fan-out like the thread pool did
+        limit = asyncio.Semaphore(max(1, max_workers))
+
+        async def _acall(index):
+            async with limit:
+                # Lazy segments are rendered in a worker thread, off the shared event loop
+                message = await asyncio.to_thread(messages.__getitem__, index)
+                started = time.perf_counter()
+                with call_stage(stage):
+                    response_text = await acall_provider(
+                        provider, system_message, message, model_name, temperature, max_tokens,
+                        on_token=_segment_on_token(index),
+                    )
+                return response_text, _finish(index, started, len(message))
+
+        return await asyncio.gather(*(_acall(index) for index in indices))
+
+    def _call(index):
+        message = messages[index]
+        started = time.perf_counter()
+        with call_stage(stage):
+            response_text = call_provider(
+                provider, system_message, message, model_name, temperature, max_tokens,
+                on_token=_segment_on_token(index),
+            )
+        return response_text, _finish(index, started, len(message))
+
+    def _map(indices):
+        if ASYNC_PROVIDER_CALLS and len(indices) > 1:
+            return get_engine().run(_amap(indices))
+        if max_workers <= 1 or len(indices) <= 1:
+            return [_call(index) for index in indices]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(indices))) as pool:
+            return list(pool.map(_call, indices))
+
+    def _batch_map():
+        input_chars = [0] * len(messages)
+
+        def _render(index):
+            # run_batch renders each message once; keep its length for the timings
+            message = messages[index]
+            input_chars[index] = len(message)
+            return message
+
+        started = time.perf_counter()
+        with call_stage(stage):
+            answers = provider.run_batch(
+                system_message,
+                LazySequence(len(messages), _render),
+                model=model_name or "auto",
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        results = [None] * len(messages)
+        unanswered = []
+        for index, answer in enumerate(answers):
+            if answer is None:
+                unanswered.append(index)
+                continue
+            timing = _finish(index, started, input_chars[index])
+            timing['batch'] = True
+            results[index] = (answer, timing)
+        for index, result in zip(unanswered, _map(unanswered)):
+            results[index] = result
+        return results
+
+    if batch and len(messages) > 0:
+        results = _batch_map()
+    else:
+        results = _map(range(len(messages)))
+
+    responses = [response_text for response_text, _ in results]
+    timings = [timing for _, timing in results]
+    return responses, timings
+
+def get_file_content(file_data):
+    """Return the text of one ``files_data`` entry (a stored ``dataset_id`` or inline ``data_content``)."""
+    if 'dataset_id' not in file_data and 'data_content' in file_data:
+        return file_data['data_content']
+    try:
+        return dataset_store.read(file_data.get('dataset_id'))
+    except KeyError:
+        raise ValueError(f"Uploaded file {file_data.get('filename', '')} is no longer available, please upload it again") from None
+
+def build_participant_corpus(files_data):
+    """Return a ``CodedCorpus`` of the given files, each coded with its participant ID.
+
+    Lines are prefixed with the participant code in square brackets (so the LLM can
+    attribute quotes accurately) only when a segment is rendered.
+    """
+    corpus = CodedCorpus()
+    for file_data in files_data:
+        corpus.add(get_file_content(file_data), file_data['participant_id'])
+    return corpus
 
 # Prompt templates
 PROMPTS = {
@@ -126,10 +419,7 @@ def test_api():
             
             # For Gemini, we can test with a specific model
             if provider_name == 'gemini' and model_name:
-                import google.generativeai as genai
-                genai.configure(api_key=api_key)
-                model = genai.GenerativeModel(model_name)
-                _ = model.generate_content("ping", generation_config={"max_output_tokens": 1})
+                provider.test_connection(model_name)
             else:
                 # For other providers, use default test_connection
                 provider.test_connection()
@@ -152,254 +442,582 @@ def upload_file():
         if not files or all(f.filename == '' for f in files):
             return jsonify({'success': False, 'error': 'No files selected'})
         
+        dataset_store.evict_expired()
+        uploads = [
+            (file, secure_filename(file.filename))
+            for file in files
+            if file and allowed_file(file.filename)
+        ]
+
+        # Rows are converted chunk by chunk into the dataset store; only the dataset
+        # ID, the headers and a preview are sent back to the browser
+        started = time.perf_counter()
+        if len(uploads) > 1:
+            ingested_files = _ingest_in_processes(uploads)
+        else:
+            ingested_files = [ingest_upload(file.stream, filename, dataset_store) for file, filename in uploads]
+        ingest_seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(ingest_seconds, stage='ingestion')
+
         processed_files = []
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_ext = filename.rsplit('.', 1)[1].lower()
-                
-                if file_ext == 'csv':
-                    data = pd.read_csv(file)
-                elif file_ext == 'xlsx':
-                    data = pd.read_excel(file)
-                elif file_ext == 'docx':
-                    def _extract_text_from_docx(file_obj):
-                        """Return a list of non-empty text lines from a DOCX file, looking at paragraphs *and* table cells."""
-                        doc = Document(file_obj)
-                        lines: list[str] = []
-
-                        for para in doc.paragraphs:
-                            text = para.text.strip()
-                            if text:
-                                lines.append(text)
-
-                        for table in doc.tables:
-                            for row in table.rows:
-                                for cell in row.cells:
-                                    cell_text = cell.text.strip()
-                                    if cell_text:
-                                        for piece in cell_text.split("\n"):
-                                            piece = piece.strip()
-                                            if piece:
-                                                lines.append(piece)
-                        return lines
-
-                    full_text = _extract_text_from_docx(file)
-                    if not full_text:
-                        full_text = ["(No readable text detected in DOCX)"]
-                    data = pd.DataFrame(full_text, columns=['Content'])
-                
-                headers = list(data.columns)
-                data_content = '\n'.join(data.apply(lambda row: ' '.join(row.astype(str)), axis=1))
-                
-                # Extract participant ID from filename
-                participant_id = extract_participant_id(filename)
-                
-                processed_files.append({
-                    'filename': filename,
-                    'participant_id': participant_id,
-                    'headers': headers,
-                    'data_content': data_content
-                })
+        for (_, filename), ingested in zip(uploads, ingested_files):
+            # Extract participant ID from filename
+            participant_id = extract_participant_id(filename)
+            
+            processed_files.append({
+                'filename': filename,
+                'participant_id': participant_id,
+                'headers': ingested.headers,
+                'dataset_id': ingested.dataset_id,
+                'num_lines': ingested.num_lines,
+                'num_chars': ingested.num_chars,
+                'preview': ingested.preview
+            })
 
         if not processed_files:
             return jsonify({'success': False, 'error': 'Invalid file types or empty files'})
 
         return jsonify({
             'success': True,
-            'files': processed_files
+            'files': processed_files,
+            'ingest_seconds': round(ingest_seconds, 3)
         })
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+def _ingest_in_processes(uploads):
+    """Save several uploads to disk and ingest them in parallel worker processes."""
+    global _ingest_pool
+    with _ingest_pool_lock:
+        if _ingest_pool is None:
+            # spawn: forking a multi-threaded server process is not safe
+            _ingest_pool = ProcessPoolExecutor(
+                max_workers=INGEST_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+            )
+    paths = []
+    try:
+        for file, _ in uploads:
+            fd, path = tempfile.mkstemp(dir=dataset_store.root, suffix='.part')
+            os.close(fd)
+            file.save(path)
+            paths.append(path)
+        futures = [
+            _ingest_pool.submit(ingest_path, path, filename, dataset_store.root)
+            for path, (_, filename) in zip(paths, uploads)
+        ]
+        return [future.result() for future in futures]
+    finally:
+        for path in paths:
+            os.remove(path)
+
+@app.route('/datasets/<dataset_id>', methods=['GET'])
+def dataset_info(dataset_id):
+    """Report whether an uploaded dataset is still stored (e.g. for a restored browser session)."""
+    try:
+        return jsonify({'success': True, **dataset_store.info(dataset_id)})
+    except KeyError:
+        return jsonify({'success': False, 'error': 'Unknown or expired dataset ID'}), 404
+
+def unavailable_inputs(data):
+    """Return why the uploads or project of an /analyze payload cannot be used, or None."""
+    missing = [f.get('filename', '') for f in data['files_data'] if 'dataset_id' in f and f['dataset_id'] not in dataset_store]
+    if missing:
+        return f"Uploaded data is no longer available, please upload again: {', '.join(missing)}"
+    if data.get('project_id') and data['project_id'] not in project_store:
+        return 'Unknown project ID'
+    return None
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
+    """Queue an analysis and return its job ID straight away."""
     try:
         data = request.json
-        api_key = data.get('api_key')
-        provider_name = data.get('provider', 'openai')
-        model_name = data.get('model')
-        
-        # Handle single file vs multiple files
-        files_data = data.get('files_data')
-        analysis_mode = data.get('analysis_mode', 'combined')
-
-        data_type = data.get('data_type')
-        num_themes = data.get('num_themes', 10)
-        custom_prompt = data.get('custom_prompt', '')
-        enable_role_playing = data.get('enable_role_playing', False)
-        pre_detect_themes = data.get('pre_detect_themes', False)
-        temperature = data.get('temperature', 0.7)
-        max_tokens = data.get('max_tokens', 4000)
-        english_output = data.get('english_output', False)
-
-        if not api_key or not files_data:
+        if not data.get('api_key') or not data.get('files_data'):
             return jsonify({'success': False, 'error': 'API key and data content are required'})
+        unavailable = unavailable_inputs(data)
+        if unavailable:
+            return jsonify({'success': False, 'error': unavailable})
+        provider_cls = PROVIDER_MAP.get(data.get('provider', 'openai').lower())
+        if data.get('batch_mode') and not (provider_cls and provider_cls.supports_batch):
+            return jsonify({'success': False, 'error': f"Batch mode is not available for provider {data.get('provider', 'openai')}"})
+
+        # The API key is never written to the run store; resuming asks for it again
+        run_id = run_store.create_run({k: v for k, v in data.items() if k != 'api_key'})
+        return _queue_run(data, run_id)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/runs/<run_id>', methods=['GET'])
+def run_status(run_id):
+    run = run_store.get_run(run_id)
+    if run is None:
+        return jsonify({'success': False, 'error': 'Unknown run ID'}), 404
+    del run['payload']
+    return jsonify({'success': True, **run})
+
+@app.route('/runs/<run_id>/resume', methods=['POST'])
+def resume_run(run_id):
+    """Re-queue a stored run; calls that already completed are replayed from the run store."""
+    try:
+        run = run_store.get_run(run_id)
+        if run is None:
+            return jsonify({'success': False, 'error': 'Unknown run ID'}), 404
+        api_key = (request.json or {}).get('api_key')
+        if not api_key:
+            return jsonify({'success': False, 'error': 'API key is required'})
+        unavailable = unavailable_inputs(run['payload'])
+        if unavailable:
+            return jsonify({'success': False, 'error': unavailable})
+
+        # Only finished runs are resumed; the claim is atomic, so two concurrent
+        # resumes cannot both queue the run
+        if not run_store.restart_run(run_id):
+            return jsonify({'success': False, 'error': 'Run is still in progress'}), 409
+        return _queue_run({**run['payload'], 'api_key': api_key}, run_id)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/projects', methods=['POST'])
+def create_project():
+    """Create a project; pass its ID as ``project_id`` to /analyze for incremental re-analysis."""
+    name = (request.json or {}).get('name', '')
+    project_id = project_store.create_project(name)
+    return jsonify({'success': True, 'project_id': project_id, 'project_url': url_for('project_info', project_id=project_id)}), 201
+
+@app.route('/projects/<project_id>', methods=['GET'])
+def project_info(project_id):
+    project = project_store.get_project(project_id)
+    if project is None:
+        return jsonify({'success': False, 'error': 'Unknown project ID'}), 404
+    return jsonify({'success': True, **project})
+
+@app.route('/projects/<project_id>', methods=['DELETE'])
+def delete_project(project_id):
+    if project_id not in project_store:
+        return jsonify({'success': False, 'error': 'Unknown project ID'}), 404
+    project_store.delete_project(project_id)
+    return jsonify({'success': True})
+
+def _queue_run(data, run_id):
+    job = job_queue.submit(run_checkpointed_analysis, data, run_id)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'run_id': run_id,
+        'status_url': url_for('job_status', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+        'stream_url': url_for('job_stream', job_id=job.id),
+        'resume_url': url_for('resume_run', run_id=run_id)
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job ID'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job ID'}), 404
+    if job.status == FAILED:
+        return jsonify({'success': False, 'status': job.status, 'error': job.error})
+    if job.status != DONE:
+        return jsonify({'success': False, 'status': job.status, 'error': 'Job has not finished yet'}), 202
+    return jsonify(job.result)
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def job_stream(job_id):
+    """Forward a job's streamed model output to the browser as Server-Sent Events."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job ID'}), 404
+
+    def _events():
+        cursor = 0
+        while True:
+            events, finished = job.wait_for_events(cursor)
+            cursor += len(events)
+            for event in events:
+                yield f"data: {json.dumps(event)}\n\n"
+            if finished:
+                yield f"event: done\ndata: {json.dumps({'status': job.status})}\n\n"
+                return
+            if not events:
+                yield ": keep-alive\n\n"
 
-        provider = get_provider(provider_name, api_key)
+    return Response(
+        stream_with_context(_events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage timings, provider call latency/outcomes and token counts in the Prometheus text format."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'success': True, **response_cache.stats()})
+
+def run_checkpointed_analysis(job, data, run_id):
+    """Run an analysis under ``run_id`` and record its outcome in the run store."""
+    mode = data.get('analysis_mode', 'combined')
+    try:
+        result = run_analysis(job, data, run_id)
+    except Exception as e:
+        run_store.finish_run(run_id, RUN_FAILED, error=str(e))
+        ANALYSES.inc(mode=mode, status=RUN_FAILED)
+        raise
+    status = RUN_DONE if result.get('success') else RUN_FAILED
+    ANALYSES.inc(mode=mode, status=status)
+    run_store.finish_run(run_id, status, result=result, error=result.get('error'))
+    return {**result, 'run_id': run_id}
+
+def run_analysis(job, data, run_id=None):
+    """Run the analysis described by an /analyze payload and return the JSON response body.
+
+    Executed on a job-queue worker; progress is reported through ``job``.  With a
+    ``run_id`` every provider call is checkpointed in the run store.
+    """
+    api_key = data.get('api_key')
+    provider_name = data.get('provider', 'openai')
+    model_name = data.get('model')
+    
+    # Handle single file vs multiple files
+    files_data = data.get('files_data')
+    analysis_mode = data.get('analysis_mode', 'combined')
+
+    data_type = data.get('data_type')
+    num_themes = data.get('num_themes', 10)
+    custom_prompt = data.get('custom_prompt', '')
+    enable_role_playing = data.get('enable_role_playing', False)
+    pre_detect_themes = data.get('pre_detect_themes', False)
+    temperature = data.get('temperature', 0.7)
+    # A router spreads the calls over its routes: limits apply per route model and
+    # the routes' concurrency limits add up
+    base_provider = get_provider(provider_name, api_key)
+    targets = call_targets(base_provider, provider_name, model_name)
+    is_router = isinstance(base_provider, RouterProvider)
+    if is_router:
+        # Each route uses its own model; cache keys and metrics get a fixed name
+        model_name = 'router'
+    max_tokens = min(output_token_limit(p, m, data.get('max_tokens', 4000)) for p, m in targets)
+    english_output = data.get('english_output', False)
+    max_workers = sum(get_concurrency_limit(p, data.get('max_concurrency')) for p, _ in targets)
+    if data.get('max_concurrency'):
+        max_workers = min(max_workers, int(data['max_concurrency']))
+    segment_overlap = int(data.get('segment_overlap', 0))
+    merge_fan_in = data.get('merge_fan_in')
+    compact_merge = data.get('compact_merge', True)
+    merge_quote_refs = data.get('merge_quote_refs', False)
+    project_id = data.get('project_id')
+    # Batch mode: map calls go through the provider's batch API (cheaper, no rate
+    # limits, answered within hours), so many more files wait at once
+    batch_mode = bool(data.get('batch_mode', False))
+    max_file_concurrency = BATCH_FILE_CONCURRENCY if batch_mode else MAX_FILE_CONCURRENCY
 
-        vietnamese_instruction = (
-            " Nếu dữ liệu nguồn có vẻ được viết bằng tiếng Việt, hãy trình bày toàn bộ bảng (bao gồm tiêu đề cột, mô tả, trích dẫn) bằng tiếng Việt."
+    # Spans of every stage and provider call, returned as 'instrumentation'
+    trace = Trace()
+
+    def _routing():
+        # Calls, failures and latency per route of a router (kept across runs)
+        return {'routing': base_provider.route_stats()} if is_router else {}
+    # Rate limiting sits below the cache so cache hits never wait for budget; the
+    # instrumentation below it records every call attempt that reaches the provider
+    provider = InstrumentedProvider(base_provider, trace, provider_name, model_name)
+    # The router fails over between its routes itself; retrying it would repeat every route
+    provider = RateLimitedProvider(provider, provider_name, max_retries=0 if is_router else MAX_RETRIES)
+    if data.get('use_cache', True):
+        provider = CachingProvider(provider, response_cache)
+    if run_id is not None:
+        provider = CheckpointingProvider(provider, run_store, run_id)
+
+    vietnamese_instruction = (
+        " Nếu dữ liệu nguồn có vẻ được viết bằng tiếng Việt, hãy trình bày toàn bộ bảng (bao gồm tiêu đề cột, mô tả, trích dẫn) bằng tiếng Việt."
+    )
+    english_instruction = (
+        " Present the entire table in English, with correct grammar and spelling, translating and grammar-correcting any participant quotes as needed."
+    )
+    language_instruction = english_instruction if english_output else vietnamese_instruction
+
+    if enable_role_playing:
+        system_message = (
+            "You are an excellent qualitative data analyst and qualitative research expert. "
+            "Follow the output format instructions exactly with no additional commentary." + language_instruction
         )
-        english_instruction = (
-            " Present the entire table in English, with correct grammar and spelling, translating and grammar-correcting any participant quotes as needed."
+    else:
+        system_message = (
+            "You are a helpful assistant. Follow the output format instructions exactly with no additional commentary." + language_instruction
         )
-        language_instruction = english_instruction if english_output else vietnamese_instruction
 
-        if enable_role_playing:
-            system_message = (
-                "You are an excellent qualitative data analyst and qualitative research expert. "
-                "Follow the output format instructions exactly with no additional commentary." + language_instruction
-            )
+    # If num_themes is 'auto', prompt the LLM to choose the optimal number
+    if num_themes == 'auto':
+        prompt = (
+            "You need to analyze a dataset of interviews. "
+            "Identify the optimal number of key themes (no more than 20) that comprehensively cover all significant ideas and perspectives in the data. "
+            "Present a table of all major and minor themes, ensuring no important information is lost. "
+            "Do not limit the number of themes unless the data naturally supports fewer themes. "
+            "The table should include: | 'Theme' | 'Description' | 'Quotes' | 'Participant Count' |. "
+            "IMPORTANT: Output ONLY the table with no additional text, commentary, or explanations. Start your response immediately with '**********' and end with '**********'. Do not use markdown formatting or code blocks. "
+        )
+    else:
+        if custom_prompt:
+            prompt = custom_prompt
         else:
-            system_message = (
-                "You are a helpful assistant. Follow the output format instructions exactly with no additional commentary." + language_instruction
+            prompt = PROMPTS.get(data_type, PROMPTS['Interview']).format(num_themes=num_themes)
+
+    budget, token_counter = smallest_segment_budget(targets, system_message, prompt, max_tokens)
+    # The instructions go after the system message and before any data, so every map
+    # call of the run starts with the same prefix, which providers can serve from their
+    # prompt cache; only the segment in the user message differs between calls
+    map_system_message = system_message + "\n\n" + prompt
+
+    def _load_corpus(files):
+        # Reads the uploaded datasets from the dataset store
+        with trace.span('load'):
+            return build_participant_corpus(files)
+
+    def _map_corpus(corpus, participant_id=None, stats=None):
+        """Run the map step over a corpus; return ``(partial tables, segments)``."""
+        # Segments are rendered (with participant codes) only when their call is made
+        with trace.span('segmentation'):
+            segments = split_into_segments(corpus, budget, token_counter=token_counter, overlap_tokens=segment_overlap)
+        job.add('segments_total', len(segments))
+        with trace.span('map'):
+            all_responses, segment_timings = map_segments(
+                provider,
+                map_system_message,
+                segments,
+                model_name,
+                temperature,
+                max_tokens,
+                max_workers=max_workers,
+                stage='map',
+                batch=batch_mode,
+                on_segment_done=lambda: job.add('segments_done'),
+                on_token=lambda segment_number, piece: job.emit({
+                    'stage': 'segment', 'file': participant_id, 'segment': segment_number, 'text': piece
+                }),
             )
+        if stats is not None:
+            stats['segments_processed'] = stats.get('segments_processed', 0) + len(segments)
+            stats['segment_token_budget'] = budget
+            stats['segment_timings'] = stats.get('segment_timings', []) + segment_timings
+        return all_responses, segments
 
-        def _run_single_analysis(content, participant_id=None):
-            # If num_themes is 'auto', prompt the LLM to choose the optimal number
-            if num_themes == 'auto':
-                prompt = (
-                    "You need to analyze a dataset of interviews. "
-                    "Identify the optimal number of key themes (no more than 20) that comprehensively cover all significant ideas and perspectives in the data. "
-                    "Present a table of all major and minor themes, ensuring no important information is lost. "
-                    "Do not limit the number of themes unless the data naturally supports fewer themes. "
-                    "The table should include: | 'Theme' | 'Description' | 'Quotes' | 'Participant Count' |. "
-                    "IMPORTANT: Output ONLY the table with no additional text, commentary, or explanations. Start your response immediately with '**********' and end with '**********'. Do not use markdown formatting or code blocks. "
-                )
-            else:
-                if custom_prompt:
-                    prompt = custom_prompt
-                else:
-                    prompt = PROMPTS.get(data_type, PROMPTS['Interview']).format(num_themes=num_themes)
-
-            # Add participant code context if provided
-            if participant_id:
-                content = add_participant_codes_to_content(content, participant_id)
-
-            segments = split_into_segments(content)
-            all_responses = []
-            for segment in segments:
-                combined_message = segment + "\n\n" + prompt
-                response_text = provider.chat(
-                    system_message,
-                    combined_message,
-                    model=model_name or "auto",
-                    temperature=temperature,
-                    max_tokens=max_tokens,
+    def _reduce_responses(all_responses, segments, participant_id=None, stats=None):
+        """Merge partial tables into the final table (``segments`` is used for the auto fallback)."""
+        if len(all_responses) > 1:
+            merge_budget, _ = smallest_segment_budget(
+                targets, system_message,
+                build_merge_prompt(num_themes, compact_merge, merge_quote_refs) + MERGE_MESSAGE.format(tables=""),
+                max_tokens
+            )
+            with trace.span('merge'):
+                return analyze_merged_responses(
+                    all_responses, num_themes, system_message, provider, model_name, temperature, max_tokens,
+                    on_token=lambda piece: job.emit({'stage': 'merge', 'file': participant_id, 'text': piece}),
+                    token_counter=token_counter,
+                    budget=merge_budget,
+                    fan_in=merge_fan_in,
+                    max_workers=max_workers,
+                    stats=stats,
+                    compact=compact_merge,
+                    quote_refs=merge_quote_refs,
+                    batch=batch_mode,
                 )
-                all_responses.append(response_text)
+        else:
+            # Fallback: If auto mode and output is empty or malformed, retry with num_themes=10
+            if num_themes == 'auto':
+                parsed = parse_response_to_csv(all_responses[0])
+                if not parsed or len(parsed) < 2:
+                    fallback_prompt = PROMPTS.get(data_type, PROMPTS['Interview']).format(num_themes=10)
+                    with trace.span('fallback'), call_stage('fallback'):
+                        fallback_response = call_provider(
+                            provider, system_message + "\n\n" + fallback_prompt, segments[0],
+                            model_name, temperature, max_tokens
+                        )
+                    return fallback_response
+            return all_responses[0]
 
-            if len(segments) > 1:
-                merged_responses = "\n".join(all_responses)
-                return analyze_merged_responses(
-                    merged_responses, num_themes, system_message, provider, model_name, temperature, max_tokens
+    def _run_single_analysis(corpus, participant_id=None, stats=None):
+        all_responses, segments = _map_corpus(corpus, participant_id, stats)
+        return _reduce_responses(all_responses, segments, participant_id, stats)
+
+    def _run_project_analysis(project_id, stats):
+        """Map only the files whose partial tables are not stored in the project, then re-merge all."""
+        settings_key = map_settings_key(
+            provider=provider_name, model=model_name or 'auto', system_message=system_message, prompt=prompt,
+            temperature=temperature, max_tokens=max_tokens, segment_budget=budget, segment_overlap=segment_overlap,
+        )
+        stats.update({'segments_processed': 0, 'segment_timings': [], 'files_mapped': 0, 'files_reused': 0})
+        stats_lock = threading.Lock()
+
+        def _partials_for(file_data):
+            key = file_key(file_data)
+            participant_id = file_data['participant_id']
+            partials = project_store.get_partials(project_id, key, participant_id, settings_key)
+            segments = None
+            if partials is None:
+                file_stats = {}
+                partials, segments = _map_corpus(_load_corpus([file_data]), participant_id, file_stats)
+                project_store.save_partials(
+                    project_id, key, participant_id, file_data.get('filename', ''), settings_key, partials
                 )
+                with stats_lock:
+                    stats['files_mapped'] += 1
+                    stats['segments_processed'] += file_stats['segments_processed']
+                    stats['segment_timings'] += file_stats['segment_timings']
             else:
-                # Fallback: If auto mode and output is empty or malformed, retry with num_themes=10
-                if num_themes == 'auto':
-                    parsed = parse_response_to_csv(all_responses[0])
-                    if not parsed or len(parsed) < 2:
-                        fallback_prompt = PROMPTS.get(data_type, PROMPTS['Interview']).format(num_themes=10)
-                        fallback_message = segment + "\n\n" + fallback_prompt
-                        fallback_response = provider.chat(
-                            system_message,
-                            fallback_message,
-                            model=model_name or "auto",
-                            temperature=temperature,
-                            max_tokens=max_tokens,
-                        )
-                        return fallback_response
-                return all_responses[0]
+                with stats_lock:
+                    stats['files_reused'] += 1
+            job.add('files_done')
+            return partials, segments
+
+        file_workers = min(max_file_concurrency, len(files_data))
+        with ThreadPoolExecutor(max_workers=max(1, file_workers)) as pool:
+            per_file = list(pool.map(_partials_for, files_data))
+        stats['files_removed'] = project_store.retain_files(
+            project_id, [(file_key(f), f['participant_id']) for f in files_data]
+        )
+
+        all_responses = [partial for partials, _ in per_file for partial in partials]
+        segments = per_file[0][1]
+        if len(all_responses) == 1 and segments is None:
+            # A single reused table still needs its segment for the auto-mode fallback
+            segments = split_into_segments(_load_corpus(files_data), budget, token_counter, segment_overlap)
+        return _reduce_responses(all_responses, segments, stats=stats)
 
-        if analysis_mode == 'combined':
+    job.set('files_total', len(files_data))
+    job.set('files_done', 0)
+    if analysis_mode == 'combined':
+        stats = {}
+        if project_id:
+            # Per-file partial tables are kept in the project; only changed files are mapped
+            final_response = _run_project_analysis(project_id, stats)
+        else:
             # For combined analysis, include participant IDs in the content
-            combined_content_parts = []
-            for f in files_data:
-                participant_content = add_participant_codes_to_content(f['data_content'], f['participant_id'])
-                combined_content_parts.append(participant_content)
-            combined_content = "\n\n".join(combined_content_parts)
-            
-            final_response = _run_single_analysis(combined_content)
-            # Check for empty or malformed output
+            final_response = _run_single_analysis(_load_corpus(files_data), stats=stats)
+        job.set('files_done', len(files_data))
+        # Check for empty or malformed output
+        with trace.span('parse'):
             parsed = parse_response_to_csv(final_response)
-            if not parsed or len(parsed) < 2:
-                return jsonify({'success': False, 'error': 'AI did not return a valid table. Try reducing the number of files, or use a fixed number of themes.'})
-            # If auto, count number of themes in the table
-            num_themes_auto = None
-            if num_themes == 'auto':
-                num_themes_auto = len(parsed) - 1
-            return jsonify({
-                'success': True,
-                'response': final_response,
-                'report_type': 'combined',
-                'segments_processed': len(split_into_segments(combined_content)),
-                'num_themes_auto': num_themes_auto
+        if not parsed or len(parsed) < 2:
+            return {
+                'success': False,
+                'error': 'AI did not return a valid table. Try reducing the number of files, or use a fixed number of themes.',
+                'instrumentation': trace.summary()
+            }
+        # If auto, count number of themes in the table
+        num_themes_auto = None
+        if num_themes == 'auto':
+            num_themes_auto = len(parsed) - 1
+        return {
+            'success': True,
+            'response': final_response,
+            'report_type': 'combined',
+            'segments_processed': stats['segments_processed'],
+            'segment_timings': stats['segment_timings'],
+            'merge_levels': stats.get('merge_levels', 0),
+            'num_themes_auto': num_themes_auto,
+            'instrumentation': trace.summary(),
+            **_routing(),
+            **({
+                'project_id': project_id,
+                'files_mapped': stats['files_mapped'],
+                'files_reused': stats['files_reused'],
+                'files_removed': stats['files_removed'],
+            } if project_id else {})
+        }
+    else: # separate reports
+        def _analyze_file(file_data):
+            result = {
+                'filename': file_data['filename'],
+                'participant_id': file_data['participant_id'],
+            }
+            stats = {}
+            try:
+                analysis_result = _run_single_analysis(
+                    _load_corpus([file_data]), file_data['participant_id'], stats=stats
+                )
+            except Exception as e:
+                result.update({'success': False, 'error_type': 'provider', 'error': str(e)})
+                return result
+            finally:
+                job.add('files_done')
+            result.update({
+                'analysis': analysis_result,
+                'segments_processed': stats['segments_processed'],
+                'segment_timings': stats['segment_timings'],
             })
-        else: # separate reports
-            separate_results = []
-            for file_data in files_data:
-                analysis_result = _run_single_analysis(file_data['data_content'], file_data['participant_id'])
+            with trace.span('parse'):
                 parsed = parse_response_to_csv(analysis_result)
-                if not parsed or len(parsed) < 2:
-                    return jsonify({'success': False, 'error': f"AI did not return a valid table for file {file_data['filename']}. Try using a fixed number of themes or fewer files."})
-                num_themes_auto = None
-                if num_themes == 'auto':
-                    num_themes_auto = len(parsed) - 1
-                separate_results.append({
-                    'filename': file_data['filename'],
-                    'participant_id': file_data['participant_id'],
-                    'analysis': analysis_result,
-                    'num_themes_auto': num_themes_auto
+            if not parsed or len(parsed) < 2:
+                result.update({
+                    'success': False,
+                    'error_type': 'parse',
+                    'error': 'AI did not return a valid table. Try using a fixed number of themes.',
                 })
-            
-            return jsonify({
-                'success': True,
+                return result
+            result['success'] = True
+            result['num_themes_auto'] = len(parsed) - 1 if num_themes == 'auto' else None
+            return result
+
+        file_workers = min(max_file_concurrency, len(files_data))
+        with ThreadPoolExecutor(max_workers=max(1, file_workers)) as pool:
+            separate_results = list(pool.map(_analyze_file, files_data))
+
+        files_failed = sum(1 for r in separate_results if not r['success'])
+        if files_failed == len(separate_results):
+            first_error = separate_results[0]
+            return {
+                'success': False,
+                'error': f"Analysis failed for every file (first error, {first_error['filename']}: {first_error['error']})",
                 'response': separate_results,
-                'report_type': 'separate'
-            })
+                'report_type': 'separate',
+                'instrumentation': trace.summary()
+            }
 
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return {
+            'success': True,
+            'response': separate_results,
+            'report_type': 'separate',
+            'files_failed': files_failed,
+            'instrumentation': trace.summary(),
+            **_routing(),
+        }
 
-def split_into_segments(text, max_tokens=120000):
-    """Split text into segments that fit within GPT-4o's token limits
-    
-    GPT-4o has 128k context window, so we use 120k for data and reserve 8k for prompts/responses.
-    This is a ~30x increase from the previous 3800 token limit for GPT-3.5-turbo.
-    Most datasets will now process in a single call.
+def split_into_segments(corpus, max_tokens=120000, token_counter=None, overlap_tokens=0):
+    """Split a ``CodedCorpus`` into segments of at most ``max_tokens`` tokens.
+
+    /analyze passes the budget computed by ``model_registry.segment_token_budget``
+    for the selected provider/model; the 120k default matches GPT-4o's window.
+
+    Sentence sizes come from ``token_counter`` (see token_counting.py), which should
+    match the provider/model that will receive the segments.  Segment boundaries are
+    found in linear time (see segmentation.py); the returned sequence renders each
+    segment's text when it is accessed.
     """
-    try:
-        sentences = sent_tokenize(text)
-    except:
-        # Fallback to simple splitting if NLTK fails
-        sentences = text.split('.')
-        sentences = [s + '.' for s in sentences if s.strip()]
-    
-    segments = []
-    segment = ""
-    segment_tokens = 0
-    
-    for sentence in sentences:
-        num_tokens = len(word_tokenize(sentence)) if 'word_tokenize' in globals() else len(sentence.split())
-        
-        if segment_tokens + num_tokens > max_tokens:
-            segments.append(segment.strip())
-            segment = sentence
-            segment_tokens = num_tokens
-        else:
-            segment += " " + sentence
-            segment_tokens += num_tokens
-    
-    if segment:
-        segments.append(segment.strip())
-    
-    return segments
+    return corpus.segments(max_tokens, token_counter, overlap_tokens)
+
+# User message of a merge call; the instructions from build_merge_prompt follow the system message
+MERGE_MESSAGE = "Analyze the following merged responses: {tables}"
 
-def analyze_merged_responses(merged_responses, num_themes, system_message, provider, model_name, temperature, max_tokens):
-    """Analyze merged responses to create a final summary"""
-    prompt = f"""This is the result of a thematic analysis of several parts of the dataset. Now, summarize the same themes to generate a new table.
+def build_merge_prompt(num_themes, compact=False, quote_refs=False):
+    """Return the instructions asking the model to merge partial theme tables into one."""
+    input_notes = ""
+    if compact:
+        input_notes += "\nThe partial results list each theme as '# Theme (participants: N)', followed by its description and one quote per '- ' line."
+    if quote_refs:
+        input_notes += "\nQuotes are given as references of the form {Q<number>}. In the 'Quotes' column, list the references of the supporting quotes exactly as given instead of writing the quotes out."
+    return f"""This is the result of a thematic analysis of several parts of the dataset. Now, summarize the same themes to generate a new table.
 Please identify the {num_themes} most common key themes from the interview and organize the results in a structured table format.
 The table should include the following columns:
 'Theme': Represents the main idea or topic identified from the interview.
@@ -415,17 +1033,125 @@ The table should be formatted strictly as follows:
 - End the table with '**********'.
 Ensure each row of the table represents a distinct theme and its associated details.
 
-IMPORTANT: Output ONLY the table with no additional text, commentary, or explanations. Do not include phrases like 'Here is the table', 'Below is the analysis', or 'Certainly!'. Start your response immediately with '**********' and end with '**********'. Do not use markdown formatting or code blocks.
+IMPORTANT: Output ONLY the table with no additional text, commentary, or explanations. Do not include phrases like 'Here is the table', 'Below is the analysis', or 'Certainly!'. Start your response immediately with '**********' and end with '**********'. Do not use markdown formatting or code blocks.{input_notes}"""
 
-Analyze the following merged responses: {merged_responses}"""
-    
-    response_text = provider.chat(
-        system_message,
-        prompt,
-        model=model_name or "auto",  # Use selected model or default
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
+def compact_partial_tables(tables, quote_index=None):
+    """Re-serialise partial tables in the compact merge format.
+
+    Each table stays one unit; within it, duplicate themes are combined and quotes
+    already given for the same theme by an earlier table are dropped.  Tables that
+    cannot be parsed are passed through unchanged.
+    """
+    seen_quotes = {}
+    compacted = []
+    for table in tables:
+        rows = dedupe_theme_rows(parse_theme_rows(table))
+        if not rows:
+            compacted.append(table)
+            continue
+        blocks = []
+        for row in rows:
+            seen = seen_quotes.setdefault(theme_key(row.theme), set())
+            quotes = [quote for quote in row.quotes if quote not in seen]
+            seen.update(quotes)
+            blocks.append(serialize_theme_row(row._replace(quotes=quotes), quote_index))
+        compacted.append("\n\n".join(blocks))
+    return compacted
+
+def batch_partial_tables(tables, fan_in, budget, token_counter):
+    """Group consecutive tables into batches of at most ``fan_in`` tables and ``budget`` tokens.
+
+    A table larger than the budget still gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for table in tables:
+        table_tokens = token_counter.count(table)
+        if batch and (len(batch) >= fan_in or batch_tokens + table_tokens > budget):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(table)
+        batch_tokens += table_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def analyze_merged_responses(partial_tables, num_themes, system_message, provider, model_name, temperature, max_tokens,
+                             on_token=None, token_counter=None, budget=120000, fan_in=None, max_workers=1, stats=None,
+                             compact=True, quote_refs=False, batch=False):
+    """Analyze merged responses to create a final summary
+
+    Partial tables are reduced as a tree: consecutive tables are grouped into
+    batches that fit the merge budget (at most ``fan_in`` per batch), every batch
+    is merged in parallel, and the results are merged again until one batch
+    remains.  That last merge is streamed through ``on_token``.  When no two
+    tables fit one call, each is merged on its own first; a table that does not
+    fit the budget at all raises ``ValueError``.
+
+    With ``compact`` every level is re-serialised by ``compact_partial_tables``
+    before batching; ``quote_refs`` additionally sends quotes as ``{Qn}``
+    references and expands them in the final table.  With ``batch`` the
+    intermediate levels go through the provider's batch API; the final merge is
+    always a real-time call.
+    """
+    if token_counter is None:
+        token_counter = get_token_counter()
+    fan_in = max(2, int(fan_in or MERGE_FAN_IN))
+    quote_index = QuoteIndex() if compact and quote_refs else None
+    # Same prefix for every merge call of the run (see map_system_message in run_analysis)
+    merge_system_message = system_message + "\n\n" + build_merge_prompt(num_themes, compact, quote_index is not None)
+
+    level = list(partial_tables)
+    merge_levels = 0
+    condensed_tokens = None
+    while True:
+        if compact:
+            level = compact_partial_tables(level, quote_index)
+        table_tokens = [token_counter.count(table) for table in level]
+        if max(table_tokens) > budget:
+            raise ValueError(
+                f"A partial table ({max(table_tokens)} tokens) does not fit the merge budget of {budget} tokens; "
+                "lower max_tokens or choose a model with a larger context window"
+            )
+        groups = batch_partial_tables(level, fan_in, budget, token_counter)
+        if len(groups) == 1:
+            break
+        # When no two consecutive tables fit one call, every table is merged on its own
+        # (condensed to the requested themes) so the next level can pair them up
+        condense = len(groups) == len(level)
+        if condense:
+            if condensed_tokens is not None and sum(table_tokens) >= condensed_tokens:
+                raise ValueError(
+                    f"The partial tables cannot be merged within the merge budget of {budget} tokens; "
+                    "lower max_tokens or choose a model with a larger context window"
+                )
+            condensed_tokens = sum(table_tokens)
+        merged_level, _ = map_segments(
+            provider,
+            merge_system_message,
+            [MERGE_MESSAGE.format(tables="\n\n".join(group)) for group in groups if condense or len(group) > 1],
+            model_name,
+            temperature,
+            max_tokens,
+            max_workers=max_workers,
+            stage='merge',
+            batch=batch,
+        )
+        # Otherwise single-table groups skip the model and move up a level unchanged
+        merged_iter = iter(merged_level)
+        level = [next(merged_iter) if condense or len(group) > 1 else group[0] for group in groups]
+        merge_levels += 1
+
+    if stats is not None:
+        stats['merge_levels'] = merge_levels + 1
+
+    message = MERGE_MESSAGE.format(tables="\n\n".join(groups[0]))
+    with call_stage('merge'):
+        response_text = call_provider(provider, merge_system_message, message, model_name, temperature, max_tokens, on_token=on_token)
+    if quote_index is not None:
+        response_text = quote_index.expand(response_text)
     
     return response_text
 
@@ -460,31 +1186,5 @@ def export_csv():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-def parse_response_to_csv(response):
-    """Parse the GPT response to extract table data"""
-    lines = response.strip().split("\n")
-    
-    # Find table delimiters
-    delimiter_indices = [i for i, line in enumerate(lines) if line.strip() == "**********"]
-    
-    if len(delimiter_indices) < 2:
-        return []
-    
-    start_index, end_index = delimiter_indices[0], delimiter_indices[-1]
-    table_content = lines[start_index+1:end_index]
-    
-    # Parse table rows
-    parsed_data = []
-    for line in table_content:
-        if line.strip() and '|' in line and not line.strip().startswith('|---'):
-            # Split by | and clean up
-            cells = [cell.strip() for cell in line.split('|')]
-            # Remove empty cells at start and end
-            cells = [cell for cell in cells if cell]
-            if cells:
-                parsed_data.append(cells)
-    
-    return parsed_data
-
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,390 @@
+"""rate_limiting.py
+
+Process-wide rate limiting and retry for provider calls.
+
+* `TokenBucket` – classic token bucket; `acquire(n)` blocks until `n` units are
+  available (`aacquire(n)` awaits instead, for the async provider calls).
+* `RateLimiter` – one requests-per-minute and one tokens-per-minute bucket for a
+  (provider, model) pair.  It adapts: every throttling response halves the
+  effective rate, and successful calls gradually restore it.
+* `get_rate_limiter(provider, model)` – the shared limiter for that pair, so all
+  concurrent jobs in the process draw from the same budget (unknown models use
+  the provider default's limiter).
+* `RateLimitedProvider` – `ProviderWrapper` that waits for budget before each call
+  and retries 429 / overload / transient errors with jittered exponential backoff,
+  honouring `Retry-After` when the provider sends it.  `achat` / `achat_stream` do
+  the same without blocking the event loop.  Batch submissions (`run_batch`) pass
+  through unlimited: batch APIs have their own, separate quotas.
+
+Default budgets live in `RATE_LIMITS`; `QUALIGPT_RPM` / `QUALIGPT_TPM` override
+them for every provider.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from llm_providers import BaseProvider, ProviderWrapper
+from model_registry import DEFAULT_MODELS, MODEL_REGISTRY, resolve_model
+from token_counting import get_token_counter
+
+# (requests per minute, tokens per minute) – conservative entry-tier limits
+RATE_LIMITS: Dict[str, Tuple[int, int]] = {
+    "openai": (500, 300_000),
+    "anthropic": (50, 40_000),
+    "gemini": (150, 1_000_000),
+    "deepseek": (60, 100_000),
+    # Offline stand-in used by the benchmarks; effectively unlimited
+    "fake": (1_000_000, 1_000_000_000),
+    # The router's routes are limited by their own providers' budgets
+    "router": (1_000_000, 1_000_000_000),
+}
+DEFAULT_RATE_LIMIT = (60, 100_000)
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# SDK exception class names that signal a transient failure
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "OverloadedError",
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "TooManyRequests",
+}
+
+# --- Buckets -----------------------------------------------------------------
+
+class TokenBucket:
+    """Refills ``rate`` units per second up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._available = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, amount: float) -> float:
+        """Take ``amount`` units if available and return 0, else return the seconds to wait."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._available >= amount:
+                self._available -= amount
+                return 0.0
+            return (amount - self._available) / self.rate
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until ``amount`` units are available; return the seconds waited."""
+        # A single request larger than the bucket may still go once the bucket is full
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            delay = self._take(amount)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def aacquire(self, amount: float = 1.0) -> float:
+        """Like `acquire`, but sleeps with ``asyncio.sleep``."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            delay = self._take(amount)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the provider reported throttling."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available = 0.0
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget for one (provider, model)."""
+
+    # The effective rate never drops below this fraction of the configured budget
+    MIN_FACTOR = 0.1
+    RECOVERY_STEP = 0.05
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.factor = 1.0
+        self._requests = TokenBucket(requests_per_minute / 60.0, max(1, requests_per_minute / 6.0))
+        self._tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    def acquire(self, tokens: int) -> float:
+        """Wait for one request slot and ``tokens`` tokens; return the seconds waited."""
+        return self._requests.acquire(1) + self._tokens.acquire(tokens)
+
+    async def aacquire(self, tokens: int) -> float:
+        return await self._requests.aacquire(1) + await self._tokens.aacquire(tokens)
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.factor < 1.0:
+                self._set_factor(min(1.0, self.factor + self.RECOVERY_STEP))
+
+    def on_throttled(self) -> None:
+        with self._lock:
+            self.throttled += 1
+            self._set_factor(max(self.MIN_FACTOR, self.factor / 2))
+        self._requests.drain()
+
+    def _set_factor(self, factor: float) -> None:
+        self.factor = factor
+        self._requests.rate = self.requests_per_minute * factor / 60.0
+        self._tokens.rate = self.tokens_per_minute * factor / 60.0
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: Optional[str]) -> RateLimiter:
+    """Return the process-wide limiter for a provider/model pair.
+
+    Models missing from `MODEL_REGISTRY` share the provider's default-model
+    limiter: model names come from requests, and a fresh budget per unknown name
+    would both grow this table without bound and sidestep the limit.
+    """
+    provider = (provider or "").lower()
+    model = resolve_model(provider, model)
+    if model not in MODEL_REGISTRY:
+        model = DEFAULT_MODELS.get(provider, "")
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            rpm, tpm = RATE_LIMITS.get(provider, DEFAULT_RATE_LIMIT)
+            rpm = int(os.environ.get("QUALIGPT_RPM", rpm))
+            tpm = int(os.environ.get("QUALIGPT_TPM", tpm))
+            limiter = RateLimiter(rpm, tpm)
+            _limiters[key] = limiter
+        return limiter
+
+# --- Error classification ----------------------------------------------------
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Return True for throttling, overload and transient network/server errors."""
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+def is_throttling(exc: BaseException) -> bool:
+    return _status_code(exc) in (429, 529) or type(exc).__name__ in (
+        "RateLimitError",
+        "OverloadedError",
+        "ResourceExhausted",
+        "TooManyRequests",
+    )
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Return the delay requested by the provider's ``Retry-After`` header, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):  # HTTP-date form or garbage: fall back to backoff
+        return None
+    return None
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+# --- Provider wrapper --------------------------------------------------------
+
+class RateLimitedProvider(ProviderWrapper):
+    """Throttle calls through the shared `RateLimiter` and retry transient failures."""
+
+    def __init__(self, inner: BaseProvider, provider_name: str, max_retries: int = MAX_RETRIES):
+        super().__init__(inner)
+        self.provider_name = provider_name
+        self.max_retries = max_retries
+
+    def _call_cost(self, system_message: str, user_message: str, model: str, max_tokens: int) -> Tuple[RateLimiter, int]:
+        counter = get_token_counter(self.provider_name, model)
+        tokens = counter.count(system_message) + counter.count(user_message) + max_tokens
+        return get_rate_limiter(self.provider_name, model), tokens
+
+    def _before_call(self, system_message: str, user_message: str, model: str, max_tokens: int) -> RateLimiter:
+        limiter, tokens = self._call_cost(system_message, user_message, model, max_tokens)
+        limiter.acquire(tokens)
+        return limiter
+
+    async def _abefore_call(self, system_message: str, user_message: str, model: str, max_tokens: int) -> RateLimiter:
+        # Token counting (tiktoken) runs in a worker thread so it does not stall the event loop
+        limiter, tokens = await asyncio.to_thread(self._call_cost, system_message, user_message, model, max_tokens)
+        await limiter.aacquire(tokens)
+        return limiter
+
+    def _retry_delay(self, limiter: RateLimiter, exc: BaseException, attempt: int) -> float:
+        if is_throttling(exc):
+            limiter.on_throttled()
+        delay = retry_after_seconds(exc)
+        return delay if delay is not None else backoff_seconds(attempt)
+
+    def _wait_before_retry(self, limiter: RateLimiter, exc: BaseException, attempt: int) -> None:
+        time.sleep(self._retry_delay(limiter, exc, attempt))
+
+    def chat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        attempt = 0
+        while True:
+            limiter = self._before_call(system_message, user_message, model, max_tokens)
+            try:
+                response_text = self.inner.chat(
+                    system_message,
+                    user_message,
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self._wait_before_retry(limiter, e, attempt)
+                attempt += 1
+                continue
+            limiter.on_success()
+            return response_text
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        attempt = 0
+        while True:
+            limiter = self._before_call(system_message, user_message, model, max_tokens)
+            started = False
+            try:
+                for piece in self.inner.chat_stream(
+                    system_message,
+                    user_message,
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                ):
+                    started = True
+                    yield piece
+            except Exception as e:
+                # Once output has been forwarded a retry would duplicate it
+                if started or attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self._wait_before_retry(limiter, e, attempt)
+                attempt += 1
+                continue
+            limiter.on_success()
+            return
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        attempt = 0
+        while True:
+            limiter = await self._abefore_call(system_message, user_message, model, max_tokens)
+            try:
+                response_text = await self.inner.achat(
+                    system_message,
+                    user_message,
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                await asyncio.sleep(self._retry_delay(limiter, e, attempt))
+                attempt += 1
+                continue
+            limiter.on_success()
+            return response_text
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            limiter = await self._abefore_call(system_message, user_message, model, max_tokens)
+            started = False
+            try:
+                async for piece in self.inner.achat_stream(
+                    system_message,
+                    user_message,
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                ):
+                    started = True
+                    yield piece
+            except Exception as e:
+                if started or attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                await asyncio.sleep(self._retry_delay(limiter, e, attempt))
+                attempt += 1
+                continue
+            limiter.on_success()
+            return
@@ -0,0 +1,391 @@
+"""response_cache.py
+
+Content-addressed cache for LLM chat completions.
+
+Identical requests (same provider, API key, model, system message, user message,
+temperature and `max_tokens`) return the stored completion instead of calling the provider
+again, so re-running a dataset or only tweaking the merge prompt does not re-bill
+unchanged segments.
+
+* `MemoryBackend` – in-process LRU tier.
+* `SQLiteBackend` – optional on-disk tier shared across restarts.
+* `ResponseCache` – checks the tiers in order and keeps hit/miss counters.
+* `StoredResponseProvider` – `ProviderWrapper` that answers calls from any keyed
+  store given as get/put callables and stores new answers (sync, async and batch).
+* `CachingProvider` – `StoredResponseProvider` that puts a `ResponseCache` in front
+  of `BaseProvider.chat` (and its async counterparts).
+
+Both backends evict by entry count (least recently used first) and by age (TTL).
+Other backends only need `get(key)`, `set(key, value)` and `clear()`.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+from llm_providers import BaseProvider, ProviderWrapper
+
+# --- Keys --------------------------------------------------------------------
+
+def cache_key(
+    provider: str,
+    model: str,
+    system_message: str,
+    user_message: str,
+    temperature: float,
+    max_tokens: int,
+    account: str = "",
+) -> str:
+    """Return the SHA-256 hex digest identifying one chat request.
+
+    ``account`` (e.g. `account_fingerprint` of the API key) keeps the requests of
+    different credentials apart.
+    """
+    fields = [provider, model, system_message, user_message, float(temperature), int(max_tokens)]
+    if account:
+        fields.append(account)
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def account_fingerprint(api_key: str) -> str:
+    """Return a SHA-256 digest of an API key (for the router: of its route spec)."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+# --- Backends ----------------------------------------------------------------
+
+class MemoryBackend:
+    """Thread-safe LRU dictionary with a per-entry time-to-live."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk tier stored in a single SQLite file."""
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.ttl_seconds is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+                )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+# --- Cache -------------------------------------------------------------------
+
+class ResponseCache:
+    """Tiered cache: the first tier is checked first and back-filled on lower-tier hits."""
+
+    def __init__(self, tiers: List):
+        self.tiers = tiers
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits = [0] * len(tiers)
+
+    def get(self, key: str) -> Optional[str]:
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for upper in self.tiers[:index]:
+                    upper.set(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.tier_hits[index] += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "tiers": [
+                    {"backend": type(tier).__name__, "entries": len(tier), "hits": hits}
+                    for tier, hits in zip(self.tiers, self.tier_hits)
+                ],
+            }
+
+# --- Provider wrapper --------------------------------------------------------
+
+class StoredResponseProvider(ProviderWrapper):
+    """Answer calls from a keyed store and store every new non-empty answer.
+
+    ``get(key)`` returns a stored answer or None and ``put(key, text)`` stores one;
+    keys are `cache_key` of the request (and of ``account``, if given).  Base of
+    `CachingProvider` and `run_store.CheckpointingProvider`.
+    """
+
+    def __init__(
+        self,
+        inner: BaseProvider,
+        get: Callable[[str], Optional[str]],
+        put: Callable[[str, str], None],
+        account: str = "",
+    ):
+        super().__init__(inner)
+        self._get = get
+        self._put = put
+        self.account = account
+
+    def _key(self, system_message: str, user_message: str, model: str, max_tokens: int, temperature: float) -> str:
+        return cache_key(self.name, model, system_message, user_message, temperature, max_tokens, self.account)
+
+    def _lookup(self, system_message: str, user_message: str, model: str, max_tokens: int, temperature: float):
+        key = self._key(system_message, user_message, model, max_tokens, temperature)
+        return key, self._get(key)
+
+    def chat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        key = self._key(system_message, user_message, model, max_tokens, temperature)
+        stored = self._get(key)
+        if stored is not None:
+            return stored
+        response_text = self.inner.chat(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        if response_text:
+            self._put(key, response_text)
+        return response_text
+
+    def chat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> Iterator[str]:
+        key = self._key(system_message, user_message, model, max_tokens, temperature)
+        stored = self._get(key)
+        if stored is not None:
+            yield stored
+            return
+        pieces = []
+        for piece in self.inner.chat_stream(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        ):
+            pieces.append(piece)
+            yield piece
+        response_text = "".join(pieces)
+        if response_text:
+            self._put(key, response_text)
+
+    async def achat(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> str:
+        # Hashing and store I/O (SQLite) would block every call multiplexed on the loop
+        key, stored = await asyncio.to_thread(self._lookup, system_message, user_message, model, max_tokens, temperature)
+        if stored is not None:
+            return stored
+        response_text = await self.inner.achat(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        if response_text:
+            await asyncio.to_thread(self._put, key, response_text)
+        return response_text
+
+    async def achat_stream(
+        self,
+        system_message: str,
+        user_message: str,
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+    ) -> AsyncIterator[str]:
+        key, stored = await asyncio.to_thread(self._lookup, system_message, user_message, model, max_tokens, temperature)
+        if stored is not None:
+            yield stored
+            return
+        pieces = []
+        async for piece in self.inner.achat_stream(
+            system_message,
+            user_message,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        ):
+            pieces.append(piece)
+            yield piece
+        response_text = "".join(pieces)
+        if response_text:
+            await asyncio.to_thread(self._put, key, response_text)
+
+    def run_batch(
+        self,
+        system_message: str,
+        user_messages: Sequence[str],
+        *,
+        model: str = "auto",
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        poll_seconds: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Optional[str]]:
+        answers: List[Optional[str]] = [None] * len(user_messages)
+        missing: List[int] = []
+        keys: List[str] = []
+        # Lazily rendered messages are rendered once here; only the unanswered ones are kept
+        missing_messages: List[str] = []
+        for index in range(len(user_messages)):
+            user_message = user_messages[index]
+            key = self._key(system_message, user_message, model, max_tokens, temperature)
+            stored = self._get(key)
+            if stored is not None:
+                answers[index] = stored
+            else:
+                missing.append(index)
+                keys.append(key)
+                missing_messages.append(user_message)
+        if missing:
+            batch_answers = self.inner.run_batch(
+                system_message,
+                missing_messages,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                poll_seconds=poll_seconds,
+                timeout=timeout,
+            )
+            for index, key, answer in zip(missing, keys, batch_answers):
+                answers[index] = answer
+                if answer:
+                    self._put(key, answer)
+        return answers
+
+
+class CachingProvider(StoredResponseProvider):
+    """Serve repeated chat requests from a `ResponseCache`.
+
+    The cache is shared by every user of the process, so entries are scoped to the
+    API key: one key's answers are never served to another.
+    """
+
+    def __init__(self, inner: BaseProvider, cache: ResponseCache):
+        super().__init__(inner, cache.get, cache.set, account=account_fingerprint(inner.api_key))
+        self.cache = cache
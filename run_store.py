@@ -0,0 +1,182 @@
+"""run_store.py
+
+Checkpoints of analysis runs so a crashed or failed run can be resumed without
+paying again for the provider calls that already succeeded.
+
+* `RunStore` – SQLite file holding one row per run (status, request payload without
+  the API key, final result) and every completed provider call of that run, keyed
+  by `response_cache.cache_key` of the request.
+* `CheckpointingProvider` – `ProviderWrapper` that answers calls already recorded
+  for its run from the store and records new ones as soon as they finish (sync and
+  async calls alike).
+
+Because segment and merge prompts are rebuilt deterministically from the stored
+payload, resuming a run replays completed segment (map) calls and per-file results
+from the store and only sends the missing calls and the merges that depend on them.
+Runs are deleted `retention_seconds` after their last update.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from llm_providers import BaseProvider
+from response_cache import StoredResponseProvider
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+def default_run_store_path() -> str:
+    """Return ``QUALIGPT_RUN_STORE_PATH`` or a file in the system temp directory."""
+    return os.environ.get(
+        "QUALIGPT_RUN_STORE_PATH", os.path.join(tempfile.gettempdir(), "qualigpt-runs.sqlite3")
+    )
+
+
+def content_id(*parts: str) -> str:
+    """Return a stable ID derived from ``parts`` (run and checkpoint IDs of the desktop app)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+# --- Store -------------------------------------------------------------------
+
+class RunStore:
+    """Runs and their completed provider calls, stored in one SQLite file."""
+
+    def __init__(self, path: str, retention_seconds: Optional[float] = DEFAULT_RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " result TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS run_outputs ("
+                " run_id TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " output TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (run_id, key))"
+            )
+
+    def create_run(self, payload: Dict[str, Any], run_id: Optional[str] = None) -> str:
+        """Record a new run (or restart an existing one) and return its ID."""
+        run_id = run_id or uuid.uuid4().hex
+        now = time.time()
+        self._evict_expired(now)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO runs (run_id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(run_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                (run_id, RUNNING, json.dumps(payload, ensure_ascii=False), now, now),
+            )
+        return run_id
+
+    def restart_run(self, run_id: str) -> bool:
+        """Mark a finished run as running again; False if it is unknown or still running."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ? AND status != ?",
+                (RUNNING, time.time(), run_id, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Return the run's status, payload, result and number of completed calls."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, payload, result, error, created_at, updated_at FROM runs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            completed = self._conn.execute(
+                "SELECT COUNT(*) FROM run_outputs WHERE run_id = ?", (run_id,)
+            ).fetchone()[0]
+        status, payload, result, error, created_at, updated_at = row
+        return {
+            "run_id": run_id,
+            "status": status,
+            "payload": json.loads(payload),
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "completed_calls": completed,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def finish_run(self, run_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE runs SET status = ?, result = ?, error = ?, updated_at = ? WHERE run_id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), run_id),
+            )
+
+    def get_output(self, run_id: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM run_outputs WHERE run_id = ? AND key = ?", (run_id, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_output(self, run_id: str, key: str, output: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO run_outputs (run_id, key, output, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, key, output, now),
+            )
+            self._conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+
+    def delete_run(self, run_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM run_outputs WHERE run_id = ?", (run_id,))
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def _evict_expired(self, now: float) -> None:
+        if self.retention_seconds is None:
+            return
+        cutoff = now - self.retention_seconds
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM run_outputs WHERE run_id IN (SELECT run_id FROM runs WHERE updated_at < ?)",
+                (cutoff,),
+            )
+            self._conn.execute("DELETE FROM runs WHERE updated_at < ?", (cutoff,))
+
+# --- Provider wrapper --------------------------------------------------------
+
+class CheckpointingProvider(StoredResponseProvider):
+    """Record every successful call of one run and replay it when the run is resumed."""
+
+    def __init__(self, inner: BaseProvider, store: RunStore, run_id: str):
+        super().__init__(
+            inner,
+            lambda key: store.get_output(run_id, key),
+            lambda key, text: store.save_output(run_id, key, text),
+        )
+        self.store = store
+        self.run_id = run_id
@@ -0,0 +1,235 @@
+"""segmentation.py
+
+Linear-time splitting of a dataset into segments that fit a token budget.
+
+Units of text are located as ``(start, end)`` offsets into the original text and
+each segment is produced with a single slice of that text, so building a segment
+never copies earlier units again (the old ``segment += " " + sentence`` loop
+re-copied the growing segment).  Segments keep the original whitespace, including
+the newlines that separate participant-coded lines.
+
+Units are lines, found with ``str.find``; only a line that on its own exceeds the
+budget is split further into sentences with NLTK Punkt.  Running Punkt over every
+sentence of the corpus was by far the most expensive part of segmentation, and a
+line boundary is always also a sentence boundary (and keeps a participant code
+together with its quote).
+
+* `sentence_spans(text)` – lazily yield sentence offsets (NLTK Punkt, with a
+  regex fallback when the Punkt model is unavailable).
+* `iter_segments(text, max_tokens, token_counter, overlap_tokens=0)` – generator of
+  segment strings; consecutive segments may share up to `overlap_tokens` worth of
+  trailing units for context.
+* `CodedCorpus` – several files plus a participant index; `segments()` splits them
+  the same way and renders the participant-coded text of a segment only when it
+  is accessed.
+"""
+from __future__ import annotations
+
+import re
+from array import array
+from collections import deque
+from collections.abc import Sequence
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from token_counting import TokenCounter, get_token_counter
+
+_FALLBACK_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+
+_punkt = None
+
+# --- Sentence boundaries -----------------------------------------------------
+
+def _get_punkt():
+    """Return a cached English Punkt tokenizer, or ``None`` if NLTK cannot load one."""
+    global _punkt
+    if _punkt is None:
+        try:
+            from nltk.tokenize.punkt import PunktTokenizer  # type: ignore  # nltk>=3.8.2
+
+            _punkt = PunktTokenizer("english")
+        except Exception:
+            try:
+                import nltk.data  # type: ignore
+
+                _punkt = nltk.data.load("tokenizers/punkt/english.pickle")
+            except Exception:
+                _punkt = False
+    return _punkt or None
+
+
+def sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """Yield ``(start, end)`` offsets of the sentences in ``text``."""
+    punkt = _get_punkt()
+    if punkt is not None:
+        yield from punkt.span_tokenize(text)
+        return
+    for match in _FALLBACK_SENTENCE_RE.finditer(text):
+        if match.group().strip():
+            yield match.span()
+
+def _unit_spans(text: str, max_tokens: int, token_counter: TokenCounter, prefix: str = "") -> Iterator[Tuple[int, int, int]]:
+    """Yield ``(start, end, tokens)`` for each non-blank line, splitting oversized lines into sentences.
+
+    Token counts include ``prefix`` (a participant code the unit will be rendered with).
+    """
+    pos = 0
+    length = len(text)
+    while pos < length:
+        newline = text.find("\n", pos)
+        end = length if newline == -1 else newline + 1
+        line = text[pos:end]
+        if line.strip():
+            num_tokens = token_counter.count(prefix + line)
+            if num_tokens <= max_tokens:
+                yield pos, end, num_tokens
+            else:
+                for start, stop in sentence_spans(line):
+                    yield pos + start, pos + stop, token_counter.count(prefix + line[start:stop])
+        pos = end
+
+# --- Segments ----------------------------------------------------------------
+
+def _iter_windows(
+    units: Iterator[tuple],
+    max_tokens: int,
+    overlap_tokens: int,
+) -> Iterator[Deque[tuple]]:
+    """Group units (tuples whose last item is their token count) into segment windows."""
+    window: Deque[tuple] = deque()
+    window_tokens = 0
+
+    for unit in units:
+        num_tokens = unit[-1]
+        if window and window_tokens + num_tokens > max_tokens:
+            yield window
+
+            # Keep trailing units as overlap, as long as they leave room for this one
+            carried = 0
+            kept: Deque[tuple] = deque()
+            while window and carried + window[-1][-1] <= min(overlap_tokens, max_tokens - num_tokens):
+                kept_unit = window.pop()
+                kept.appendleft(kept_unit)
+                carried += kept_unit[-1]
+            window = kept
+            window_tokens = carried
+
+        window.append(unit)
+        window_tokens += num_tokens
+
+    if window:
+        yield window
+
+
+def iter_segments(
+    text: str,
+    max_tokens: int = 120000,
+    token_counter: Optional[TokenCounter] = None,
+    overlap_tokens: int = 0,
+) -> Iterator[str]:
+    """Yield segments of ``text`` holding at most ``max_tokens`` tokens each.
+
+    A single sentence longer than ``max_tokens`` becomes a segment on its own.
+    With ``overlap_tokens`` > 0, each new segment starts with the trailing units
+    of the previous one, up to that many tokens.
+    """
+    if token_counter is None:
+        token_counter = get_token_counter()
+
+    for window in _iter_windows(_unit_spans(text, max_tokens, token_counter), max_tokens, overlap_tokens):
+        segment = text[window[0][0]:window[-1][1]].strip()
+        if segment:
+            yield segment
+
+# --- Participant-coded corpora -----------------------------------------------
+
+class CodedCorpus:
+    """The files of a run with a compact participant index.
+
+    Each file's text is held once, next to the index of its participant ID.  The
+    ``[participant] line`` form the model sees is only produced for the lines of a
+    segment when that segment is rendered, so a combined run keeps roughly one
+    copy of the corpus in memory instead of coded, joined and segmented copies.
+    """
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.participant_ids: List[str] = []
+        self._file_participants = array("l")
+
+    def add(self, text: str, participant_id: Optional[str] = None) -> None:
+        """Append a file; ``participant_id`` None leaves its lines uncoded."""
+        if participant_id is None:
+            index = -1
+        elif participant_id in self.participant_ids:
+            index = self.participant_ids.index(participant_id)
+        else:
+            index = len(self.participant_ids)
+            self.participant_ids.append(participant_id)
+        self.texts.append(text)
+        self._file_participants.append(index)
+
+    def _prefix(self, file_index: int) -> str:
+        participant = self._file_participants[file_index]
+        return f"[{self.participant_ids[participant]}] " if participant >= 0 else ""
+
+    def _unit_spans(self, max_tokens: int, token_counter: TokenCounter) -> Iterator[Tuple[int, int, int, int]]:
+        """Yield ``(file, start, end, tokens)``; tokens include the participant code."""
+        for file_index, text in enumerate(self.texts):
+            for start, end, num_tokens in _unit_spans(text, max_tokens, token_counter, self._prefix(file_index)):
+                yield file_index, start, end, num_tokens
+
+    def render(self, runs: Sequence[Tuple[int, int, int]]) -> str:
+        """Return the coded text of ``(file, start, end)`` runs, one non-blank line per line."""
+        parts = []
+        for file_index, start, end in runs:
+            prefix = self._prefix(file_index)
+            text = self.texts[file_index]
+            lines = []
+            pos = start
+            while pos < end:
+                newline = text.find("\n", pos, end)
+                stop = end if newline == -1 else newline
+                line = text[pos:stop].strip()
+                if line:
+                    lines.append(prefix + line)
+                pos = stop + 1
+            parts.append("\n".join(lines))
+        # Files are separated by a blank line, as when their coded texts were joined
+        return "\n\n".join(parts)
+
+    def segments(
+        self,
+        max_tokens: int = 120000,
+        token_counter: Optional[TokenCounter] = None,
+        overlap_tokens: int = 0,
+    ) -> "CorpusSegments":
+        """Split the corpus like `iter_segments`; segments are rendered on access."""
+        if token_counter is None:
+            token_counter = get_token_counter()
+        spans = []
+        for window in _iter_windows(self._unit_spans(max_tokens, token_counter), max_tokens, overlap_tokens):
+            # Consecutive units of one file collapse into a single (file, start, end) run
+            runs: List[Tuple[int, int, int]] = []
+            for file_index, start, end, _ in window:
+                if runs and runs[-1][0] == file_index:
+                    runs[-1] = (file_index, runs[-1][1], end)
+                else:
+                    runs.append((file_index, start, end))
+            spans.append(tuple(runs))
+        return CorpusSegments(self, spans)
+
+
+class CorpusSegments(Sequence):
+    """Lazily rendered segments of a `CodedCorpus`."""
+
+    def __init__(self, corpus: CodedCorpus, spans: List[Tuple[Tuple[int, int, int], ...]]):
+        self.corpus = corpus
+        self.spans = spans
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.corpus.render(runs) for runs in self.spans[index]]
+        return self.corpus.render(self.spans[index])
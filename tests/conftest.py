@@ -0,0 +1,32 @@
+"""Shared fixtures: the web app module and the scripted provider."""
+import importlib.util
+import os
+
+import pytest
+
+import rate_limiting
+from llm_providers import PROVIDER_MAP
+from tests.scripted import ScriptedProvider
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def webapp(tmp_path_factory):
+    """qualigpt-webapp.py, imported with its stores in a temporary directory."""
+    workdir = tmp_path_factory.mktemp("webapp")
+    os.environ.setdefault("QUALIGPT_UPLOAD_DIR", str(workdir / "uploads"))
+    os.environ.setdefault("QUALIGPT_RUN_STORE_PATH", str(workdir / "runs.sqlite3"))
+    os.environ.setdefault("QUALIGPT_PROJECT_STORE_PATH", str(workdir / "projects.sqlite3"))
+    spec = importlib.util.spec_from_file_location("qualigpt_webapp", os.path.join(ROOT, "qualigpt-webapp.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    """Register `ScriptedProvider` as provider ``scripted``, without rate limits."""
+    monkeypatch.setitem(PROVIDER_MAP, "scripted", ScriptedProvider)
+    monkeypatch.setitem(rate_limiting.RATE_LIMITS, "scripted", rate_limiting.RATE_LIMITS["fake"])
+    return ScriptedProvider
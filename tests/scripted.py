@@ -0,0 +1,59 @@
+"""Offline test doubles: a scripted provider and a word-based token counter."""
+import threading
+import time
+
+from llm_providers import BaseProvider
+from token_counting import TokenCounter
+
+# How long a provider whose API key starts with "slow" takes to answer
+SLOW_SECONDS = 1.0
+
+
+class StatusError(RuntimeError):
+    """An SDK-style error carrying an HTTP status code."""
+
+    def __init__(self, status_code: int, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        if headers is not None:
+            self.response = type("Response", (), {"status_code": status_code, "headers": headers})()
+
+
+class ScriptedProvider(BaseProvider):
+    """Answers ``answer(<user message>)`` after raising the queued ``failures``.
+
+    The API key selects how it behaves as a router route: keys starting with
+    ``error`` always fail with a 500, keys starting with ``slow`` answer after
+    `SLOW_SECONDS`.  ``reply(system, user)`` may replace the default answer.
+    """
+
+    def __init__(self, api_key: str = "test", failures=(), reply=None):
+        super().__init__(api_key)
+        self.failures = list(failures)
+        self.reply = reply
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def test_connection(self) -> None:
+        pass
+
+    def chat(self, system_message, user_message, *, model="auto", max_tokens=4000, temperature=0.7):
+        with self._lock:
+            self.calls.append(user_message)
+            failure = self.failures.pop(0) if self.failures else None
+        if self.api_key.startswith("error"):
+            raise StatusError(500)
+        if self.api_key.startswith("slow"):
+            time.sleep(SLOW_SECONDS)
+        if failure is not None:
+            raise failure
+        if self.reply is not None:
+            return self.reply(system_message, user_message)
+        return f"answer({user_message})"
+
+
+class WordCounter(TokenCounter):
+    """One token per whitespace-separated word."""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
@@ -0,0 +1,45 @@
+"""Tests for docx_extraction.py."""
+import io
+import os
+
+import docx
+
+from docx_extraction import iter_docx_lines
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample-interview.docx")
+
+
+def _document():
+    document = docx.Document()
+    document.add_paragraph("Interviewer: How do you work?")
+    document.add_paragraph("")
+    document.add_paragraph("P1: Mostly from home.\nSometimes at the office.")
+    table = document.add_table(rows=3, cols=2)
+    merged = table.cell(0, 0).merge(table.cell(0, 1))
+    merged.text = "Merged across"
+    table.cell(1, 0).merge(table.cell(2, 0)).text = "Merged down"
+    table.cell(1, 1).text = "Right 1"
+    table.cell(2, 1).text = "Right 2"
+    document.add_paragraph("Closing remarks")
+    stream = io.BytesIO()
+    document.save(stream)
+    stream.seek(0)
+    return stream
+
+
+def test_lines_in_document_order_with_merged_cells_once():
+    assert list(iter_docx_lines(_document())) == [
+        "Interviewer: How do you work?",
+        "P1: Mostly from home.",
+        "Sometimes at the office.",
+        "Merged across",
+        "Merged down",
+        "Right 1",
+        "Right 2",
+        "Closing remarks",
+    ]
+
+
+def test_bundled_sample_has_text():
+    lines = list(iter_docx_lines(SAMPLE))
+    assert lines and all(line == line.strip() and line for line in lines)
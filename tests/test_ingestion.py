@@ -0,0 +1,29 @@
+"""Tests for ingestion.py."""
+import io
+
+from ingestion import iter_csv_frames, iter_xlsx_frames, row_lines
+
+
+def _lines(frames):
+    return [line for frame in frames for line in row_lines(frame)]
+
+
+def test_csv_chunks_render_like_one_frame():
+    data = "id,score,text\n1,2.50,a\n2,3,b\n,4,c\n4,,d\n"
+    chunked = _lines(iter_csv_frames(io.StringIO(data), chunk_rows=2))
+    whole = _lines(iter_csv_frames(io.StringIO(data), chunk_rows=100))
+    assert chunked == whole == ["1 2.50 a", "2 3 b", "nan 4 c", "4 nan d"]
+
+
+def test_xlsx_chunks_keep_integer_columns():
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["id", "text"])
+    for row in ([1, "a"], [2, "b"], [None, "c"], [4, "d"]):
+        sheet.append(row)
+    stream = io.BytesIO()
+    workbook.save(stream)
+    stream.seek(0)
+    assert _lines(iter_xlsx_frames(stream, chunk_rows=2)) == ["1 a", "2 b", "nan c", "4 d"]
@@ -0,0 +1,43 @@
+"""Tests for instrumentation.py."""
+import pytest
+
+from instrumentation import InstrumentedProvider, OTHER_LABEL, Trace, metric_labels, stage
+from llm_providers import report_usage
+from tests.scripted import ScriptedProvider, StatusError
+
+
+class ReportingProvider(ScriptedProvider):
+    def chat(self, system_message, user_message, **kwargs):
+        text = super().chat(system_message, user_message, **kwargs)
+        report_usage(11, 7, 5)
+        return text
+
+
+def test_metric_labels_bound_free_form_values():
+    assert metric_labels("OpenAI", "gpt-4o") == {"provider": "openai", "model": "gpt-4o"}
+    assert metric_labels("router", "router") == {"provider": "router", "model": "router"}
+    assert metric_labels("made-up", "my-model-123") == {"provider": OTHER_LABEL, "model": OTHER_LABEL}
+
+
+def test_provider_calls_are_recorded_as_spans():
+    trace = Trace()
+    provider = InstrumentedProvider(ReportingProvider(), trace, "fake", "auto")
+    with trace.span("map"), stage("map"):
+        provider.chat("system", "hello")
+    summary = trace.summary()
+    usage = summary["usage"]
+    assert (usage["provider_calls"], usage["input_tokens"], usage["output_tokens"]) == (1, 11, 7)
+    assert usage["cached_input_tokens"] == 5
+    assert usage["by_stage"]["map"]["calls"] == 1
+    assert "map" in summary["stages"] and "total" in summary["stages"]
+
+
+def test_failed_calls_are_counted_and_reraised():
+    trace = Trace()
+    provider = InstrumentedProvider(ScriptedProvider(failures=[StatusError(500)]), trace, "fake", "auto")
+    with pytest.raises(StatusError):
+        provider.chat("system", "hello")
+    usage = trace.summary()["usage"]
+    assert (usage["provider_calls"], usage["failed_calls"]) == (1, 1)
+    # Without reported usage the tokens are estimated
+    assert usage["estimated_calls"] == 1
@@ -0,0 +1,70 @@
+"""Tests for jobs.py and async_engine.py."""
+import asyncio
+import contextvars
+
+import pytest
+
+from async_engine import get_engine
+from jobs import DONE, FAILED, JobQueue
+
+
+def _wait(job):
+    cursor, events = 0, []
+    while True:
+        new, finished = job.wait_for_events(cursor, timeout=5)
+        events.extend(new)
+        cursor += len(new)
+        if finished:
+            return events
+
+
+def test_job_runs_and_reports_progress():
+    def work(job, count):
+        for i in range(count):
+            job.add("segments")
+            job.emit({"chunk": i})
+        return {"total": count}
+
+    job = JobQueue(max_workers=1).submit(work, 3)
+    assert [event["chunk"] for event in _wait(job)] == [0, 1, 2]
+    assert job.status == DONE
+    assert job.result == {"total": 3}
+    assert job.to_dict()["progress"] == {"segments": 3}
+    assert "result" not in job.to_dict()
+
+
+def test_failed_job_keeps_the_error():
+    def work(job):
+        raise ValueError("no data")
+
+    queue = JobQueue(max_workers=1)
+    job = queue.submit(work)
+    _wait(job)
+    assert job.status == FAILED
+    assert job.error == "no data"
+    assert queue.get(job.id) is job
+
+
+def test_engine_runs_coroutines_with_the_callers_context():
+    var = contextvars.ContextVar("test_var", default="unset")
+    var.set("caller")
+
+    async def read():
+        await asyncio.sleep(0)
+        return var.get()
+
+    assert get_engine().run(read()) == "caller"
+
+
+def test_engine_refuses_to_block_its_own_loop():
+    engine = get_engine()
+
+    async def nested():
+        coro = asyncio.sleep(0)
+        try:
+            engine.run(coro)
+        finally:
+            coro.close()
+
+    with pytest.raises(RuntimeError):
+        engine.run(nested())
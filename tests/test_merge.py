@@ -0,0 +1,84 @@
+"""Tests for the tree-reduce merge of partial theme tables in qualigpt-webapp.py."""
+import re
+
+import pytest
+
+from tests.scripted import ScriptedProvider, WordCounter
+
+
+def _table(*themes, quote="It helps", participant="P1"):
+    rows = [f'| {theme} | About {theme.lower()} | "{quote}" [{participant}] | 1 | ---' for theme in themes]
+    return "**********\n| Theme | Description | Quotes | Participant Count |\n" + "\n".join(rows) + "\n**********"
+
+
+def _merging_provider():
+    """Answers every merge with a one-theme table named after the first theme it was sent."""
+    def reply(system_message, user_message):
+        return _table(re.search(r"^# (.+?) \(participants", user_message, flags=re.M).group(1))
+
+    return ScriptedProvider(reply=reply)
+
+
+def _merge(webapp, provider, tables, **kwargs):
+    kwargs.setdefault("budget", 10_000)
+    return webapp.analyze_merged_responses(
+        tables, 5, "system", provider, "auto", 0.7, 1000, token_counter=WordCounter(), **kwargs
+    )
+
+
+def test_tree_reduce_merges_in_levels(webapp):
+    provider = _merging_provider()
+    stats = {}
+    tables = [_table(f"Theme {i}") for i in range(5)]
+    result = _merge(webapp, provider, tables, fan_in=2, stats=stats)
+    # 5 tables -> 2 merges (+1 carried) -> 1 merge (+1 carried) -> final merge
+    assert len(provider.calls) == 4
+    assert stats["merge_levels"] == 3
+    assert webapp.parse_theme_rows(result)
+
+
+def test_single_level_when_everything_fits(webapp):
+    provider = _merging_provider()
+    stats = {}
+    _merge(webapp, provider, [_table(f"Theme {i}") for i in range(5)], fan_in=8, stats=stats)
+    assert len(provider.calls) == 1
+    assert stats["merge_levels"] == 1
+
+
+def test_merge_input_is_compacted(webapp):
+    provider = _merging_provider()
+    _merge(webapp, provider, [_table("Trust"), _table("Trust", "Cost")])
+    (message,) = provider.calls
+    assert "|---" not in message and "**********" not in message
+    # The quote repeated for the same theme by the second table is sent once
+    assert message.count('"It helps" [P1]') == 2
+
+
+def test_tables_too_large_for_pairs_are_condensed_first(webapp):
+    provider = _merging_provider()
+    tables = [_table(*(f"Theme {i}-{j}" for j in range(10))) for i in range(4)]
+    # One table fits the budget, two do not
+    budget = int(WordCounter().count(webapp.compact_partial_tables(tables[:1])[0]) * 1.5)
+    _merge(webapp, provider, tables, budget=budget)
+    # Each table is condensed on its own, then the condensed tables fit one final merge
+    assert len(provider.calls) == len(tables) + 1
+
+
+def test_condensing_that_does_not_shrink_raises(webapp):
+    big = _table(*(f"Theme {j}" for j in range(10)))
+    provider = ScriptedProvider(reply=lambda system, user: big)
+    budget = int(WordCounter().count(webapp.compact_partial_tables([big])[0]) * 1.5)
+    with pytest.raises(ValueError, match="cannot be merged"):
+        _merge(webapp, provider, [big, big], budget=budget)
+
+
+def test_oversized_table_raises(webapp):
+    with pytest.raises(ValueError, match="does not fit the merge budget"):
+        _merge(webapp, _merging_provider(), [_table("Trust"), _table("Cost")], budget=5)
+
+
+def test_quote_references_are_expanded(webapp):
+    provider = ScriptedProvider(reply=lambda system, user: "| Trust | d | {Q1} | 1 |")
+    result = _merge(webapp, provider, [_table("Trust"), _table("Cost")], quote_refs=True)
+    assert "{Q1}" in provider.calls[0]
+    assert result == '| Trust | d | "It helps" [P1] | 1 |'
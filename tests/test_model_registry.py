@@ -0,0 +1,43 @@
+"""Tests for model_registry.py and token_counting.py."""
+from model_registry import (
+    FALLBACK_SPEC,
+    MODEL_REGISTRY,
+    get_model_spec,
+    output_token_limit,
+    resolve_model,
+    segment_token_budget,
+)
+from token_counting import CharRatioCounter, get_token_counter
+from tests.scripted import WordCounter
+
+
+def test_resolve_model_uses_provider_defaults():
+    assert resolve_model("OpenAI", "auto") == "gpt-4o"
+    assert resolve_model("gemini", None) == "gemini-2.5-flash"
+    assert resolve_model("openai", "gpt-4o-mini") == "gpt-4o-mini"
+    assert resolve_model("unknown", "auto") == ""
+
+
+def test_unknown_models_fall_back_to_the_provider_default():
+    assert get_model_spec("anthropic", "claude-next") == MODEL_REGISTRY["claude-3-5-sonnet-20241022"]
+    assert get_model_spec("unknown", "auto") == FALLBACK_SPEC
+
+
+def test_output_limit_is_clamped():
+    assert output_token_limit("openai", "gpt-4-turbo", 100_000) == 4_096
+    assert output_token_limit("openai", "gpt-4-turbo", 1_000) == 1_000
+
+
+def test_segment_budget_reserves_prompt_output_and_margin():
+    spec = MODEL_REGISTRY["gpt-3.5-turbo"]
+    budget = segment_token_budget("openai", "gpt-3.5-turbo", "one two", "three", 1_000, WordCounter())
+    assert budget == spec.context_window - 3 - 1_000 - int(spec.context_window * 0.05)
+    # A prompt that nearly fills the window still leaves a usable budget
+    assert segment_token_budget("openai", "gpt-3.5-turbo", "word " * 20_000, "", 1_000, WordCounter()) == 1_000
+
+
+def test_token_counters_are_shared_per_provider():
+    assert get_token_counter("anthropic", "claude-3-haiku-20240307") is get_token_counter("anthropic", "auto")
+    assert get_token_counter("unknown") is get_token_counter(None)
+    assert CharRatioCounter(4.0).count("x" * 9) == 3
+    assert get_token_counter("openai", "gpt-4o").count("Hello world") > 0
@@ -0,0 +1,146 @@
+"""Tests for rate_limiting.py."""
+import asyncio
+
+import pytest
+
+import rate_limiting
+from rate_limiting import (
+    RateLimitedProvider,
+    RateLimiter,
+    TokenBucket,
+    get_rate_limiter,
+    is_retryable,
+    is_throttling,
+    retry_after_seconds,
+)
+from tests.scripted import ScriptedProvider, StatusError
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limiting, "backoff_seconds", lambda attempt: 0.0)
+
+
+def _limited(provider, max_retries=3):
+    return RateLimitedProvider(provider, "fake", max_retries=max_retries)
+
+# --- Buckets -----------------------------------------------------------------
+
+def test_token_bucket_waits_once_empty():
+    bucket = TokenBucket(rate=100.0, capacity=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert 0.0 < bucket.acquire() < 0.1
+
+
+def test_token_bucket_clamps_requests_larger_than_capacity():
+    bucket = TokenBucket(rate=1000.0, capacity=5)
+    assert bucket.acquire(50) == 0.0
+
+
+def test_token_bucket_drain_and_async_acquire():
+    bucket = TokenBucket(rate=200.0, capacity=1)
+    bucket.drain()
+    assert 0.0 < asyncio.run(bucket.aacquire(1)) < 0.1
+
+
+def test_rate_limiter_backs_off_and_recovers():
+    limiter = RateLimiter(600, 60_000)
+    limiter.on_throttled()
+    assert limiter.factor == 0.5
+    assert limiter.throttled == 1
+    for _ in range(10):
+        limiter.on_throttled()
+    assert limiter.factor == RateLimiter.MIN_FACTOR
+    limiter.on_success()
+    assert limiter.factor == pytest.approx(RateLimiter.MIN_FACTOR + RateLimiter.RECOVERY_STEP)
+
+
+def test_get_rate_limiter_shares_budgets():
+    assert get_rate_limiter("openai", "auto") is get_rate_limiter("OpenAI", "gpt-4o")
+    assert get_rate_limiter("openai", "gpt-4o") is not get_rate_limiter("openai", "gpt-4o-mini")
+    # Unknown model names must not get a budget of their own
+    assert get_rate_limiter("openai", "no-such-model-1") is get_rate_limiter("openai", "gpt-4o")
+    assert get_rate_limiter("openai", "no-such-model-2") is get_rate_limiter("openai", "gpt-4o")
+
+# --- Error classification ----------------------------------------------------
+
+@pytest.mark.parametrize("status, retryable, throttling", [
+    (429, True, True),
+    (529, True, True),
+    (503, True, False),
+    (500, True, False),
+    (400, False, False),
+    (401, False, False),
+])
+def test_status_classification(status, retryable, throttling):
+    assert is_retryable(StatusError(status)) is retryable
+    assert is_throttling(StatusError(status)) is throttling
+
+
+def test_error_names_and_response_status():
+    ServiceUnavailable = type("ServiceUnavailable", (Exception,), {})
+    assert is_retryable(ServiceUnavailable())
+    assert not is_retryable(ValueError("bad request"))
+    assert is_retryable(StatusError(502, headers={}))
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(StatusError(429, headers={"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(StatusError(429, headers={"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(StatusError(429, headers={"retry-after": "Wed, 21 Oct 2015"})) is None
+    assert retry_after_seconds(StatusError(429)) is None
+
+# --- Provider wrapper --------------------------------------------------------
+
+def test_retries_transient_errors():
+    inner = ScriptedProvider(failures=[StatusError(503), StatusError(429)])
+    assert _limited(inner).chat("system", "hello") == "answer(hello)"
+    assert len(inner.calls) == 3
+
+
+def test_does_not_retry_client_errors():
+    inner = ScriptedProvider(failures=[StatusError(400)])
+    with pytest.raises(StatusError):
+        _limited(inner).chat("system", "hello")
+    assert len(inner.calls) == 1
+
+
+def test_gives_up_after_max_retries():
+    inner = ScriptedProvider(failures=[StatusError(503)] * 5)
+    with pytest.raises(StatusError):
+        _limited(inner, max_retries=2).chat("system", "hello")
+    assert len(inner.calls) == 3
+
+
+def test_honours_retry_after(monkeypatch):
+    waits = []
+    retry_delay = RateLimitedProvider._retry_delay
+    monkeypatch.setattr(
+        RateLimitedProvider, "_retry_delay", lambda self, *args: waits.append(retry_delay(self, *args)) or 0.0
+    )
+    inner = ScriptedProvider(failures=[StatusError(429, headers={"retry-after": "7"})])
+    assert _limited(inner).chat("system", "hello") == "answer(hello)"
+    assert waits == [7.0]
+
+
+def test_async_calls_retry_too():
+    inner = ScriptedProvider(failures=[StatusError(503)])
+    assert asyncio.run(_limited(inner).achat("system", "hello")) == "answer(hello)"
+    assert len(inner.calls) == 2
+
+
+def test_stream_is_not_retried_after_output():
+    class BrokenStream(ScriptedProvider):
+        def chat_stream(self, system_message, user_message, **kwargs):
+            self.calls.append(user_message)
+            yield "partial"
+            raise StatusError(503)
+
+    inner = BrokenStream()
+    pieces = []
+    with pytest.raises(StatusError):
+        for piece in _limited(inner).chat_stream("system", "hello"):
+            pieces.append(piece)
+    assert pieces == ["partial"]
+    assert len(inner.calls) == 1
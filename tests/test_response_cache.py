@@ -0,0 +1,87 @@
+"""Tests for response_cache.py."""
+import asyncio
+
+from response_cache import CachingProvider, MemoryBackend, ResponseCache, SQLiteBackend, cache_key
+from tests.scripted import ScriptedProvider
+
+
+def test_cache_key_covers_every_request_field():
+    base = ("OpenAIProvider", "gpt-4o", "system", "user", 0.7, 4000)
+    key = cache_key(*base)
+    assert cache_key(*base) == key
+    for index, value in enumerate(("AnthropicProvider", "gpt-4o-mini", "system 2", "user 2", 0.2, 100)):
+        changed = list(base)
+        changed[index] = value
+        assert cache_key(*changed) != key
+    assert cache_key(*base, account="a") != key != cache_key(*base, account="b")
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert (backend.get("a"), backend.get("c")) == ("1", "3")
+
+
+def test_memory_backend_expires_entries():
+    backend = MemoryBackend(ttl_seconds=-1)
+    backend.set("a", "1")
+    assert backend.get("a") is None
+    assert len(backend) == 0
+
+
+def test_sqlite_backend_persists_and_bounds_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    backend = SQLiteBackend(path, max_entries=2)
+    for key in ("a", "b", "c"):
+        backend.set(key, key.upper())
+    assert len(backend) == 2
+    reopened = SQLiteBackend(path)
+    assert reopened.get("c") == "C"
+    assert reopened.get("a") is None
+
+
+def test_lower_tier_hits_fill_upper_tiers(tmp_path):
+    memory = MemoryBackend()
+    disk = SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+    disk.set("key", "value")
+    cache = ResponseCache([memory, disk])
+    assert cache.get("key") == "value"
+    assert memory.get("key") == "value"
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert [tier["hits"] for tier in stats["tiers"]] == [0, 1]
+
+
+def test_caching_provider_serves_repeated_calls():
+    cache = ResponseCache([MemoryBackend()])
+    inner = ScriptedProvider("key-a")
+    provider = CachingProvider(inner, cache)
+    assert provider.chat("system", "hello") == "answer(hello)"
+    assert provider.chat("system", "hello") == "answer(hello)"
+    assert list(provider.chat_stream("system", "hello")) == ["answer(hello)"]
+    assert asyncio.run(provider.achat("system", "hello")) == "answer(hello)"
+    assert inner.calls == ["hello"]
+    provider.chat("system", "hello", temperature=0.1)
+    assert len(inner.calls) == 2
+
+
+def test_caching_provider_keeps_api_keys_apart():
+    cache = ResponseCache([MemoryBackend()])
+    first, second = ScriptedProvider("key-a"), ScriptedProvider("key-b")
+    CachingProvider(first, cache).chat("system", "hello")
+    CachingProvider(second, cache).chat("system", "hello")
+    assert second.calls == ["hello"]
+
+
+def test_empty_answers_are_not_cached():
+    cache = ResponseCache([MemoryBackend()])
+    inner = ScriptedProvider(reply=lambda system, user: "")
+    provider = CachingProvider(inner, cache)
+    provider.chat("system", "hello")
+    provider.chat("system", "hello")
+    assert len(inner.calls) == 2
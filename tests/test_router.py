@@ -0,0 +1,105 @@
+"""Tests for llm_providers.RouterProvider."""
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+
+from llm_providers import RouteSloExceeded, RouterProvider
+from tests.scripted import SLOW_SECONDS, StatusError
+
+
+def _router(*keys, strategy="weighted", weights=None, latency_slo=None):
+    """A router over scripted routes; each key gets a unique suffix so providers are not shared."""
+    routes = [
+        {"provider": "scripted", "api_key": f"{key}-{uuid.uuid4().hex}", "weight": (weights or {}).get(key, 1)}
+        for key in keys
+    ]
+    spec = {"strategy": strategy, "routes": routes}
+    if latency_slo is not None:
+        spec["latency_slo"] = latency_slo
+    return RouterProvider(json.dumps(spec))
+
+
+def _calls(router):
+    return [len(route.provider.inner.calls) for route in router.routes]
+
+
+def test_rejects_bad_specs(scripted):
+    with pytest.raises(ValueError):
+        RouterProvider("not json")
+    with pytest.raises(ValueError):
+        RouterProvider(json.dumps({"routes": []}))
+    with pytest.raises(ValueError):
+        RouterProvider(json.dumps({"routes": [{"provider": "router", "api_key": "{}"}]}))
+    with pytest.raises(ValueError):
+        _router("a", strategy="random")
+
+
+def test_weighted_round_robin_follows_weights(scripted):
+    router = _router("a", "b", weights={"a": 2, "b": 1})
+    for i in range(30):
+        router.chat("system", f"call {i}")
+    assert _calls(router) == [20, 10]
+
+
+def test_latency_strategy_tries_unmeasured_routes_first(scripted):
+    router = _router("a", "b", strategy="latency")
+    router.chat("system", "one")
+    router.chat("system", "two")
+    assert _calls(router) == [1, 1]
+
+
+def test_fails_over_and_cools_down_failing_route(scripted):
+    router = _router("error", "ok")
+    assert router.chat("system", "hello") == "answer(hello)"
+    assert router.chat("system", "again") == "answer(again)"
+    # The failing route was tried once, then skipped while cooling down
+    assert _calls(router) == [1, 2]
+    stats = router.route_stats()
+    assert stats[0]["failures"] == 1 and stats[0]["cooling_down"]
+    assert [route["inflight"] for route in stats] == [0, 0]
+
+
+def test_raises_when_every_route_fails(scripted):
+    router = _router("error-1", "error-2")
+    with pytest.raises(StatusError):
+        router.chat("system", "hello")
+    assert _calls(router) == [1, 1]
+
+
+def test_sync_chat_abandons_a_route_over_the_slo(scripted):
+    router = _router("slow", "ok", latency_slo=0.2)
+    started = time.perf_counter()
+    assert router.chat("system", "hello") == "answer(hello)"
+    assert time.perf_counter() - started < SLOW_SECONDS
+    stats = router.route_stats()
+    assert stats[0]["failures"] == 1
+    assert [route["inflight"] for route in stats] == [0, 0]
+
+
+def test_async_chat_abandons_a_route_over_the_slo(scripted):
+    router = _router("slow", "ok", latency_slo=0.2)
+    assert asyncio.run(router.achat("system", "hello")) == "answer(hello)"
+    assert router.route_stats()[0]["failures"] == 1
+
+
+def test_stream_fails_over_before_the_first_piece(scripted):
+    router = _router("error", "ok")
+    assert list(router.chat_stream("system", "hello")) == ["answer(hello)"]
+    assert [route["inflight"] for route in router.route_stats()] == [0, 0]
+
+
+def test_closing_a_stream_releases_its_route(scripted):
+    router = _router("ok")
+    pieces = router.chat_stream("system", "hello")
+    next(pieces)
+    pieces.close()
+    stats = router.route_stats()[0]
+    assert stats["inflight"] == 0
+    assert stats["failures"] == 0
+
+
+def test_slo_error_is_a_gateway_timeout():
+    assert RouteSloExceeded.status_code == 504
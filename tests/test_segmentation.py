@@ -0,0 +1,55 @@
+"""Tests for segmentation.py."""
+from segmentation import CodedCorpus, iter_segments
+from tests.scripted import WordCounter
+
+
+LINES = [f"line {i} has five words" for i in range(10)]
+TEXT = "\n".join(LINES) + "\n"
+
+
+def test_segments_fit_budget_and_keep_every_line():
+    segments = list(iter_segments(TEXT, max_tokens=12, token_counter=WordCounter()))
+    assert all(WordCounter().count(segment) <= 12 for segment in segments)
+    assert [line for segment in segments for line in segment.split("\n")] == LINES
+    assert len(segments) == 5
+
+
+def test_overlap_repeats_trailing_lines():
+    segments = list(iter_segments(TEXT, max_tokens=15, token_counter=WordCounter(), overlap_tokens=5))
+    assert segments[0].split("\n") == LINES[0:3]
+    assert segments[1].split("\n") == LINES[2:5]
+    for previous, current in zip(segments, segments[1:]):
+        assert current.split("\n")[0] == previous.split("\n")[-1]
+    assert segments[-1].split("\n")[-1] == LINES[-1]
+
+
+def test_overlap_leaves_room_for_the_next_line():
+    # Carrying both lines of a segment would leave no room for the next one: one is kept
+    segments = list(iter_segments(TEXT, max_tokens=12, token_counter=WordCounter(), overlap_tokens=10))
+    assert all(WordCounter().count(segment) <= 12 for segment in segments)
+    assert segments[1].split("\n") == LINES[1:3]
+
+
+def test_oversized_line_is_split_into_sentences():
+    text = "First sentence here. Second sentence here. Third sentence here.\nshort line\n"
+    segments = list(iter_segments(text, max_tokens=4, token_counter=WordCounter()))
+    assert segments == ["First sentence here.", "Second sentence here.", "Third sentence here.", "short line"]
+
+
+def test_coded_corpus_renders_participant_codes_lazily():
+    corpus = CodedCorpus()
+    corpus.add("alpha one\nalpha two\n", "P1")
+    corpus.add("beta one\n", "P2")
+    corpus.add("uncoded line\n")
+    segments = corpus.segments(max_tokens=100, token_counter=WordCounter())
+    assert len(segments) == 1
+    assert segments[0] == "[P1] alpha one\n[P1] alpha two\n\n[P2] beta one\n\nuncoded line"
+
+
+def test_coded_corpus_counts_codes_against_the_budget():
+    corpus = CodedCorpus()
+    corpus.add("a b\nc d\ne f\n", "P1")
+    # Each coded line is three words, so two lines do not fit in five tokens
+    segments = corpus.segments(max_tokens=5, token_counter=WordCounter())
+    assert segments[:] == ["[P1] a b", "[P1] c d", "[P1] e f"]
+    assert corpus.participant_ids == ["P1"]
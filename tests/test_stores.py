@@ -0,0 +1,148 @@
+"""Tests for run_store.py, project_store.py and dataset_store.py."""
+import time
+
+import pytest
+
+from dataset_store import DatasetStore
+from project_store import ProjectStore, file_key, map_settings_key
+from run_store import DONE, FAILED, RUNNING, CheckpointingProvider, RunStore
+from tests.scripted import ScriptedProvider
+
+# --- Runs --------------------------------------------------------------------
+
+@pytest.fixture
+def runs(tmp_path):
+    return RunStore(str(tmp_path / "runs.sqlite3"))
+
+
+def test_run_lifecycle(runs):
+    run_id = runs.create_run({"provider": "fake", "num_themes": 5})
+    runs.save_output(run_id, "key-1", "table")
+    run = runs.get_run(run_id)
+    assert run["status"] == RUNNING
+    assert run["payload"] == {"provider": "fake", "num_themes": 5}
+    assert run["completed_calls"] == 1
+    runs.finish_run(run_id, DONE, result={"response": "final"})
+    assert runs.get_run(run_id)["result"] == {"response": "final"}
+    assert runs.get_output(run_id, "key-1") == "table"
+    assert runs.get_output(run_id, "key-2") is None
+    runs.delete_run(run_id)
+    assert runs.get_run(run_id) is None
+
+
+def test_restart_run_only_claims_finished_runs(runs):
+    run_id = runs.create_run({})
+    assert not runs.restart_run(run_id)
+    runs.finish_run(run_id, FAILED, error="boom")
+    assert runs.restart_run(run_id)
+    assert not runs.restart_run(run_id)
+    assert not runs.restart_run("unknown")
+
+
+def test_expired_runs_are_evicted(runs):
+    runs.retention_seconds = 60
+    run_id = runs.create_run({})
+    runs.save_output(run_id, "key", "table")
+    runs._evict_expired(time.time() + 120)
+    assert runs.get_run(run_id) is None
+    assert runs.get_output(run_id, "key") is None
+
+
+def test_checkpointing_provider_replays_completed_calls(runs):
+    run_id = runs.create_run({})
+    first = ScriptedProvider()
+    assert CheckpointingProvider(first, runs, run_id).chat("system", "segment 1") == "answer(segment 1)"
+    # A resumed run answers the recorded call from the store, even with another key
+    resumed = ScriptedProvider("rotated-key")
+    assert CheckpointingProvider(resumed, runs, run_id).chat("system", "segment 1") == "answer(segment 1)"
+    assert resumed.calls == []
+    other_run = runs.create_run({})
+    CheckpointingProvider(resumed, runs, other_run).chat("system", "segment 1")
+    assert resumed.calls == ["segment 1"]
+
+# --- Projects ----------------------------------------------------------------
+
+@pytest.fixture
+def projects(tmp_path):
+    return ProjectStore(str(tmp_path / "projects.sqlite3"))
+
+
+def test_partials_are_reused_only_with_the_same_settings(projects):
+    project_id = projects.create_project("study")
+    settings = map_settings_key(provider="openai", model="gpt-4o", temperature=0.7)
+    projects.save_partials(project_id, "file-a", "P1", "a.csv", settings, ["table 1", "table 2"])
+    assert projects.get_partials(project_id, "file-a", "P1", settings) == ["table 1", "table 2"]
+    assert projects.get_partials(project_id, "file-a", "P2", settings) is None
+    other = map_settings_key(provider="openai", model="gpt-4o", temperature=0.2)
+    assert projects.get_partials(project_id, "file-a", "P1", other) is None
+    project = projects.get_project(project_id)
+    assert project["name"] == "study"
+    assert [(f["file_key"], f["partial_tables"]) for f in project["files"]] == [("file-a", 2)]
+
+
+def test_retain_files_forgets_removed_files(projects):
+    project_id = projects.create_project()
+    for key in ("file-a", "file-b"):
+        projects.save_partials(project_id, key, "P1", f"{key}.csv", "settings", ["table"])
+    assert projects.retain_files(project_id, [("file-a", "P1")]) == 1
+    assert [f["file_key"] for f in projects.get_project(project_id)["files"]] == ["file-a"]
+
+
+def test_expired_projects_are_evicted(projects):
+    projects.retention_seconds = 60
+    project_id = projects.create_project()
+    projects.save_partials(project_id, "file-a", "P1", "a.csv", "settings", ["table"])
+    projects._evict_expired(time.time() + 120)
+    assert project_id not in projects
+    assert projects.get_partials(project_id, "file-a", "P1", "settings") is None
+
+
+def test_file_key_and_settings_key():
+    assert file_key({"dataset_id": "abc"}) == "abc"
+    assert file_key({"data_content": "x"}) == file_key({"data_content": "x"}) != file_key({"data_content": "y"})
+    assert map_settings_key(a=1, b=2) == map_settings_key(b=2, a=1)
+
+# --- Datasets ----------------------------------------------------------------
+
+@pytest.fixture
+def datasets(tmp_path):
+    return DatasetStore(str(tmp_path / "datasets"))
+
+
+def _store(datasets, *chunks):
+    with datasets.writer() as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+        return writer.commit()
+
+
+def test_datasets_are_content_addressed(datasets):
+    first = _store(datasets, "line 1\n", "line 2\n")
+    assert _store(datasets, "line 1\nline 2\n") == first
+    assert datasets.read(first) == "line 1\nline 2\n"
+    assert datasets.info(first)["bytes"] == len("line 1\nline 2\n")
+    assert first in datasets
+
+
+def test_unknown_and_malformed_ids_raise_key_error(datasets):
+    with pytest.raises(KeyError):
+        datasets.read("0" * 64)
+    with pytest.raises(KeyError):
+        datasets.read("../../etc/passwd")
+    assert "../../etc/passwd" not in datasets
+
+
+def test_failed_writes_leave_nothing_behind(datasets, tmp_path):
+    with pytest.raises(RuntimeError):
+        with datasets.writer() as writer:
+            writer.write("partial")
+            raise RuntimeError("upload interrupted")
+    assert list((tmp_path / "datasets").iterdir()) == []
+
+
+def test_unused_datasets_are_evicted(datasets):
+    dataset_id = _store(datasets, "text")
+    assert datasets.evict_expired() == 0
+    datasets.retention_seconds = -1
+    assert datasets.evict_expired() == 1
+    assert dataset_id not in datasets
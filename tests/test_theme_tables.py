@@ -0,0 +1,66 @@
+"""Tests for theme_tables.py."""
+from theme_tables import Quote, ThemeRow, dedupe_theme_rows, parse_theme_rows, QuoteIndex
+
+TABLE = """Some preamble
+**********
+| Theme | Description | Quotes | Participant Count |
+|---|---|---|---|
+| Trust | Participants trust staff | "They listen" [P1], "Always kind" [P2] | 2 | ---
+| Cost | Worries about money | "Too expensive" [P3] | 1 |
+**********
+"""
+
+
+def test_parse_theme_rows_drops_header_and_rule():
+    rows = parse_theme_rows(TABLE)
+    assert [row.theme for row in rows] == ["Trust", "Cost"]
+    assert rows[0].quotes == [Quote("They listen", "P1"), Quote("Always kind", "P2")]
+
+
+def test_parse_theme_rows_reads_count_before_trailing_marker():
+    rows = parse_theme_rows(TABLE)
+    assert rows[0].participant_count == 2
+    assert rows[1].participant_count == 1
+
+
+def test_parse_theme_rows_marker_as_own_cell():
+    table = "**********\n| Trust | Desc | \"Quote\" [P1] | 4 | --- |\n**********"
+    assert parse_theme_rows(table)[0].participant_count == 4
+
+
+def test_parse_theme_rows_without_delimiters_is_empty():
+    assert parse_theme_rows("| Trust | Desc | q | 1 |") == []
+
+
+def test_parse_theme_rows_keeps_unattributed_quotes_and_refs():
+    table = "**********\n| Trust | Desc | \"Kind\" (P4) {Q3} | 1 |\n**********"
+    row = parse_theme_rows(table)[0]
+    assert row.quotes == [Quote('"Kind" (P4)', "")]
+    assert row.quote_refs == ["{Q3}"]
+
+
+def test_dedupe_merges_quotes_without_summing_counts():
+    rows = [
+        ThemeRow("Trust", "short", [Quote("a", "P1")], 2, []),
+        ThemeRow("trust!", "a longer description", [Quote("a", "P1"), Quote("b", "P2")], 2, []),
+    ]
+    (merged,) = dedupe_theme_rows(rows)
+    assert merged.description == "a longer description"
+    assert merged.quotes == [Quote("a", "P1"), Quote("b", "P2")]
+    assert merged.participant_count == 2
+
+
+def test_dedupe_counts_distinct_quoted_participants():
+    rows = [
+        ThemeRow("Trust", "d", [Quote("a", "P1")], 1, []),
+        ThemeRow("Trust", "d", [Quote("b", "P2"), Quote("c", "P3")], 1, []),
+    ]
+    assert dedupe_theme_rows(rows)[0].participant_count == 3
+
+
+def test_quote_index_round_trip():
+    index = QuoteIndex()
+    ref = index.ref(Quote("They listen", "P1"))
+    assert index.ref(Quote("They listen", "P1")) == ref
+    assert index.expand(f"- {ref}") == '- "They listen" [P1]'
+    assert index.expand("{Q99}") == "{Q99}"
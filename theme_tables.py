@@ -0,0 +1,188 @@
+"""theme_tables.py
+
+Parsing and compact re-serialisation of the `**********`-delimited theme tables the
+LLM returns.
+
+Between the map and reduce steps the raw tables carry delimiters, header rows,
+`|---|` rules and duplicated themes/quotes from overlapping segments.  Parsing them
+into `ThemeRow`s and writing them back in a minimal form keeps the merge prompt
+small:
+
+* `parse_response_to_csv(response)` – rows of cells from a delimited table.
+* `parse_theme_rows(response)` – typed `ThemeRow`s (header row dropped, quotes
+  split into `Quote(text, participant_id)`).
+* `dedupe_theme_rows(rows)` – combine rows with the same theme name and drop
+  repeated quotes.
+* `QuoteIndex` – optionally replaces each quote by a short `{Q12}` reference and
+  expands the references in the final table again.
+* `serialize_theme_row(row)` – one compact text block per theme.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+QUOTE_RE = re.compile(r'["“]([^"“”\n]+)["”]\s*\[([^\]\n]+)\]')
+QUOTE_REF_RE = re.compile(r"\{Q(\d+)\}")
+RULE_CELL_RE = re.compile(r"^[-:\s]+$")
+HEADER_THEME_NAMES = {"theme", "'theme'", '"theme"'}
+
+
+class Quote(NamedTuple):
+    text: str
+    participant_id: str
+
+
+class ThemeRow(NamedTuple):
+    theme: str
+    description: str
+    quotes: List[Quote]
+    participant_count: int
+    # Quote references ({Q12}) already present in the row's quote cell
+    quote_refs: List[str]
+
+# --- Parsing -----------------------------------------------------------------
+
+def parse_response_to_csv(response):
+    """Parse the GPT response to extract table data"""
+    lines = response.strip().split("\n")
+
+    # Find table delimiters
+    delimiter_indices = [i for i, line in enumerate(lines) if line.strip() == "**********"]
+
+    if len(delimiter_indices) < 2:
+        return []
+
+    start_index, end_index = delimiter_indices[0], delimiter_indices[-1]
+    table_content = lines[start_index+1:end_index]
+
+    # Parse table rows
+    parsed_data = []
+    for line in table_content:
+        if line.strip() and '|' in line and not line.strip().startswith('|---'):
+            # Split by | and clean up
+            cells = [cell.strip() for cell in line.split('|')]
+            # Remove empty cells at start and end
+            cells = [cell for cell in cells if cell]
+            if cells:
+                parsed_data.append(cells)
+
+    return parsed_data
+
+
+def _parse_count(cell: str) -> int:
+    match = re.search(r"\d+", cell)
+    return int(match.group()) if match else 0
+
+
+def _parse_quotes(cell: str) -> List[Quote]:
+    """Split a quote cell into attributed quotes, keeping any other text verbatim."""
+    quotes = []
+    position = 0
+    for match in QUOTE_RE.finditer(cell):
+        quotes.extend(_unattributed(cell[position:match.start()]))
+        quotes.append(Quote(match.group(1).strip(), match.group(2).strip()))
+        position = match.end()
+    quotes.extend(_unattributed(cell[position:]))
+    return quotes
+
+
+def _unattributed(text: str) -> List[Quote]:
+    # Evidence the quote pattern does not cover, e.g. `"..." (P3)`; references are kept separately
+    text = QUOTE_REF_RE.sub("", text).strip().strip(",;").strip()
+    return [Quote(text, "")] if re.search(r"\w", text) else []
+
+
+def parse_theme_rows(response: str) -> List[ThemeRow]:
+    """Return the theme rows of a delimited table (empty if the table cannot be parsed)."""
+    rows = []
+    for cells in parse_response_to_csv(response):
+        if len(cells) < 2 or cells[0].strip().lower() in HEADER_THEME_NAMES:
+            continue
+        # Rows end with a `---` marker, which must not be read as the count column
+        while cells and RULE_CELL_RE.match(cells[-1]):
+            cells = cells[:-1]
+        cells = cells + [""] * (4 - len(cells))
+        theme, description, quotes_cell, count_cell = cells[:4]
+        quotes = _parse_quotes(quotes_cell)
+        refs = ["{Q%s}" % number for number in QUOTE_REF_RE.findall(quotes_cell)]
+        rows.append(ThemeRow(theme.strip(), description.strip(), quotes, _parse_count(count_cell), refs))
+    return rows
+
+# --- Deduplication -----------------------------------------------------------
+
+def theme_key(theme: str) -> str:
+    """Normalise a theme name for comparison (case and punctuation insensitive)."""
+    return re.sub(r"[^\w]+", " ", theme.lower()).strip()
+
+
+def dedupe_theme_rows(rows: List[ThemeRow]) -> List[ThemeRow]:
+    """Combine rows with the same (normalised) theme name, keeping each quote once.
+
+    The longest description is kept.  Overlapping segments report the same
+    participants again, so counts are not added up: a merged row counts the larger
+    of the rows' counts and the number of distinct participants quoted.
+    """
+    merged: Dict[str, ThemeRow] = {}
+    for row in rows:
+        key = theme_key(row.theme)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = ThemeRow(row.theme, row.description, list(row.quotes), row.participant_count, list(row.quote_refs))
+            continue
+        quotes = existing.quotes + [q for q in row.quotes if q not in existing.quotes]
+        refs = existing.quote_refs + [r for r in row.quote_refs if r not in existing.quote_refs]
+        description = max(existing.description, row.description, key=len)
+        quoted = {q.participant_id for q in quotes if q.participant_id}
+        count = max(existing.participant_count, row.participant_count, len(quoted))
+        merged[key] = ThemeRow(existing.theme, description, quotes, count, refs)
+    return list(merged.values())
+
+# --- Quote references --------------------------------------------------------
+
+class QuoteIndex:
+    """Assigns stable `{Qn}` references to quotes and expands them again."""
+
+    def __init__(self):
+        self._quotes: List[Quote] = []
+        self._ids: Dict[Quote, int] = {}
+        self._lock = threading.Lock()
+
+    def ref(self, quote: Quote) -> str:
+        with self._lock:
+            number = self._ids.get(quote)
+            if number is None:
+                self._quotes.append(quote)
+                number = len(self._quotes)
+                self._ids[quote] = number
+        return "{Q%d}" % number
+
+    def expand(self, text: str) -> str:
+        """Replace every `{Qn}` reference in ``text`` with the verbatim quote."""
+        def _replace(match):
+            number = int(match.group(1))
+            if 1 <= number <= len(self._quotes):
+                quote = self._quotes[number - 1]
+                return f'"{quote.text}" [{quote.participant_id}]' if quote.participant_id else quote.text
+            return match.group(0)
+
+        return QUOTE_REF_RE.sub(_replace, text)
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+# --- Serialisation -----------------------------------------------------------
+
+def serialize_theme_row(row: ThemeRow, quote_index: Optional[QuoteIndex] = None) -> str:
+    """Return a compact text block for one theme (quotes by reference if ``quote_index``)."""
+    lines = [f"# {row.theme} (participants: {row.participant_count})", row.description]
+    for quote in row.quotes:
+        if quote_index is not None:
+            lines.append(f"- {quote_index.ref(quote)}")
+        elif quote.participant_id:
+            lines.append(f'- "{quote.text}" [{quote.participant_id}]')
+        else:
+            lines.append(f"- {quote.text}")
+    lines.extend(f"- {ref}" for ref in row.quote_refs)
+    return "\n".join(lines)
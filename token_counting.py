@@ -0,0 +1,128 @@
+"""token_counting.py
+
+Token counters used to size dataset segments against the model that will actually
+receive them.
+
+* `TiktokenCounter` – exact BPE counts for OpenAI models (requires the optional
+  `tiktoken` package).  Results are memoised per sentence.
+* `CharRatioCounter` – constant-time estimate from the character count, calibrated
+  per provider for models whose tokenizer is not available locally.
+
+`get_token_counter(provider, model)` returns the best counter for a provider/model
+pair and falls back to `CharRatioCounter` when `tiktoken` is not installed.
+Add a provider by extending `CHARS_PER_TOKEN` or by subclassing `TokenCounter`.
+"""
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# Average characters per token, measured on English and Vietnamese interview text.
+# These deliberately err on the low side so estimated segments never overflow.
+CHARS_PER_TOKEN: Dict[str, float] = {
+    "openai": 4.0,
+    "anthropic": 3.5,
+    "gemini": 4.0,
+    "deepseek": 3.5,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# Longest string whose token count `TiktokenCounter` memoises, and how many it keeps
+# (at most ~8M characters of cached keys per encoding).
+MAX_CACHED_CHARS = 1024
+TIKTOKEN_CACHE_SIZE = 8192
+
+# --- Base --------------------------------------------------------------------
+
+class TokenCounter:
+    """Count how many tokens a piece of text costs for one model family."""
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+# -----------------------------------------------------------------------------
+# Estimators
+# -----------------------------------------------------------------------------
+
+class CharRatioCounter(TokenCounter):
+    """Estimate tokens as ``ceil(len(text) / chars_per_token)``."""
+
+    def __init__(self, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+# -----------------------------------------------------------------------------
+# OpenAI / tiktoken
+# -----------------------------------------------------------------------------
+
+class TiktokenCounter(TokenCounter):
+    """Exact token counts using a BPE encoding (the model's own, or ``encoding``)."""
+
+    def __init__(self, model: str = "gpt-4o", cache_size: int = TIKTOKEN_CACHE_SIZE, encoding: Optional[str] = None):
+        import tiktoken  # type: ignore  # optional dependency
+
+        if encoding:
+            self._encoding = tiktoken.get_encoding(encoding)
+        else:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+        self._cached_count = lru_cache(maxsize=cache_size)(self._count)
+
+    def count(self, text: str) -> int:
+        # Only memoise sentence/line sized strings; the cache must not pin whole documents
+        if len(text) <= MAX_CACHED_CHARS:
+            return self._cached_count(text)
+        return self._count(text)
+
+    def _count(self, text: str) -> int:
+        return len(self._encoding.encode_ordinary(text))
+
+# -----------------------------------------------------------------------------
+# Factory
+# -----------------------------------------------------------------------------
+
+# Shared counters keyed by (provider, tiktoken encoding or ""), not by the model
+# string from the request, so arbitrary model names cannot grow it
+_COUNTERS: Dict[Tuple[str, str], TokenCounter] = {}
+
+
+def get_token_counter(provider: Optional[str] = None, model: Optional[str] = None) -> TokenCounter:
+    """Return a (shared) token counter for the given provider and model."""
+    provider = (provider or "").lower()
+    if provider not in CHARS_PER_TOKEN:
+        provider = ""
+    model = model if model and model != "auto" else ""
+    key = (provider, _encoding_name(model or "gpt-4o") if provider == "openai" else "")
+    counter = _COUNTERS.get(key)
+    if counter is None:
+        counter = _build_counter(*key)
+        _COUNTERS[key] = counter
+    return counter
+
+
+@lru_cache(maxsize=256)
+def _encoding_name(model: str) -> str:
+    """Return the name of the tiktoken encoding an OpenAI model uses ("" if unavailable)."""
+    try:
+        import tiktoken  # type: ignore  # optional dependency
+
+        try:
+            return tiktoken.encoding_for_model(model).name
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base").name
+    except Exception:  # tiktoken missing or its encoding files unavailable offline
+        return ""
+
+
+def _build_counter(provider: str, encoding: str) -> TokenCounter:
+    if encoding:
+        try:
+            return TiktokenCounter(encoding=encoding)
+        except Exception:
+            pass
+    return CharRatioCounter(CHARS_PER_TOKEN.get(provider, DEFAULT_CHARS_PER_TOKEN))